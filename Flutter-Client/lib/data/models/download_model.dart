@@ -143,6 +143,8 @@ class DownloadModel {
         return DownloadStatus.pending;
       case 'downloading':
       case 'preparing':
+      case 'downloaded':
+      case 'processing':
         return DownloadStatus.downloading;
       case 'finished':
       case 'completed':
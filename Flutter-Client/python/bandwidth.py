@@ -0,0 +1,84 @@
+# Global bandwidth budget for the embedded GrabTube server
+# The budget, optionally by time of day, is split over active downloads and handed to each
+# worker as its yt-dlp rate limit
+
+import time
+from typing import Optional, List, Dict, Any, Tuple
+
+# Shares never drop below this, so a download that looks idle can still speed up again
+MIN_SHARE = 16 * 1024
+
+def _minutes(value: str) -> int:
+    hours, minutes = value.split(':')
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f'Invalid time of day: {value}')
+    return hours * 60 + minutes
+
+class BandwidthLimiter:
+    """Total download rate budget in bytes per second, 0 meaning unlimited"""
+    
+    def __init__(self, limit: float = 0, schedule: Optional[List[Dict[str, Any]]] = None):
+        self.limit = 0.0
+        self.schedule: List[Dict[str, Any]] = []
+        self._windows: List[Tuple[int, int, float]] = []
+        self.configure(limit, schedule)
+    
+    def configure(self, limit: Optional[float] = None, schedule: Optional[List[Dict[str, Any]]] = None):
+        """
+        Change the budget; schedule entries {'start': 'HH:MM', 'end': 'HH:MM', 'limit': bytes}
+        override the limit during their window, which may wrap past midnight. Nothing changes
+        unless both are valid
+        """
+        if limit is not None:
+            limit = float(limit)
+            if limit < 0:
+                raise ValueError(f'Invalid bandwidth limit: {limit}')
+        windows = []
+        for entry in schedule or ():
+            window_limit = float(entry['limit'])
+            if window_limit < 0:
+                raise ValueError(f'Invalid bandwidth limit: {window_limit}')
+            windows.append((_minutes(entry['start']), _minutes(entry['end']), window_limit))
+        
+        if limit is not None:
+            self.limit = limit
+        if schedule is not None:
+            self.schedule = [dict(entry) for entry in schedule]
+            self._windows = windows
+    
+    def current_limit(self, now: Optional[float] = None) -> float:
+        """Budget in effect at the given time, the first matching schedule window winning"""
+        local = time.localtime(now)
+        minute = local.tm_hour * 60 + local.tm_min
+        for start, end, limit in self._windows:
+            inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+            if inside:
+                return limit
+        return self.limit
+    
+    def shares(self, downloads: Dict[str, Tuple[float, float]],
+               now: Optional[float] = None) -> Dict[str, float]:
+        """
+        Split the current budget over downloads given as {id: (speed, current share)}.
+        Downloads running well below their share are held to what they use, the rest of
+        the budget is shared equally by the others (max-min fairness); 0 means unlimited
+        """
+        limit = self.current_limit(now)
+        if not limit or not downloads:
+            return {download_id: 0.0 for download_id in downloads}
+        
+        demands = []
+        for download_id, (speed, share) in downloads.items():
+            # A download close to its share, or without one yet, could use more
+            capped = not share or not speed or speed >= share * 0.9
+            demands.append((float('inf') if capped else max(speed * 1.25, MIN_SHARE), download_id))
+        demands.sort()
+        
+        shares = {}
+        remaining = limit
+        for i, (demand, download_id) in enumerate(demands):
+            share = max(min(demand, remaining / (len(demands) - i)), MIN_SHARE)
+            shares[download_id] = share
+            remaining = max(remaining - share, 0.0)
+        return shares
\ No newline at end of file
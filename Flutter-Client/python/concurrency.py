@@ -0,0 +1,100 @@
+# Adaptive download concurrency for the embedded GrabTube server
+# An AIMD controller sizes the number of active download slots from the aggregate throughput
+# the queue measures
+
+import time
+from collections import deque
+from typing import Optional, List, Dict, Any
+
+from yt_dlp.utils import format_bytes
+
+class ConcurrencyController:
+    """
+    Additive increase, multiplicative decrease of the slot count between minimum and maximum:
+    one slot more while downloads are waiting and the last added slot raised throughput by
+    gain, back to the previous count when it did not, and down by backoff when throughput
+    collapses with every slot busy or downloads keep failing. After a step down it holds
+    for hold decisions before probing upwards again
+    """
+    
+    def __init__(self, minimum: int = 1, maximum: int = 8, initial: int = 3, gain: float = 0.05,
+                 backoff: float = 0.5, max_failures: int = 2, hold: int = 3, history: int = 50):
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum, self.minimum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.gain = gain
+        self.backoff = backoff
+        self.max_failures = max_failures
+        self.hold = hold
+        self.decisions: deque = deque(maxlen=history)
+        self._samples: List[float] = []
+        self._failures = 0
+        # Throughput before the last increase, and the best seen at the current limit
+        self._before: Optional[float] = None
+        self._peak = 0.0
+        self._holding = 0
+    
+    def sample(self, throughput: float):
+        """Record the aggregate throughput, in bytes per second, seen by one progress poll"""
+        self._samples.append(throughput)
+    
+    def failed(self):
+        """Record a download that ended with an error"""
+        self._failures += 1
+    
+    def decide(self, active: int, waiting: int, now: Optional[float] = None) -> Dict[str, Any]:
+        """Pick the slot count for the next interval from the samples since the last decision"""
+        throughput = sum(self._samples) / len(self._samples) if self._samples else 0.0
+        busy = active >= self.limit
+        limit = self.limit
+        
+        if self._failures >= self.max_failures and limit > self.minimum:
+            limit = max(self.minimum, int(limit * self.backoff))
+            reason = f'{self._failures} downloads failed'
+        elif self._before is not None and throughput < self._before * (1 + self.gain):
+            limit -= 1
+            reason = (f'slot {self.limit} did not raise throughput '
+                      f'({format_bytes(throughput)}/s vs {format_bytes(self._before)}/s)')
+        elif busy and self._peak and throughput < self._peak * self.backoff and limit > self.minimum:
+            limit = max(self.minimum, int(limit * self.backoff))
+            reason = (f'throughput collapsed to {format_bytes(throughput)}/s '
+                      f'from {format_bytes(self._peak)}/s')
+        elif busy and waiting and limit < self.maximum and self._holding:
+            reason = f'holding after stepping down ({self._holding} decisions left)'
+        elif busy and waiting and limit < self.maximum:
+            limit += 1
+            reason = f'{waiting} downloads waiting with all slots busy'
+        elif not busy:
+            reason = f'only {active} of {self.limit} slots in use'
+        elif not waiting:
+            reason = 'no downloads waiting'
+        else:
+            reason = 'at maximum'
+        
+        self._before = throughput if limit > self.limit else None
+        self._holding = self.hold if limit < self.limit else max(self._holding - 1, 0)
+        self._peak = max(self._peak, throughput) if limit == self.limit else 0.0
+        decision = {
+            'time': time.time() if now is None else now,
+            'slots_before': self.limit,
+            'slots': limit,
+            'throughput': round(throughput, 1),
+            'active': active,
+            'waiting': waiting,
+            'failures': self._failures,
+            'reason': reason
+        }
+        self.decisions.append(decision)
+        self.limit = limit
+        self._samples.clear()
+        self._failures = 0
+        return decision
+    
+    def stats(self) -> Dict[str, Any]:
+        """Current limit, bounds and recent decisions, newest last"""
+        return {
+            'limit': self.limit,
+            'min': self.minimum,
+            'max': self.maximum,
+            'decisions': list(self.decisions)
+        }
\ No newline at end of file
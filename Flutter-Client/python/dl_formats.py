@@ -114,24 +114,77 @@ QUALITIES = {
     }
 }
 
+# Codec prefixes each format's container takes as is, so merging or extracting into it is a
+# stream copy; None takes any codec, an empty tuple none (always converted)
+CONTAINER_CODECS = {
+    'mp4': {'video': ('avc1', 'h264', 'hev1', 'hvc1', 'av01'), 'audio': ('mp4a', 'aac', 'mp3', 'ac-3', 'ec-3')},
+    'mov': {'video': ('avc1', 'h264', 'hev1', 'hvc1'), 'audio': ('mp4a', 'aac', 'mp3', 'ac-3', 'alac')},
+    'webm': {'video': ('vp8', 'vp9', 'vp09', 'av01'), 'audio': ('opus', 'vorbis')},
+    'mkv': {'video': None, 'audio': None},
+    'avi': {'video': ('h264', 'avc1', 'mpeg4', 'mp4v'), 'audio': ('mp3', 'ac-3', 'pcm')},
+    'mp3': {'audio': ('mp3',)},
+    'm4a': {'audio': ('mp4a', 'aac')},
+    'flac': {'audio': ('flac',)},
+    'opus': {'audio': ('opus',)},
+    'vorbis': {'audio': ('vorbis',)},
+    'wav': {'audio': ()},
+}
+
+def _codec_filter(field: str, codecs) -> str:
+    """Format filter matching streams whose codec starts with one of codecs"""
+    return f"[{field}~='^({'|'.join(codecs)})']"
+
+def _height_filter(quality: Optional[str]) -> str:
+    if not quality or quality == 'best' or quality not in QUALITIES['video']:
+        return ''
+    return f"[height<={2160 if quality == '4k' else quality}]"
+
+def codec_compatible(format_type: Optional[str], vcodec: Optional[str], acodec: Optional[str]) -> bool:
+    """
+    Whether streams with these codecs go into the format's container without re-encoding;
+    'none' or missing codecs are not checked
+    """
+    codecs = CONTAINER_CODECS.get(format_type)
+    if codecs is None:
+        return True
+    for kind, codec in (('video', vcodec), ('audio', acodec)):
+        allowed = codecs.get(kind)
+        if allowed is None or not codec or codec == 'none':
+            continue
+        if not codec.lower().startswith(allowed):
+            return False
+    return True
+
 def get_format_string(quality: Optional[str] = None, format_type: Optional[str] = None) -> str:
     """
-    Generate yt-dlp format string based on quality and format selection
+    Generate yt-dlp format string based on quality and format selection; for formats with a
+    codec table, streams the container takes as is come first
     """
     if not quality and not format_type:
         return 'bestvideo+bestaudio/best'
     
-    # Audio-only formats
+    # Audio-only formats never fetch video
     if format_type in FORMATS['audio']:
+        selector = 'bestaudio'
         if quality and quality in QUALITIES['audio']:
-            return QUALITIES['audio'][quality]['format']
-        return 'bestaudio'
+            selector = QUALITIES['audio'][quality]['format']
+        codecs = CONTAINER_CODECS[format_type]['audio']
+        if codecs:
+            return f"{selector}{_codec_filter('acodec', codecs)}/{selector}"
+        return selector
     
     # Video formats
     if format_type in FORMATS['video']:
+        selector = 'bestvideo+bestaudio/best'
         if quality and quality in QUALITIES['video']:
-            return QUALITIES['video'][quality]['format']
-        return 'bestvideo+bestaudio/best'
+            selector = QUALITIES['video'][quality]['format']
+        codecs = CONTAINER_CODECS[format_type]
+        if codecs['video'] is None:
+            return selector
+        height = _height_filter(quality)
+        video = _codec_filter('vcodec', codecs['video'])
+        audio = _codec_filter('acodec', codecs['audio'])
+        return f'bestvideo{height}{video}+bestaudio{audio}/best{height}{video}{audio}/{selector}'
     
     # Quality-only selection
     if quality:
@@ -143,9 +196,10 @@ def get_format_string(quality: Optional[str] = None, format_type: Optional[str]
     # Default fallback
     return 'bestvideo+bestaudio/best'
 
-def get_postprocessors(format_type: Optional[str] = None) -> list:
+def get_postprocessors(format_type: Optional[str] = None, conversion: str = '') -> list:
     """
-    Get postprocessors for the selected format
+    Get postprocessors for the selected format; conversion ('remux' or 'reencode') brings
+    video that yt-dlp merged into another container into the selected one
     """
     if not format_type:
         return []
@@ -154,8 +208,23 @@ def get_postprocessors(format_type: Optional[str] = None) -> list:
     if format_type in FORMATS['audio']:
         return FORMATS['audio'][format_type].get('postprocessors', [])
     
+    if conversion and format_type in FORMATS['video']:
+        key = 'FFmpegVideoRemuxer' if conversion == 'remux' else 'FFmpegVideoConvertor'
+        return [{'key': key, 'preferedformat': FORMATS['video'][format_type]['ext']}]
+    
     return []
 
+def get_merge_output_format(format_type: Optional[str] = None) -> Optional[str]:
+    """
+    Containers yt-dlp may merge separate video and audio into: the selected one when the
+    streams fit it, MKV otherwise (converted afterwards). yt-dlp only judges the fit for mp4
+    and webm; given the selected streams, the queue narrows this to the selected container
+    """
+    if format_type not in FORMATS['video']:
+        return None
+    ext = FORMATS['video'][format_type]['ext']
+    return ext if ext == 'mkv' else f'{ext}/mkv'
+
 def get_available_formats() -> dict:
     """
     Get all available formats and qualities
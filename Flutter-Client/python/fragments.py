@@ -0,0 +1,61 @@
+# Adaptive fragment concurrency for the embedded GrabTube server
+# Learns per site how many fragments of HLS/DASH streams to fetch in parallel, within a
+# connection budget shared by all active downloads
+
+from typing import Dict, Any
+
+# Steady downloads at the best level before trying more parallel fetches again
+PROBE_AFTER = 5
+
+class FragmentTuner:
+    """
+    Hill climbing over fragment concurrency per site: doubles while throughput keeps improving
+    by 10%, settles on the best level when it stops, halves when throughput drops by 30%
+    and probes upwards again after a few steady formats. yt-dlp reads the setting when a
+    format starts, so each observation covers one fragmented format download
+    """
+    
+    def __init__(self, initial: int = 2, max_concurrency: int = 16, connection_budget: int = 32):
+        self.initial = max(initial, 1)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.connection_budget = max(connection_budget, 1)
+        self._sites: Dict[str, Dict[str, Any]] = {}
+    
+    def ceiling(self, active: int) -> int:
+        """Most parallel fetches one download may use with active downloads running"""
+        return max(1, min(self.max_concurrency, self.connection_budget // max(active, 1)))
+    
+    def current(self, site: str, active: int) -> int:
+        """Concurrency for the next fragmented format of a site"""
+        value = self._sites[site]['value'] if site in self._sites else self.initial
+        return max(1, min(value, self.ceiling(active)))
+    
+    def observe(self, site: str, concurrency: int, throughput: float) -> int:
+        """Record the throughput of a format fetched with concurrency; returns the new site value"""
+        state = self._sites.setdefault(site, {'value': self.initial, 'best': 0.0, 'best_at': 0, 'steady': 0})
+        if concurrency > state['best_at']:
+            if throughput > state['best'] * 1.1:
+                # Still climbing
+                state.update(best=throughput, best_at=concurrency, value=concurrency * 2, steady=0)
+            else:
+                # More parallel fetches did not pay off, go back to the best level
+                state.update(value=state['best_at'], steady=0)
+        elif concurrency == state['best_at']:
+            if throughput < state['best'] * 0.7:
+                # Throttled or congested
+                value = max(1, concurrency // 2)
+                state.update(best=throughput, best_at=value, value=value, steady=0)
+            else:
+                state['best'] = (state['best'] + throughput) / 2
+                state['steady'] += 1
+                if state['steady'] >= PROBE_AFTER:
+                    state.update(value=concurrency * 2, steady=0)
+        # Formats run below the best level (capped by the budget) say nothing about it
+        state['value'] = max(1, min(state['value'], self.max_concurrency))
+        return state['value']
+    
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Learned concurrency and best throughput per site"""
+        return {site: {'concurrency': state['value'], 'best_at': state['best_at'],
+                       'best_throughput': round(state['best'], 1)}
+                for site, state in self._sites.items()}
\ No newline at end of file
@@ -0,0 +1,125 @@
+# Per-site admission governor for the embedded GrabTube server
+# Caps concurrent downloads per site and paces requests to each site with token buckets
+
+import time
+from typing import Optional, Dict, Any
+from urllib.parse import urlsplit
+
+def site_of(url: str, key: str = '') -> str:
+    """
+    Site a download or extraction counts against: the extractor name when known from a
+    video or cache key ('Youtube:abc' -> 'youtube'), the host name otherwise
+    """
+    if key and not key.startswith('url:'):
+        return key.split(':', 1)[0].lower()
+    host = (urlsplit(url).hostname or '').lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    return host
+
+class TokenBucket:
+    """Token bucket; reservations may run it negative so waiting callers queue up in order"""
+    
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def available(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= 1
+    
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+    
+    def reserve(self, now: float) -> float:
+        """Take a token, returning how many seconds to wait before using it"""
+        self.take(now)
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+    
+    def ready_in(self, now: float) -> float:
+        """Seconds until a whole token is available"""
+        self._refill(now)
+        return max(1 - self.tokens, 0.0) / self.rate
+
+class SiteGovernor:
+    """Concurrency caps and request rate limits per site, 0 meaning unlimited"""
+    
+    def __init__(self, max_concurrent: int = 0, rate: float = 0.0, burst: float = 1.0,
+                 overrides: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.max_concurrent = max_concurrent
+        self.rate = rate
+        self.burst = burst
+        self.overrides = {site.lower(): limits for site, limits in (overrides or {}).items()}
+        self.active: Dict[str, int] = {}
+        self._buckets: Dict[str, Optional[TokenBucket]] = {}
+    
+    def limits(self, site: str) -> Dict[str, Any]:
+        """Effective limits of a site"""
+        override = self.overrides.get(site, {})
+        return {
+            'max_concurrent': override.get('max_concurrent', self.max_concurrent),
+            'rate': override.get('rate', self.rate),
+            'burst': override.get('burst', self.burst)
+        }
+    
+    def can_start(self, site: str) -> bool:
+        """Whether a download for the site may start now"""
+        max_concurrent = self.limits(site)['max_concurrent']
+        if max_concurrent and self.active.get(site, 0) >= max_concurrent:
+            return False
+        bucket = self._bucket(site)
+        return bucket is None or bucket.available(time.monotonic())
+    
+    def started(self, site: str):
+        """Count a download that started against its site"""
+        self.active[site] = self.active.get(site, 0) + 1
+        bucket = self._bucket(site)
+        if bucket is not None:
+            bucket.take(time.monotonic())
+    
+    def finished(self, site: str):
+        """Release the concurrency a download held"""
+        count = self.active.get(site, 0) - 1
+        if count > 0:
+            self.active[site] = count
+        else:
+            self.active.pop(site, None)
+    
+    def reserve_request(self, site: str) -> float:
+        """Take a request token for a metadata call; returns the seconds to wait first"""
+        bucket = self._bucket(site)
+        return 0.0 if bucket is None else bucket.reserve(time.monotonic())
+    
+    def rate_limited_for(self, site: str) -> float:
+        """Seconds until a rate-limited site has a token again, 0 if it is not waiting on one"""
+        bucket = self._bucket(site)
+        return 0.0 if bucket is None else bucket.ready_in(time.monotonic())
+    
+    def stats(self) -> Dict[str, Any]:
+        """Active downloads and available tokens per site"""
+        now = time.monotonic()
+        sites = {}
+        for site in set(self.active) | set(self._buckets):
+            bucket = self._buckets.get(site)
+            if bucket is not None:
+                bucket._refill(now)
+            sites[site] = {
+                'active': self.active.get(site, 0),
+                'tokens': round(bucket.tokens, 2) if bucket is not None else None,
+                **self.limits(site)
+            }
+        return sites
+    
+    def _bucket(self, site: str) -> Optional[TokenBucket]:
+        if site not in self._buckets:
+            limits = self.limits(site)
+            self._buckets[site] = TokenBucket(limits['rate'], limits['burst']) if limits['rate'] else None
+        return self._buckets[site]
\ No newline at end of file
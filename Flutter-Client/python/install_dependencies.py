@@ -40,10 +40,18 @@ def main():
         "watchfiles"
     ]
     
+    # Optional speedups, the service falls back to the standard library without them
+    optional_dependencies = [
+        "orjson"
+    ]
+    
     success = True
     for dep in dependencies:
         if not run_command(f"pip install {dep}"):
             success = False
+    for dep in optional_dependencies:
+        if not run_command(f"pip install {dep}"):
+            print(f"  (optional, continuing without {dep})")
     
     if success:
         print("\n🎉 All dependencies installed successfully!")
@@ -4,18 +4,39 @@
 
 import os
 import sys
+import time
+import uuid
 import asyncio
 from pathlib import Path
 from aiohttp import web
 import socketio
 import logging
-import json
+from collections import OrderedDict
 from watchfiles import awatch
 
-from .ytdl import DownloadQueueNotifier, DownloadQueue
+from . import serialization
+from .serialization import dumps, dumps_bytes
+from .metrics import MetricsRegistry
+from .ytdl import DownloadQueueNotifier, DownloadQueue, DuplicateDownloadError
 
 log = logging.getLogger('embedded_server')
 
+def json_response(data, **kwargs) -> web.Response:
+    """web.json_response using the server's JSON encoder"""
+    return web.json_response(data, dumps=dumps, **kwargs)
+
+def _flag(value, default=None):
+    """Boolean request field: 'true' or '1' in form data, or a JSON boolean; default when absent"""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ('true', '1')
+
+def _json_list(downloads) -> bytes:
+    """JSON array of downloads built from their cached serialized forms"""
+    return b'[' + b','.join(d.to_json() for d in downloads) + b']'
+
 class EmbeddedConfig:
     """Configuration for embedded Python server"""
     
@@ -49,6 +70,39 @@ class EmbeddedConfig:
         self.DEFAULT_THEME = 'auto'
         self.DOWNLOAD_MODE = 'limited'
         self.MAX_CONCURRENT_DOWNLOADS = 3
+        self.EXTRACT_EXECUTOR = 'thread'
+        self.EXTRACT_WORKERS = 4
+        self.EXTRACT_TIMEOUT = 60.0
+        self.METADATA_CACHE_SIZE = 256
+        self.METADATA_CACHE_TTL = 1800.0
+        self.METADATA_CACHE_DISK_TTL = 21600.0
+        self.METADATA_CACHE_DISK_ENTRIES = 4096
+        self.DOWNLOAD_INFO_MAX_AGE = 1800.0
+        self.PROGRESS_POLL_INTERVAL = 0.5
+        self.PROGRESS_TABLE_SLOTS = 64
+        self.WORKER_MAX_JOBS = 50
+        self.WORKER_MAX_RSS_MB = 512.0
+        self.PERSIST_FLUSH_INTERVAL = 1.0
+        self.PERSIST_FLUSH_THRESHOLD = 500
+        self.BATCH_ADD_CONCURRENCY = 8
+        self.SITE_MAX_CONCURRENT = 0
+        self.SITE_REQUEST_RATE = 0.0
+        self.SITE_REQUEST_BURST = 10
+        self.SITE_LIMITS = {}
+        self.BANDWIDTH_LIMIT = 0
+        self.BANDWIDTH_SCHEDULE = []
+        self.BANDWIDTH_REBALANCE_INTERVAL = 2.0
+        self.PARTIAL_MAX_AGE = 604800
+        self.DUPLICATE_POLICY = 'link'
+        self.FRAGMENT_CONCURRENCY_ADAPTIVE = True
+        self.FRAGMENT_CONCURRENCY_INITIAL = 2
+        self.FRAGMENT_CONCURRENCY_MAX = 16
+        self.FRAGMENT_CONNECTION_BUDGET = 32
+        self.ADAPTIVE_CONCURRENCY = False
+        self.ADAPTIVE_CONCURRENCY_MIN = 1
+        self.ADAPTIVE_CONCURRENCY_MAX = 8
+        self.ADAPTIVE_CONCURRENCY_INTERVAL = 10.0
+        self.POSTPROCESS_WORKERS = 0
         self.LOGLEVEL = 'INFO'
         self.ENABLE_ACCESSLOG = False
         
@@ -61,13 +115,21 @@ class EmbeddedServer:
     
     def __init__(self, config=None):
         self.config = config or EmbeddedConfig()
-        self.sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins='*')
-        self.app = web.Application()
+        self.sio = socketio.AsyncServer(async_mode='aiohttp', cors_allowed_origins='*',
+                                       json=serialization)
+        # Shared with the download queue, served on /metrics
+        self.metrics = MetricsRegistry()
+        self._request_seconds = self.metrics.histogram(
+            'grabtube_http_request_seconds', 'HTTP handler latency by route', labels=('method', 'route'))
+        self.app = web.Application(middlewares=[self._time_request])
         self.sio.attach(self.app)
         self.queue = None
         self.notifier = None
         self.runner = None
         self.site = None
+        # ETags carry an instance id so versions from before a restart never match
+        self._instance_id = uuid.uuid4().hex[:8]
+        self._response_cache: OrderedDict = OrderedDict()
         
         # Setup logging
         logging.basicConfig(
@@ -81,6 +143,7 @@ class EmbeddedServer:
     def _setup_routes(self):
         """Setup HTTP routes"""
         self.app.router.add_post('/add', self.add_download)
+        self.app.router.add_post('/add/batch', self.add_downloads)
         self.app.router.add_get('/downloads', self.get_downloads)
         self.app.router.add_get('/queue', self.get_queue)
         self.app.router.add_get('/done', self.get_done)
@@ -90,14 +153,30 @@ class EmbeddedServer:
         self.app.router.add_get('/history', self.get_history)
         self.app.router.add_post('/clear', self.clear_completed)
         self.app.router.add_get('/info', self.get_video_info)
+        self.app.router.add_get('/plan', self.get_format_plan)
         self.app.router.add_get('/health', self.health_check)
+        self.app.router.add_get('/metrics', self.get_metrics)
+        self.app.router.add_get('/concurrency', self.get_concurrency)
+        self.app.router.add_get('/bandwidth', self.get_bandwidth)
+        self.app.router.add_post('/bandwidth', self.set_bandwidth)
+    
+    @web.middleware
+    async def _time_request(self, request, handler):
+        """Record handler latency under the route pattern, so ids in paths do not add series"""
+        started = time.perf_counter()
+        try:
+            return await handler(request)
+        finally:
+            resource = request.match_info.route.resource
+            route = resource.canonical if resource is not None else 'unmatched'
+            self._request_seconds.observe(time.perf_counter() - started, request.method, route)
     
     def _setup_socket_events(self):
         """Setup Socket.IO events"""
         @self.sio.event
         async def connect(sid, environ):
             log.info(f'Client connected: {sid}')
-            await self.sio.emit('connected', {'message': 'Connected to embedded server'}, room=sid)
+            await self.notifier.emit('connected', {'message': 'Connected to embedded server'}, room=sid)
         
         @self.sio.event
         async def disconnect(sid):
@@ -112,86 +191,197 @@ class EmbeddedServer:
                 quality=data.get('quality'),
                 format=data.get('format'),
                 folder=data.get('folder'),
-                auto_start=data.get('auto_start', True)
+                auto_start=_flag(data.get('auto_start'), True),
+                priority=int(data.get('priority', 0)),
+                playlist_strict_mode=_flag(data.get('playlist_strict_mode')),
+                playlist_item_limit=(int(data['playlist_item_limit'])
+                                     if 'playlist_item_limit' in data else None),
+                duplicate_policy=data.get('duplicate_policy')
             )
-            return web.json_response({
+            return json_response({
                 'success': True,
                 'download': download.to_dict()
             })
+        except DuplicateDownloadError as e:
+            return json_response({
+                'success': False,
+                'error': str(e),
+                'download': e.download.to_dict()
+            }, status=409)
         except Exception as e:
             log.error(f'Failed to add download: {e}')
-            return web.json_response({
+            return json_response({
                 'success': False,
                 'error': str(e)
             }, status=400)
     
-    async def get_downloads(self, request):
-        """Get all downloads"""
+    async def add_downloads(self, request):
+        """
+        Add many downloads: a JSON body with a urls list, or form data with repeated or
+        newline-separated urls fields; other fields apply to every URL
+        """
         try:
-            queue = await self.queue.get_queue()
-            done = await self.queue.get_done()
-            pending = await self.queue.get_pending()
+            if request.content_type == 'application/json':
+                data = await request.json(loads=serialization.loads)
+                urls = data.get('urls', [])
+                if not isinstance(urls, list):
+                    raise ValueError('urls must be a list')
+            else:
+                data = await request.post()
+                urls = [line for value in data.getall('urls', []) for line in value.splitlines()]
+            urls = [url.strip() for url in urls if isinstance(url, str) and url.strip()]
+            if not urls:
+                raise ValueError('No URLs given')
             
-            return web.json_response({
-                'queue': [d.to_dict() for d in queue],
-                'done': [d.to_dict() for d in done],
-                'pending': [d.to_dict() for d in pending]
-            })
+            results = await self.queue.add_many(
+                urls,
+                quality=data.get('quality'),
+                format=data.get('format'),
+                folder=data.get('folder'),
+                auto_start=_flag(data.get('auto_start'), True),
+                priority=int(data.get('priority', 0)),
+                duplicate_policy=data.get('duplicate_policy')
+            )
         except Exception as e:
-            log.error(f'Failed to get downloads: {e}')
-            return web.json_response({
+            log.error(f'Failed to add downloads: {e}')
+            return json_response({
                 'success': False,
                 'error': str(e)
-            }, status=500)
+            }, status=400)
+        
+        items = []
+        for url, result in results:
+            if isinstance(result, DuplicateDownloadError):
+                items.append({'url': url, 'success': False, 'error': str(result),
+                              'download': result.download.to_dict()})
+            elif isinstance(result, BaseException):
+                items.append({'url': url, 'success': False, 'error': str(result)})
+            else:
+                items.append({'url': url, 'success': True, 'download': result.to_dict()})
+        added = sum(item['success'] for item in items)
+        return json_response({
+            'success': added > 0,
+            'added': added,
+            'failed': len(items) - added,
+            'results': items
+        })
     
-    async def get_queue(self, request):
-        """Get download queue"""
+    def _list_params(self, request) -> dict:
+        """Parse list filters and pagination from the query string"""
+        query = request.query
+        order = query.get('order', 'asc')
+        if order not in ('asc', 'desc'):
+            raise ValueError(f'Invalid order: {order}')
+        limit = int(query['limit']) if 'limit' in query else None
+        if limit is not None and limit < 1:
+            raise ValueError(f'Invalid limit: {limit}')
+        return {
+            'status': query['status'].split(',') if query.get('status') else None,
+            'folder': query.get('folder'),
+            'since': float(query['since']) if 'since' in query else None,
+            'until': float(query['until']) if 'until' in query else None,
+            'order': order,
+            'limit': limit
+        }
+    
+    async def _list_response(self, request, buckets, build, max_cached: int = 64):
+        """
+        JSON response tagged with the state version of the buckets it lists: 304 when the
+        client already has this version, a cached body when another poller asked for it
+        """
+        etag = f'"{self._instance_id}-{self.queue.state_version(*buckets)}"'
+        if_none_match = request.headers.get('If-None-Match', '')
+        if if_none_match == '*' or etag in (t.strip() for t in if_none_match.split(',')):
+            return web.Response(status=304, headers={'ETag': etag})
+        
+        key = request.rel_url.path_qs
+        cached = self._response_cache.get(key)
+        if cached is not None and cached[0] == etag:
+            self._response_cache.move_to_end(key)
+            _, body, headers = cached
+        else:
+            body, headers = await build(self._list_params(request))
+            self._response_cache[key] = (etag, body, headers)
+            self._response_cache.move_to_end(key)
+            while len(self._response_cache) > max_cached:
+                self._response_cache.popitem(last=False)
+        
+        return web.Response(body=body, content_type='application/json',
+                            headers={'ETag': etag, **headers})
+    
+    async def _list_bucket(self, request, bucket: str, name: str):
+        """List one bucket; the next page cursor is sent in the X-Next-Cursor header"""
+        async def build(params):
+            page, next_cursor = await self.queue.list_downloads(
+                bucket, cursor=request.query.get('cursor'), **params
+            )
+            return _json_list(page), ({'X-Next-Cursor': next_cursor} if next_cursor else {})
+        
         try:
-            queue = await self.queue.get_queue()
-            return web.json_response([d.to_dict() for d in queue])
+            return await self._list_response(request, (bucket,), build)
+        except ValueError as e:
+            return json_response({
+                'success': False,
+                'error': str(e)
+            }, status=400)
         except Exception as e:
-            log.error(f'Failed to get queue: {e}')
-            return web.json_response({
+            log.error(f'Failed to get {name}: {e}')
+            return json_response({
                 'success': False,
                 'error': str(e)
             }, status=500)
     
-    async def get_done(self, request):
-        """Get completed downloads"""
+    async def get_downloads(self, request):
+        """Get all downloads; with limit, each bucket is paged by its <bucket>_cursor parameter"""
+        async def build(params):
+            parts, next_cursors = [], {}
+            for bucket in ('queue', 'done', 'pending'):
+                page, next_cursors[bucket] = await self.queue.list_downloads(
+                    bucket, cursor=request.query.get(f'{bucket}_cursor'), **params
+                )
+                parts.append(b'"%s":%s' % (bucket.encode(), _json_list(page)))
+            if params['limit'] is not None:
+                parts.append(b'"next_cursor":' + dumps_bytes(next_cursors))
+            return b'{' + b','.join(parts) + b'}', {}
+        
         try:
-            done = await self.queue.get_done()
-            return web.json_response([d.to_dict() for d in done])
+            return await self._list_response(request, ('queue', 'done', 'pending'), build)
+        except ValueError as e:
+            return json_response({
+                'success': False,
+                'error': str(e)
+            }, status=400)
         except Exception as e:
-            log.error(f'Failed to get done: {e}')
-            return web.json_response({
+            log.error(f'Failed to get downloads: {e}')
+            return json_response({
                 'success': False,
                 'error': str(e)
             }, status=500)
     
+    async def get_queue(self, request):
+        """Get download queue"""
+        return await self._list_bucket(request, 'queue', 'queue')
+    
+    async def get_done(self, request):
+        """Get completed downloads"""
+        return await self._list_bucket(request, 'done', 'done')
+    
     async def get_pending(self, request):
         """Get pending downloads"""
-        try:
-            pending = await self.queue.get_pending()
-            return web.json_response([d.to_dict() for d in pending])
-        except Exception as e:
-            log.error(f'Failed to get pending: {e}')
-            return web.json_response({
-                'success': False,
-                'error': str(e)
-            }, status=500)
+        return await self._list_bucket(request, 'pending', 'pending')
     
     async def delete_download(self, request):
         """Delete a download"""
         try:
             data = await request.post()
-            ids = data.get('ids', [])
+            ids = data.getall('ids', [])
             where = data.get('where', 'queue')
             
             await self.queue.delete(ids, where)
-            return web.json_response({'success': True})
+            return json_response({'success': True})
         except Exception as e:
             log.error(f'Failed to delete download: {e}')
-            return web.json_response({
+            return json_response({
                 'success': False,
                 'error': str(e)
             }, status=400)
@@ -200,37 +390,29 @@ class EmbeddedServer:
         """Start a download"""
         try:
             data = await request.post()
-            ids = data.get('ids', [])
+            ids = data.getall('ids', [])
             
             await self.queue.start(ids)
-            return web.json_response({'success': True})
+            return json_response({'success': True})
         except Exception as e:
             log.error(f'Failed to start download: {e}')
-            return web.json_response({
+            return json_response({
                 'success': False,
                 'error': str(e)
             }, status=400)
     
     async def get_history(self, request):
         """Get download history"""
-        try:
-            history = await self.queue.get_history()
-            return web.json_response([d.to_dict() for d in history])
-        except Exception as e:
-            log.error(f'Failed to get history: {e}')
-            return web.json_response({
-                'success': False,
-                'error': str(e)
-            }, status=500)
+        return await self._list_bucket(request, 'done', 'history')
     
     async def clear_completed(self, request):
         """Clear completed downloads"""
         try:
             await self.queue.clear_completed()
-            return web.json_response({'success': True})
+            return json_response({'success': True})
         except Exception as e:
             log.error(f'Failed to clear completed: {e}')
-            return web.json_response({
+            return json_response({
                 'success': False,
                 'error': str(e)
             }, status=500)
@@ -240,28 +422,89 @@ class EmbeddedServer:
         try:
             url = request.query.get('url')
             if not url:
-                return web.json_response({
+                return json_response({
                     'success': False,
                     'error': 'URL parameter required'
                 }, status=400)
             
-            info = await self.queue.get_video_info(url)
-            return web.json_response(info)
+            timeout = request.query.get('timeout')
+            info = await self.queue.get_video_info(url, float(timeout) if timeout else None)
+            return json_response(info)
         except Exception as e:
             log.error(f'Failed to get video info: {e}')
-            return web.json_response({
+            return json_response({
+                'success': False,
+                'error': str(e)
+            }, status=400)
+    
+    async def get_format_plan(self, request):
+        """Show which streams a download would fetch and whether it would re-encode"""
+        try:
+            url = request.query.get('url')
+            if not url:
+                return json_response({
+                    'success': False,
+                    'error': 'URL parameter required'
+                }, status=400)
+            
+            timeout = request.query.get('timeout')
+            plan = await self.queue.plan(url, request.query.get('quality', ''),
+                                         request.query.get('format', ''),
+                                         float(timeout) if timeout else None)
+            return json_response(plan)
+        except Exception as e:
+            log.error(f'Failed to plan download: {e}')
+            return json_response({
+                'success': False,
+                'error': str(e)
+            }, status=400)
+    
+    async def get_concurrency(self, request):
+        """Get the download slot limit and the adaptive controller's recent decisions"""
+        return json_response(self.queue.get_concurrency())
+    
+    async def get_bandwidth(self, request):
+        """Get the bandwidth budget and per-download shares"""
+        return json_response(self.queue.get_bandwidth())
+    
+    async def set_bandwidth(self, request):
+        """Change the bandwidth budget: limit in bytes/s (0 = unlimited) and/or a schedule list"""
+        try:
+            if request.content_type == 'application/json':
+                data = await request.json(loads=serialization.loads)
+            else:
+                data = await request.post()
+            schedule = data.get('schedule')
+            if isinstance(schedule, str):
+                schedule = serialization.loads(schedule)
+            bandwidth = self.queue.set_bandwidth(
+                limit=float(data['limit']) if data.get('limit') is not None else None,
+                schedule=schedule
+            )
+            return json_response({
+                'success': True,
+                'bandwidth': bandwidth
+            })
+        except Exception as e:
+            log.error(f'Failed to set bandwidth: {e}')
+            return json_response({
                 'success': False,
                 'error': str(e)
             }, status=400)
     
     async def health_check(self, request):
         """Health check endpoint"""
-        return web.json_response({
+        return json_response({
             'status': 'ok',
             'server': 'embedded',
             'version': '1.0.0'
         })
     
+    async def get_metrics(self, request):
+        """Metrics in the Prometheus text exposition format"""
+        return web.Response(body=self.metrics.render().encode(),
+                            headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+    
     async def start(self):
         """Start the embedded server"""
         try:
@@ -270,10 +513,53 @@ class EmbeddedServer:
                 download_dir=self.config.DOWNLOAD_DIR,
                 state_dir=self.config.STATE_DIR,
                 download_mode=self.config.DOWNLOAD_MODE,
-                max_concurrent_downloads=self.config.MAX_CONCURRENT_DOWNLOADS
+                max_concurrent_downloads=self.config.MAX_CONCURRENT_DOWNLOADS,
+                extract_executor=self.config.EXTRACT_EXECUTOR,
+                extract_workers=self.config.EXTRACT_WORKERS,
+                extract_timeout=self.config.EXTRACT_TIMEOUT,
+                metadata_cache_size=self.config.METADATA_CACHE_SIZE,
+                metadata_cache_ttl=self.config.METADATA_CACHE_TTL,
+                metadata_cache_disk_ttl=self.config.METADATA_CACHE_DISK_TTL,
+                metadata_cache_disk_entries=self.config.METADATA_CACHE_DISK_ENTRIES,
+                info_max_age=self.config.DOWNLOAD_INFO_MAX_AGE,
+                progress_interval=self.config.PROGRESS_POLL_INTERVAL,
+                progress_slots=self.config.PROGRESS_TABLE_SLOTS,
+                worker_max_jobs=self.config.WORKER_MAX_JOBS,
+                worker_max_rss_mb=self.config.WORKER_MAX_RSS_MB,
+                persist_flush_interval=self.config.PERSIST_FLUSH_INTERVAL,
+                persist_flush_threshold=self.config.PERSIST_FLUSH_THRESHOLD,
+                batch_add_concurrency=self.config.BATCH_ADD_CONCURRENCY,
+                output_template=self.config.OUTPUT_TEMPLATE,
+                output_template_playlist=self.config.OUTPUT_TEMPLATE_PLAYLIST,
+                playlist_strict_mode=self.config.DEFAULT_OPTION_PLAYLIST_STRICT_MODE,
+                playlist_item_limit=self.config.DEFAULT_OPTION_PLAYLIST_ITEM_LIMIT,
+                site_max_concurrent=self.config.SITE_MAX_CONCURRENT,
+                site_request_rate=self.config.SITE_REQUEST_RATE,
+                site_request_burst=self.config.SITE_REQUEST_BURST,
+                site_limits=self.config.SITE_LIMITS,
+                bandwidth_limit=self.config.BANDWIDTH_LIMIT,
+                bandwidth_schedule=self.config.BANDWIDTH_SCHEDULE,
+                bandwidth_rebalance_interval=self.config.BANDWIDTH_REBALANCE_INTERVAL,
+                temp_dir=self.config.TEMP_DIR,
+                partial_max_age=self.config.PARTIAL_MAX_AGE,
+                duplicate_policy=self.config.DUPLICATE_POLICY,
+                fragment_concurrency_adaptive=self.config.FRAGMENT_CONCURRENCY_ADAPTIVE,
+                fragment_concurrency_initial=self.config.FRAGMENT_CONCURRENCY_INITIAL,
+                fragment_concurrency_max=self.config.FRAGMENT_CONCURRENCY_MAX,
+                fragment_connection_budget=self.config.FRAGMENT_CONNECTION_BUDGET,
+                adaptive_concurrency=self.config.ADAPTIVE_CONCURRENCY,
+                adaptive_concurrency_min=self.config.ADAPTIVE_CONCURRENCY_MIN,
+                adaptive_concurrency_max=self.config.ADAPTIVE_CONCURRENCY_MAX,
+                adaptive_concurrency_interval=self.config.ADAPTIVE_CONCURRENCY_INTERVAL,
+                postprocess_workers=self.config.POSTPROCESS_WORKERS,
+                metrics=self.metrics
             )
             
             self.notifier = DownloadQueueNotifier(self.queue, self.sio)
+            self.queue.notifier = self.notifier
+            
+            # Continue downloads interrupted by the last shutdown or crash
+            await self.queue.resume()
             
             # Start the server
             self.runner = web.AppRunner(self.app)
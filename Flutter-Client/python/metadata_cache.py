@@ -0,0 +1,247 @@
+# Metadata cache for the embedded GrabTube server
+# Keeps extracted yt-dlp info in a memory LRU tier backed by a bounded shelve tier in STATE_DIR;
+# shelve reads and writes run on one background thread, never on the event loop
+
+import os
+import time
+import shelve
+import asyncio
+import logging
+import functools
+import concurrent.futures
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from yt_dlp.extractor import gen_extractor_classes
+
+log = logging.getLogger('metadata_cache')
+
+# Query parameters that never change what a URL points to
+TRACKING_PARAMS = {'si', 'feature', 'pp', 'fbclid', 'gclid', 'igshid', 'ref', 'ref_src'}
+
+def canonicalize_url(url: str) -> str:
+    """Normalize a URL so equivalent spellings map to the same string"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in TRACKING_PARAMS and not k.startswith('utm_')
+    )
+    return urlunsplit((parts.scheme.lower() or 'https', host, parts.path.rstrip('/'), urlencode(query), ''))
+
+@functools.lru_cache(maxsize=1)
+def _extractor_classes() -> tuple:
+    return tuple(ie for ie in gen_extractor_classes() if ie.ie_key() != 'Generic')
+
+@functools.lru_cache(maxsize=4096)
+def cache_key(url: str) -> str:
+    """
+    Get the cache key for a URL: the extractor video id when yt-dlp can tell it
+    from the URL alone, the canonical URL otherwise
+    """
+    for ie in _extractor_classes():
+        if ie.suitable(url):
+            try:
+                video_id = ie.get_temp_id(url)
+            except Exception:
+                video_id = None
+            if video_id:
+                return f'{ie.ie_key()}:{video_id}'
+            break
+    return f'url:{canonicalize_url(url)}'
+
+@functools.lru_cache(maxsize=4096)
+def is_single_video(url: str) -> bool:
+    """Whether the extractor for a URL is known to return single videos only"""
+    for ie in _extractor_classes():
+        if ie.suitable(url):
+            return bool(ie.is_single_video(url))
+    return False
+
+def info_key(info: Dict[str, Any]) -> Optional[str]:
+    """Get the cache key for an extracted info dict or flat playlist entry"""
+    extractor_key = info.get('extractor_key') or info.get('ie_key')
+    # Generic ids come from file names and are not unique across sites
+    if extractor_key not in (None, 'Generic') and info.get('id'):
+        return f"{extractor_key}:{info['id']}"
+    return None
+
+class MetadataCache:
+    """Two-tier cache of extracted video info with TTL and LRU eviction"""
+    
+    def __init__(self, state_dir: str, max_entries: int = 256, ttl: float = 1800.0,
+                 disk_ttl: float = 21600.0, disk_max_entries: int = 4096,
+                 prune_interval: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_ttl = disk_ttl
+        self.disk_max_entries = disk_max_entries
+        self.prune_interval = prune_interval
+        self.db_path = os.path.join(state_dir, 'metadata_cache.db')
+        self._memory: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        # Only the disk thread touches the shelve and the index of its keys by last use
+        self._disk = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='metadata-cache')
+        self._index: 'OrderedDict[str, float]' = OrderedDict()
+        self._pruned_at = 0.0
+        self._closed = False
+        os.makedirs(state_dir, exist_ok=True)
+        try:
+            self._db = shelve.open(self.db_path)
+        except Exception as e:
+            log.error(f'Failed to open metadata cache, using memory only: {e}')
+            self._db = None
+        else:
+            self._disk.submit(self._load_index)
+    
+    def peek(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get cached info from the memory tier only, for callers that cannot wait for the disk"""
+        entry = self._memory.get(key)
+        if entry is not None and time.time() - entry['stored_at'] < self.ttl:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry['info']
+        return None
+    
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get cached info for a key, or None when missing or expired"""
+        info = self.peek(key)
+        if info is not None:
+            return info
+        
+        if self._db is not None and not self._closed:
+            entry = await asyncio.get_running_loop().run_in_executor(
+                self._disk, self._read_disk, key, time.time()
+            )
+            if entry is not None:
+                self._remember(key, entry)
+                self.disk_hits += 1
+                return entry['info']
+        
+        self.misses += 1
+        return None
+    
+    def put(self, info: Dict[str, Any], *keys: str):
+        """
+        Store info under its extractor id and any URL keys that resolved to it; the disk
+        write happens in the background
+        """
+        entry = {'stored_at': time.time(), 'info': info}
+        primary = info_key(info) or keys[0]
+        aliases = [k for k in keys if k != primary]
+        
+        self._remember(primary, entry)
+        for key in aliases:
+            self._remember(key, entry)
+        
+        if self._db is not None and not self._closed:
+            self._disk.submit(self._write_disk, primary, entry, aliases)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get cache counters"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self._memory),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': (self.hits + self.disk_hits) / lookups if lookups else 0.0
+        }
+    
+    def close(self):
+        """Finish pending disk writes and close the disk tier"""
+        if self._closed:
+            return
+        self._closed = True
+        self._disk.submit(self._close_disk)
+        self._disk.shutdown(wait=True)
+    
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+    
+    # The methods below run on the disk thread
+    
+    def _read_disk(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        if self._db is None:
+            return None
+        try:
+            entry = self._db.get(key)
+            target = entry['alias'] if entry is not None and 'alias' in entry else None
+            if target is not None:
+                entry = self._db.get(target)
+        except Exception as e:
+            log.error(f'Failed to read metadata cache: {e}')
+            return None
+        if entry is None or now - entry['stored_at'] >= self.disk_ttl:
+            return None
+        for used in (key, target):
+            if used in self._index:
+                self._index.move_to_end(used)
+        # Memory TTL is measured from the disk write, not from this promotion
+        return entry
+    
+    def _write_disk(self, primary: str, entry: Dict[str, Any], aliases: List[str]):
+        if self._db is None:
+            return
+        try:
+            self._db[primary] = entry
+            for key in aliases:
+                self._db[key] = {'stored_at': entry['stored_at'], 'alias': primary}
+        except Exception as e:
+            log.error(f'Failed to write metadata cache: {e}')
+            return
+        for key in (primary, *aliases):
+            self._index[key] = entry['stored_at']
+            self._index.move_to_end(key)
+        if (len(self._index) > self.disk_max_entries or
+                time.monotonic() - self._pruned_at >= self.prune_interval):
+            self._prune_disk()
+    
+    def _load_index(self):
+        """Index the disk tier by write time, the closest record of use it keeps"""
+        try:
+            stored = sorted((self._db[k]['stored_at'], k) for k in list(self._db.keys()))
+        except Exception as e:
+            log.error(f'Failed to read metadata cache: {e}')
+            return
+        self._index = OrderedDict((key, stored_at) for stored_at, key in stored)
+        self._prune_disk()
+    
+    def _prune_disk(self):
+        """Drop expired entries, then least recently used ones beyond disk_max_entries"""
+        self._pruned_at = time.monotonic()
+        now = time.time()
+        drop = [k for k, stored_at in self._index.items() if now - stored_at >= self.disk_ttl]
+        excess = len(self._index) - len(drop) - self.disk_max_entries
+        if excess > 0:
+            expired = set(drop)
+            drop += [k for k in self._index if k not in expired][:excess]
+        for key in drop:
+            del self._index[key]
+            try:
+                del self._db[key]
+            except KeyError:
+                pass
+            except Exception as e:
+                log.error(f'Failed to prune metadata cache: {e}')
+                return
+        if drop:
+            log.info(f'Pruned {len(drop)} metadata cache entries')
+    
+    def _close_disk(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
\ No newline at end of file
@@ -0,0 +1,133 @@
+# Prometheus metrics for the embedded GrabTube server
+# Counters and histograms rendered in the text exposition format without a client library.
+# Every instrument has a single writer at a time (the event loop, or the persister thread under
+# its flush lock), so updates are plain increments without locks; a scrape reads whatever is
+# there and at worst sees an observation half applied, which the next scrape corrects
+
+import bisect
+from typing import List, Dict, Any, Callable, Sequence, Tuple, Union
+
+# Seconds, from a cached lookup to a slow extraction or a long download
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+DURATION_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0, 7200.0)
+# Bytes per second, 64 KiB/s to 128 MiB/s
+RATE_BUCKETS = tuple(float(64 * 1024 * 2 ** i) for i in range(12))
+
+Labels = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Labels, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic count per label values"""
+    
+    kind = 'counter'
+    
+    def __init__(self, name: str, description: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values: Dict[Labels, float] = {}
+    
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+    
+    def samples(self) -> List[str]:
+        return [f'{self.name}{_labels(self.labels, labels)} {_number(value)}'
+                for labels, value in list(self.values.items())]
+
+class Histogram:
+    """Bucketed observations per label values, with their sum and count"""
+    
+    kind = 'histogram'
+    
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                 labels: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: [count per bucket (not cumulative) with +Inf last, sum]
+        self.series: Dict[Labels, list] = {}
+    
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+    
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in list(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), list(counts)):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labels, labels)} {cumulative}')
+        return lines
+
+class Gauge:
+    """
+    Value read at scrape time: a number, or {label values: number} from a callback, so
+    nothing is updated on the hot path
+    """
+    
+    def __init__(self, name: str, description: str, read: Callable[[], Union[float, Dict[Labels, float]]],
+                 labels: Sequence[str] = (), kind: str = 'gauge'):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.kind = kind
+        self.read = read
+    
+    def samples(self) -> List[str]:
+        value = self.read()
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f'{self.name}{_labels(self.labels, labels)} {_number(v)}' for labels, v in value.items()]
+
+class MetricsRegistry:
+    """Metrics of one server, rendered together for /metrics"""
+    
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+    
+    def counter(self, name: str, description: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, description, labels))
+    
+    def histogram(self, name: str, description: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                  labels: Sequence[str] = ()) -> Histogram:
+        return self._register(Histogram(name, description, buckets, labels))
+    
+    def gauge(self, name: str, description: str, read: Callable, labels: Sequence[str] = (),
+              kind: str = 'gauge') -> Gauge:
+        """Scrape-time value; kind 'counter' for totals another component already keeps"""
+        return self._register(Gauge(name, description, read, labels, kind))
+    
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+    
+    def _register(self, metric):
+        # Registering again, e.g. from a queue created anew, replaces the old instrument
+        self._metrics[metric.name] = metric
+        return metric
\ No newline at end of file
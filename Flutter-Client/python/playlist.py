@@ -0,0 +1,101 @@
+# Lazy playlist expansion for the embedded GrabTube server
+# Playlists are extracted flat on an executor thread and their entries handed to the event loop
+# while later pages are still loading
+
+import asyncio
+import threading
+import logging
+from typing import Optional, List, Dict, Any, Tuple, AsyncIterator
+
+from yt_dlp import YoutubeDL
+from yt_dlp.utils import PlaylistEntries
+
+log = logging.getLogger('playlist')
+
+PLAYLIST_TYPES = ('playlist', 'multi_video')
+
+def entry_url(entry: Dict[str, Any]) -> Optional[str]:
+    """Page URL of a playlist entry, whether it was extracted flat or in full"""
+    if entry.get('_type') in ('url', 'url_transparent'):
+        return entry.get('url')
+    return entry.get('webpage_url') or entry.get('original_url') or entry.get('url')
+
+class PlaylistExpansion:
+    """
+    Extraction of a URL that may be a playlist. head() tells what the URL is; for playlists,
+    batches() then yields (index, entry) lists as entries arrive
+    """
+    
+    def __init__(self, url: str, options: Dict[str, Any]):
+        self.url = url
+        self.options = {
+            **options,
+            'extract_flat': 'in_playlist',
+            'lazy_playlist': True
+        }
+        self._events: asyncio.Queue = asyncio.Queue()
+        self._stop = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._future: Optional[asyncio.Future] = None
+    
+    def start(self, executor):
+        """Start extracting on an executor thread"""
+        self._loop = asyncio.get_running_loop()
+        self._future = self._loop.run_in_executor(executor, self._run)
+    
+    async def head(self) -> Tuple[str, Dict[str, Any]]:
+        """Wait for ('video', full info) or ('playlist', playlist info without entries)"""
+        kind, payload = await self._events.get()
+        if kind == 'error':
+            raise payload
+        return kind, payload
+    
+    async def batches(self) -> AsyncIterator[List[Tuple[int, Dict[str, Any]]]]:
+        """Yield the entries that arrived since the last batch until the playlist ends"""
+        while True:
+            events = [await self._events.get()]
+            while not self._events.empty():
+                events.append(self._events.get_nowait())
+            
+            batch = [payload for kind, payload in events if kind == 'entry']
+            if batch:
+                yield batch
+            for kind, payload in events:
+                if kind == 'error':
+                    raise payload
+                if kind == 'end':
+                    return
+    
+    def cancel(self):
+        """Stop before the next entry; a page request already running still completes"""
+        self._stop.set()
+    
+    def _emit(self, kind: str, payload: Any = None):
+        try:
+            self._loop.call_soon_threadsafe(self._events.put_nowait, (kind, payload))
+        except RuntimeError:
+            # The event loop is gone, nobody is listening any more
+            self._stop.set()
+    
+    def _run(self):
+        try:
+            with YoutubeDL(self.options) as ydl:
+                ie_result = ydl.extract_info(self.url, download=False, process=False)
+                if ie_result.get('_type') not in PLAYLIST_TYPES:
+                    # Videos and redirects are resolved completely, like a normal extraction
+                    ie_result = ydl.process_ie_result(ie_result, download=False)
+                    if ie_result.get('_type') not in PLAYLIST_TYPES:
+                        self._emit('video', ydl.sanitize_info(ie_result))
+                        return
+                
+                head = {k: v for k, v in ie_result.items() if k not in ('entries', 'requested_entries')}
+                self._emit('playlist', ydl.sanitize_info(head))
+                # Honors playlistend/playlist_items and only pulls pages as entries are consumed
+                for index, entry in PlaylistEntries(ydl, ie_result).get_requested_items():
+                    if self._stop.is_set():
+                        break
+                    if entry:
+                        self._emit('entry', (index, ydl.sanitize_info(entry)))
+            self._emit('end')
+        except Exception as e:
+            self._emit('error', e)
\ No newline at end of file
@@ -0,0 +1,93 @@
+# Post-processing stage for the embedded GrabTube server
+# FFmpeg conversions run after the download slot is released, on their own pool sized by CPU
+# cores and ordered by download priority
+
+import asyncio
+import heapq
+import itertools
+import os
+import logging
+import concurrent.futures
+from typing import Optional, List, Dict, Any, Callable
+
+from yt_dlp import YoutubeDL
+
+log = logging.getLogger('postprocess')
+
+def run_postprocessors(filepath: str, postprocessors: List[Dict[str, Any]],
+                       hook: Optional[Callable[[Dict], None]] = None) -> str:
+    """Run yt-dlp postprocessors on a downloaded file; returns the resulting file path"""
+    options = {
+        'postprocessors': [dict(pp) for pp in postprocessors],
+        'logger': logging.getLogger('yt-dlp'),
+    }
+    name = os.path.basename(filepath)
+    info = {
+        'id': name,
+        'title': os.path.splitext(name)[0],
+        'ext': os.path.splitext(name)[1].lstrip('.'),
+        'filepath': filepath,
+        '__files_to_move': {},
+    }
+    with YoutubeDL(options) as ydl:
+        # Added afterwards, hooks given in the options reach each postprocessor twice
+        if hook is not None:
+            ydl.add_postprocessor_hook(hook)
+        info = ydl.run_all_pps('post_process', info)
+    return info['filepath']
+
+class PostProcessPool:
+    """Bounded pool for post-processing jobs; waiting jobs start highest priority first"""
+    
+    def __init__(self, workers: int = 0):
+        self.workers = workers or os.cpu_count() or 1
+        self.active = 0
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix='ytdl-postprocess'
+        )
+        self._waiting: List[tuple] = []
+        self._seq = itertools.count()
+    
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiting if not future.done())
+    
+    async def run(self, priority: int, fn: Callable, *args) -> Any:
+        """Run fn(*args) on the pool once a worker is free"""
+        loop = asyncio.get_running_loop()
+        if self.active >= self.workers or self.waiting:
+            future = loop.create_future()
+            heapq.heappush(self._waiting, (-priority, next(self._seq), future))
+            try:
+                # The waker hands over its worker, already counted in active
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._release()
+                raise
+        else:
+            self.active += 1
+        try:
+            job = loop.run_in_executor(self._executor, fn, *args)
+        except RuntimeError:
+            # Shut down
+            self._release()
+            raise
+        # A cancelled caller stops waiting but FFmpeg runs on, so the worker is only
+        # handed back once the job itself is done
+        job.add_done_callback(lambda _: self._release())
+        return await asyncio.shield(job)
+    
+    def shutdown(self):
+        for _, _, future in self._waiting:
+            future.cancel()
+        self._waiting.clear()
+        self._executor.shutdown(wait=False)
+    
+    def _release(self):
+        self.active -= 1
+        while self._waiting and self.active < self.workers:
+            _, _, future = heapq.heappop(self._waiting)
+            if not future.done():
+                self.active += 1
+                future.set_result(None)
\ No newline at end of file
@@ -0,0 +1,140 @@
+# Shared-memory progress table for the embedded GrabTube server
+# Download workers write into a fixed record per slot, the queue polls it without any pickling
+
+import ctypes
+import multiprocessing
+import time
+from typing import Optional, List, Dict, Any
+
+# Record states
+IDLE = 0
+DOWNLOADING = 1
+FINISHED = 2
+ERROR = 3
+
+class ProgressRecord(ctypes.Structure):
+    """Progress of the download running in one slot"""
+    _fields_ = [
+        # Odd while the writer is in the middle of an update
+        ('seq', ctypes.c_uint64),
+        ('state', ctypes.c_int32),
+        ('downloaded_bytes', ctypes.c_double),
+        ('total_bytes', ctypes.c_double),
+        ('speed', ctypes.c_double),
+        ('eta', ctypes.c_double),
+        ('updated_at', ctypes.c_double),
+        ('filename', ctypes.c_char * 512),
+        ('error', ctypes.c_char * 256),
+        # Fragments of the HLS/DASH format being fetched, 0 for plain downloads
+        ('fragment_count', ctypes.c_int32),
+        # Written by the queue, not the worker: bytes/s the job may use, 0 for unlimited
+        ('rate_limit', ctypes.c_double),
+        # Written by the queue: parallel fragment fetches for the next format, 0 to leave as is
+        ('fragment_concurrency', ctypes.c_int32),
+    ]
+
+def _encode(value: str, size: int) -> bytes:
+    data = value.encode('utf-8', 'replace')
+    if len(data) < size:
+        return data
+    # Keep room for the terminating NUL and do not split a UTF-8 sequence
+    return data[:size - 1].decode('utf-8', 'ignore').encode('utf-8')
+
+class ProgressWriter:
+    """Writer side of one slot, used inside the worker process"""
+    
+    def __init__(self, records, slot: int):
+        self.record = records[slot]
+    
+    def reset(self):
+        self._write(IDLE, 0, 0, 0, 0, '', '')
+    
+    def update(self, downloaded_bytes: float, total_bytes: float, speed: float, eta: float,
+               filename: str = '', fragment_count: int = 0):
+        self._write(DOWNLOADING, downloaded_bytes, total_bytes, speed, eta, filename, '',
+                    fragment_count)
+    
+    def set_filename(self, filename: str):
+        record = self.record
+        self._write(record.state, record.downloaded_bytes, record.total_bytes, record.speed,
+                    record.eta, filename, '', record.fragment_count)
+    
+    def finish(self):
+        record = self.record
+        total = record.total_bytes or record.downloaded_bytes
+        self._write(FINISHED, total, total, 0, 0, record.filename.decode('utf-8', 'replace'), '',
+                    record.fragment_count)
+    
+    def fail(self, error: str):
+        record = self.record
+        self._write(ERROR, record.downloaded_bytes, record.total_bytes, 0, 0,
+                    record.filename.decode('utf-8', 'replace'), error, record.fragment_count)
+    
+    def _write(self, state: int, downloaded_bytes: float, total_bytes: float, speed: float,
+               eta: float, filename: str, error: str, fragment_count: int = 0):
+        record = self.record
+        # Always leave seq odd here, even if a killed writer left it odd already
+        record.seq = (record.seq + 1) | 1
+        record.state = state
+        record.downloaded_bytes = downloaded_bytes or 0
+        record.total_bytes = total_bytes or 0
+        record.speed = speed or 0
+        record.eta = eta or 0
+        record.updated_at = time.time()
+        record.filename = _encode(filename, 512)
+        record.error = _encode(error, 256)
+        record.fragment_count = fragment_count or 0
+        record.seq += 1
+
+class ProgressTable:
+    """Fixed-size table of progress records shared with worker processes"""
+    
+    def __init__(self, slots: int):
+        self.records = multiprocessing.RawArray(ProgressRecord, slots)
+        self._free: List[int] = list(range(slots))
+    
+    @property
+    def free_slots(self) -> int:
+        return len(self._free)
+    
+    def acquire(self) -> Optional[int]:
+        """Reserve a slot, or None when all slots are in use"""
+        if not self._free:
+            return None
+        slot = self._free.pop(0)
+        ProgressWriter(self.records, slot).reset()
+        return slot
+    
+    def release(self, slot: int):
+        """Return a slot to the free list"""
+        if slot not in self._free:
+            self._free.append(slot)
+    
+    def set_rate_limit(self, slot: int, rate_limit: float):
+        """Set the bandwidth share of the job running in a slot"""
+        self.records[slot].rate_limit = rate_limit
+    
+    def set_fragment_concurrency(self, slot: int, concurrency: int):
+        """Set the parallel fragment fetches the job in a slot uses for its next format"""
+        self.records[slot].fragment_concurrency = concurrency
+    
+    def read(self, slot: int) -> Optional[Dict[str, Any]]:
+        """Read a consistent snapshot of a slot, or None if the writer is mid-update"""
+        record = self.records[slot]
+        seq = record.seq
+        if seq % 2:
+            return None
+        snapshot = {
+            'state': record.state,
+            'downloaded_bytes': record.downloaded_bytes,
+            'total_bytes': record.total_bytes,
+            'speed': record.speed,
+            'eta': record.eta,
+            'updated_at': record.updated_at,
+            'filename': record.filename.decode('utf-8', 'replace'),
+            'error': record.error.decode('utf-8', 'replace'),
+            'fragment_count': record.fragment_count,
+        }
+        if record.seq != seq:
+            return None
+        return snapshot
\ No newline at end of file
@@ -0,0 +1,123 @@
+# Indexed download container for the embedded GrabTube server
+# Lookups, moves between buckets and deletes are O(1); bucket views are cached until they change
+
+from typing import Optional, List, Dict, Set, Tuple, Iterable, Any
+
+class DownloadIndex:
+    """Downloads indexed by id, by bucket (queue/done/pending) and by URL/video key"""
+    
+    BUCKETS = ('queue', 'done', 'pending')
+    
+    def __init__(self):
+        self._by_id: Dict[str, Any] = {}
+        self._bucket_of: Dict[str, str] = {}
+        # Dicts keep insertion order, so each bucket is an ordered set with O(1) removal
+        self._buckets: Dict[str, Dict[str, Any]] = {bucket: {} for bucket in self.BUCKETS}
+        self._keys_of: Dict[str, Tuple[str, ...]] = {}
+        self._by_key: Dict[str, Set[str]] = {}
+        self._views: Dict[str, Tuple[Any, ...]] = {}
+        self._positions: Dict[str, Dict[str, int]] = {}
+        # Bumped on every change, usable as state versions by readers
+        self.version = 0
+        self._versions: Dict[str, int] = {bucket: 0 for bucket in self.BUCKETS}
+    
+    def __len__(self) -> int:
+        return len(self._by_id)
+    
+    def __contains__(self, download_id: str) -> bool:
+        return download_id in self._by_id
+    
+    def get(self, download_id: str) -> Optional[Any]:
+        """Get a download by id"""
+        return self._by_id.get(download_id)
+    
+    def bucket_of(self, download_id: str) -> Optional[str]:
+        """Get the bucket a download is in"""
+        return self._bucket_of.get(download_id)
+    
+    def count(self, bucket: str) -> int:
+        """Number of downloads in a bucket"""
+        return len(self._buckets[bucket])
+    
+    def view(self, bucket: str) -> Tuple[Any, ...]:
+        """Immutable snapshot of a bucket, rebuilt only after the bucket changed"""
+        view = self._views.get(bucket)
+        if view is None:
+            view = self._views[bucket] = tuple(self._buckets[bucket].values())
+        return view
+    
+    def position(self, bucket: str, download_id: str) -> Optional[int]:
+        """Index of a download in the bucket's view"""
+        positions = self._positions.get(bucket)
+        if positions is None:
+            positions = self._positions[bucket] = {d.id: i for i, d in enumerate(self.view(bucket))}
+        return positions.get(download_id)
+    
+    def bucket_version(self, bucket: str) -> int:
+        """Version of a bucket, bumped whenever it or a download in it changes"""
+        return self._versions[bucket]
+    
+    def find(self, key: str) -> List[Any]:
+        """Get the downloads registered under a URL or video key"""
+        return [self._by_id[i] for i in self._by_key.get(key, ())]
+    
+    def add(self, download: Any, bucket: str, keys: Iterable[str] = ()):
+        """Add a download to the end of a bucket"""
+        if download.id in self._by_id:
+            self.remove(download.id)
+        self._by_id[download.id] = download
+        self._bucket_of[download.id] = bucket
+        self._buckets[bucket][download.id] = download
+        self._keys_of[download.id] = tuple(k for k in keys if k)
+        for key in self._keys_of[download.id]:
+            self._by_key.setdefault(key, set()).add(download.id)
+        self._changed(bucket)
+    
+    def move(self, download_id: str, bucket: str) -> Optional[Any]:
+        """Move a download to the end of another bucket"""
+        download = self._by_id.get(download_id)
+        if download is None:
+            return None
+        old_bucket = self._bucket_of[download_id]
+        del self._buckets[old_bucket][download_id]
+        self._buckets[bucket][download_id] = download
+        self._bucket_of[download_id] = bucket
+        self._changed(old_bucket, bucket)
+        return download
+    
+    def remove(self, download_id: str) -> Optional[Any]:
+        """Remove a download from every index"""
+        download = self._by_id.pop(download_id, None)
+        if download is None:
+            return None
+        bucket = self._bucket_of.pop(download_id)
+        del self._buckets[bucket][download_id]
+        for key in self._keys_of.pop(download_id, ()):
+            ids = self._by_key.get(key)
+            if ids is not None:
+                ids.discard(download_id)
+                if not ids:
+                    del self._by_key[key]
+        self._changed(bucket)
+        return download
+    
+    def clear(self, bucket: str) -> List[Any]:
+        """Remove every download in a bucket and return them"""
+        removed = list(self._buckets[bucket].values())
+        for download in removed:
+            self.remove(download.id)
+        return removed
+    
+    def touch(self, download_id: str):
+        """Record that a download changed in place"""
+        bucket = self._bucket_of.get(download_id)
+        if bucket is not None:
+            self._versions[bucket] += 1
+            self.version += 1
+    
+    def _changed(self, *buckets: str):
+        for bucket in buckets:
+            self._views.pop(bucket, None)
+            self._positions.pop(bucket, None)
+            self._versions[bucket] += 1
+        self.version += 1
\ No newline at end of file
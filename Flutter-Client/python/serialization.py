@@ -0,0 +1,65 @@
+# JSON encoding for the embedded GrabTube server
+# Uses orjson when it is installed and the standard library otherwise; the module itself can be
+# given to python-socketio as its json module
+
+import json
+import re
+import uuid
+from typing import Any, List
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = 'orjson' if orjson is not None else 'json'
+
+# orjson 3.9 embeds encoded JSON as is; otherwise it goes in as a placeholder string replaced afterwards
+_Fragment = getattr(orjson, 'Fragment', None)
+_PLACEHOLDER = f'rawjson-{uuid.uuid4().hex}-'
+_PLACEHOLDER_RE = re.compile(f'"{_PLACEHOLDER}(\\d+)"'.encode())
+
+class RawJSON:
+    """Already encoded JSON, embedded as is wherever it appears in an encoded value"""
+    
+    __slots__ = ('data',)
+    
+    def __init__(self, data: bytes):
+        self.data = data
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Encode to compact UTF-8 JSON"""
+    if isinstance(obj, RawJSON):
+        return obj.data
+    raw: List[bytes] = []
+    
+    def default(value):
+        if not isinstance(value, RawJSON):
+            raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+        if _Fragment is not None:
+            return _Fragment(value.data)
+        raw.append(value.data)
+        return f'{_PLACEHOLDER}{len(raw) - 1}'
+    
+    data = None
+    if orjson is not None:
+        try:
+            data = orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Values orjson rejects (e.g. integers over 64 bits) still encode with the stdlib
+            raw.clear()
+    if data is None:
+        data = json.dumps(obj, separators=(',', ':'), default=default).encode()
+    if raw:
+        data = _PLACEHOLDER_RE.sub(lambda m: raw[int(m.group(1))], data)
+    return data
+
+def dumps(obj: Any, **kwargs) -> str:
+    """Encode to a compact JSON string; extra stdlib arguments such as separators are ignored"""
+    return dumps_bytes(obj).decode()
+
+def loads(data, **kwargs) -> Any:
+    """Decode JSON from str or bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
\ No newline at end of file
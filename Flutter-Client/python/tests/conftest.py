@@ -0,0 +1,19 @@
+# Tests run from Flutter-Client/ with the embedded server importable as the python package
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from python.ytdl import DownloadQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = DownloadQueue(str(tmp_path / 'downloads'), str(tmp_path / 'state'),
+                          max_concurrent_downloads=1)
+    yield queue
+    asyncio.run(queue.close())
@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+from python.bandwidth import MIN_SHARE, BandwidthLimiter
+
+MIB = 1024 * 1024
+
+
+def at(hour, minute=0):
+    """Timestamp of a local time of day"""
+    return time.mktime((2026, 1, 15, hour, minute, 0, 0, 0, -1))
+
+
+def test_unlimited_budget_leaves_downloads_unlimited():
+    limiter = BandwidthLimiter()
+    assert limiter.shares({'a': (MIB, 0.0), 'b': (0.0, 0.0)}) == {'a': 0.0, 'b': 0.0}
+
+
+def test_new_downloads_split_the_budget_equally():
+    limiter = BandwidthLimiter(9 * MIB)
+    assert limiter.shares({'a': (0.0, 0.0), 'b': (0.0, 0.0), 'c': (0.0, 0.0)}) == {
+        'a': 3 * MIB, 'b': 3 * MIB, 'c': 3 * MIB
+    }
+
+
+def test_slow_downloads_leave_their_unused_share_to_the_others():
+    limiter = BandwidthLimiter(9 * MIB)
+    shares = limiter.shares({'slow': (0.4 * MIB, 3 * MIB), 'a': (3 * MIB, 3 * MIB),
+                             'b': (2.9 * MIB, 3 * MIB)})
+    
+    assert shares['slow'] == pytest.approx(0.5 * MIB)
+    assert shares['a'] == shares['b'] == pytest.approx(4.25 * MIB)
+    assert sum(shares.values()) == pytest.approx(9 * MIB)
+
+
+def test_shares_never_drop_below_the_minimum():
+    limiter = BandwidthLimiter(MIN_SHARE)
+    shares = limiter.shares({'a': (0.0, 0.0), 'b': (0.0, 0.0)})
+    assert shares == {'a': MIN_SHARE, 'b': MIN_SHARE}
+
+
+def test_schedule_windows_override_the_limit_and_wrap_midnight():
+    limiter = BandwidthLimiter(10 * MIB, [
+        {'start': '09:00', 'end': '17:00', 'limit': MIB},
+        {'start': '23:00', 'end': '06:00', 'limit': 0}
+    ])
+    
+    assert limiter.current_limit(at(12)) == MIB
+    assert limiter.current_limit(at(17)) == 10 * MIB
+    assert limiter.current_limit(at(23, 30)) == 0
+    assert limiter.current_limit(at(5, 59)) == 0
+    assert limiter.current_limit(at(6)) == 10 * MIB
+
+
+@pytest.mark.parametrize('schedule', [
+    [{'start': '25:00', 'end': '06:00', 'limit': MIB}],
+    [{'start': '01:00', 'end': '06:00', 'limit': -1}],
+    [{'start': '01:00', 'limit': MIB}],
+])
+def test_invalid_schedule_changes_nothing(schedule):
+    limiter = BandwidthLimiter(MIB, [{'start': '09:00', 'end': '17:00', 'limit': 0}])
+    
+    with pytest.raises((ValueError, KeyError)):
+        limiter.configure(2 * MIB, schedule)
+    
+    assert limiter.limit == MIB
+    assert limiter.current_limit(at(12)) == 0
+    assert limiter.schedule == [{'start': '09:00', 'end': '17:00', 'limit': 0}]
@@ -0,0 +1,40 @@
+from python.concurrency import ConcurrencyController
+
+
+def decide(controller, throughput, active, waiting):
+    controller.sample(throughput)
+    return controller.decide(active, waiting, now=0.0)['slots']
+
+
+def test_adds_slots_while_they_pay_off_and_holds_after_stepping_down():
+    controller = ConcurrencyController(initial=2, maximum=4, hold=2)
+    
+    assert decide(controller, 100.0, 2, 5) == 3
+    assert decide(controller, 120.0, 3, 5) == 4
+    # Under 5% more throughput: the last slot goes again
+    assert decide(controller, 121.0, 4, 5) == 3
+    assert decide(controller, 121.0, 3, 5) == 3
+    assert decide(controller, 121.0, 3, 5) == 3
+    assert decide(controller, 121.0, 3, 5) == 4
+
+
+def test_backs_off_on_failures_and_collapse():
+    controller = ConcurrencyController(initial=4, maximum=8)
+    controller.failed()
+    controller.failed()
+    assert decide(controller, 100.0, 4, 0) == 2
+    
+    assert decide(controller, 100.0, 2, 0) == 2
+    assert decide(controller, 40.0, 2, 0) == 1
+    assert decide(controller, 10.0, 1, 0) == 1
+
+
+def test_keeps_the_limit_with_idle_slots_and_records_decisions():
+    controller = ConcurrencyController(initial=3, maximum=8, history=2)
+    
+    for _ in range(3):
+        assert decide(controller, 100.0, 1, 5) == 3
+    stats = controller.stats()
+    assert (stats['limit'], stats['min'], stats['max']) == (3, 1, 8)
+    assert len(stats['decisions']) == 2
+    assert stats['decisions'][-1]['reason'] == 'only 1 of 3 slots in use'
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+from yt_dlp.utils import DownloadError
+
+from python.ytdl import Download, DownloadInfo
+
+
+class YDL:
+    """Records what a job asks yt-dlp to do"""
+    
+    def __init__(self, fail_processing=False):
+        self.params = {}
+        self.calls = []
+        self.fail_processing = fail_processing
+    
+    def sanitize_info(self, info, remove_private_keys=False):
+        return info
+    
+    def process_ie_result(self, info, download=True):
+        self.calls.append(('process', info['id']))
+        if self.fail_processing:
+            raise DownloadError('HTTP Error 403: Forbidden')
+    
+    def extract_info(self, url, extra_info=None):
+        self.calls.append(('extract', url))
+    
+    def download(self, urls):
+        self.calls.append(('download', urls[0]))
+
+
+class Writer:
+    def __init__(self):
+        self.error = None
+    
+    def finish(self):
+        pass
+    
+    def fail(self, error):
+        self.error = error
+
+
+def run(tmp_path, monkeypatch, info_dict, ydl=None):
+    ydl = ydl or YDL()
+    monkeypatch.setattr(Download, '_get_ydl', staticmethod(lambda cache, options, writer: ydl))
+    download_info = DownloadInfo(url='https://example.com/video', title='video')
+    writer = Writer()
+    Download.run_job(Download(download_info, str(tmp_path), {}, info_dict, info_max_age=60).job(),
+                     writer, {})
+    assert writer.error is None
+    return ydl.calls
+
+
+def test_job_downloads_from_fresh_info(tmp_path, monkeypatch):
+    info = {'id': 'video', 'webpage_url': 'https://example.com/video', 'epoch': time.time()}
+    assert run(tmp_path, monkeypatch, info) == [('process', 'video')]
+
+
+@pytest.mark.parametrize('info', [None, {'id': 'video', 'epoch': time.time() - 3600}])
+def test_job_extracts_without_fresh_info(tmp_path, monkeypatch, info):
+    assert run(tmp_path, monkeypatch, info) == [('download', 'https://example.com/video')]
+
+
+def test_job_extracts_again_when_info_went_stale(tmp_path, monkeypatch):
+    info = {'id': 'video', 'webpage_url': 'https://example.com/watch', 'epoch': time.time()}
+    calls = run(tmp_path, monkeypatch, info, YDL(fail_processing=True))
+    assert calls == [('process', 'video'), ('extract', 'https://example.com/watch')]
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+
+def test_extraction_timeout_keeps_the_loop_serving(queue, monkeypatch):
+    monkeypatch.setattr('python.ytdl._extract_info', lambda url, options: time.sleep(0.5))
+    ticks = []
+    
+    async def tick():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+    
+    async def extract():
+        ticker = asyncio.ensure_future(tick())
+        try:
+            with pytest.raises(TimeoutError):
+                await queue._extract('https://example.com/video', timeout=0.1)
+        finally:
+            ticker.cancel()
+    
+    asyncio.run(extract())
+    
+    assert len(ticks) >= 5
+    counts, _ = queue._extract_seconds.series[('timeout',)]
+    assert sum(counts) == 1
+
+
+def test_extractions_run_within_the_worker_limit(queue, monkeypatch):
+    lock = threading.Lock()
+    running = [0, 0]
+    
+    def extract_info(url, options):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return {'id': url, 'title': url}
+    
+    monkeypatch.setattr('python.ytdl._extract_info', extract_info)
+    
+    async def extract_many():
+        return await asyncio.gather(*(queue._extract(f'https://example.com/{i}') for i in range(10)))
+    
+    infos = asyncio.run(extract_many())
+    
+    assert [info['id'] for info in infos] == [f'https://example.com/{i}' for i in range(10)]
+    # The queue fixture keeps the default of 4 extraction workers
+    assert running[1] == 4
+
+
+def test_concurrent_requests_share_one_extraction(queue, monkeypatch):
+    calls = []
+    
+    async def extract(url, timeout=None):
+        calls.append(url)
+        await asyncio.sleep(0.05)
+        return {'id': 'video', 'title': 'video', 'webpage_url': url, 'extractor': 'generic'}
+    
+    monkeypatch.setattr(queue, '_extract', extract)
+    url = 'https://example.com/video'
+    
+    async def resolve():
+        infos = await asyncio.gather(*(queue._resolve_info(url) for _ in range(5)))
+        # Later requests are served from the cache
+        return infos + [await queue._resolve_info(url)]
+    
+    infos = asyncio.run(resolve())
+    
+    assert calls == [url]
+    assert all(info['id'] == 'video' for info in infos)
+    assert not queue._inflight
+
+
+def test_failed_extraction_reaches_every_waiter_and_is_retried(queue, monkeypatch):
+    calls = []
+    
+    async def extract(url, timeout=None):
+        calls.append(url)
+        await asyncio.sleep(0.05)
+        raise RuntimeError('unavailable')
+    
+    monkeypatch.setattr(queue, '_extract', extract)
+    url = 'https://example.com/video'
+    
+    async def resolve():
+        return await asyncio.gather(*(queue._resolve_info(url) for _ in range(3)), return_exceptions=True)
+    
+    assert all(isinstance(e, RuntimeError) for e in asyncio.run(resolve()))
+    assert len(calls) == 1
+    asyncio.run(resolve())
+    assert len(calls) == 2
@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import pytest
+
+from python.ytdl import Download, DownloadInfo
+
+
+def fmt(format_id, ext, vcodec, acodec, height=None, size=1000):
+    return {'format_id': format_id, 'ext': ext, 'vcodec': vcodec, 'acodec': acodec, 'height': height,
+            'filesize': size, 'tbr': size / 100, 'url': f'https://example.com/{format_id}',
+            'protocol': 'https'}
+
+
+AVC = fmt('avc', 'mp4', 'avc1.640028', 'none', 1080, 12000)
+VP9 = fmt('vp9', 'webm', 'vp09.00.40.08', 'none', 1080, 9000)
+AAC = fmt('aac', 'm4a', 'none', 'mp4a.40.2', size=700)
+OPUS = fmt('opus', 'webm', 'none', 'opus', size=500)
+
+
+def info(*formats):
+    return {'id': 'video', 'title': 'video', 'formats': list(formats), 'epoch': time.time()}
+
+
+@pytest.mark.parametrize('formats, container, conversion', [
+    ((AVC, AAC), 'mov', ''),
+    ((VP9, OPUS), 'mkv', 'reencode'),
+])
+def test_plan_merges_into_mov_when_streams_fit(queue, formats, container, conversion):
+    async def resolve_info(url, timeout=None):
+        return info(*formats)
+    queue._resolve_info = resolve_info
+    
+    plan = asyncio.run(queue.plan('https://example.com/video', 'best', 'mov'))
+    
+    assert plan['container'] == container
+    assert plan['conversion'] == conversion
+
+
+def test_job_merges_into_the_planned_container(tmp_path, monkeypatch):
+    merged = []
+    
+    def download_from_info(ydl, info_dict, extra_info=None):
+        merged.append(ydl.params['merge_output_format'])
+    
+    class Writer:
+        def finish(self):
+            pass
+        
+        def fail(self, error):
+            raise AssertionError(error)
+    
+    monkeypatch.setattr(Download, '_apply_limits', staticmethod(lambda ydl, writer: None))
+    monkeypatch.setattr(Download, '_download_from_info', staticmethod(download_from_info))
+    ydl_cache = {}
+    for formats in ((AVC, AAC), (VP9, OPUS)):
+        download_info = DownloadInfo(url='https://example.com/video', title='video', quality='best',
+                                     format='mov')
+        Download.run_job(Download(download_info, str(tmp_path), {}, info(*formats)).job(), Writer(),
+                         ydl_cache)
+    
+    assert merged == ['mov', 'mov/mkv']
+    assert len(ydl_cache) == 1
@@ -0,0 +1,34 @@
+from python.fragments import FragmentTuner, PROBE_AFTER
+
+
+def test_climbs_while_throughput_improves_and_settles_on_the_best_level():
+    tuner = FragmentTuner(initial=2, max_concurrency=16)
+    
+    assert tuner.observe('site', 2, 10.0) == 4
+    assert tuner.observe('site', 4, 20.0) == 8
+    # Under 10% better: back to the best level
+    assert tuner.observe('site', 8, 21.0) == 4
+    assert tuner.stats()['site'] == {'concurrency': 4, 'best_at': 4, 'best_throughput': 20.0}
+
+
+def test_halves_on_throttling_and_probes_again_when_steady():
+    tuner = FragmentTuner(initial=4)
+    tuner.observe('site', 4, 100.0)
+    tuner.observe('site', 8, 100.0)
+    
+    assert tuner.observe('site', 4, 50.0) == 2
+    for _ in range(PROBE_AFTER - 1):
+        assert tuner.observe('site', 2, 50.0) == 2
+    assert tuner.observe('site', 2, 50.0) == 4
+
+
+def test_levels_stay_within_the_limits():
+    tuner = FragmentTuner(initial=8, max_concurrency=8, connection_budget=16)
+    
+    assert tuner.observe('site', 8, 10.0) == 8
+    assert tuner.current('site', 1) == 8
+    assert tuner.current('site', 4) == 4
+    assert tuner.current('site', 32) == 1
+    assert tuner.current('other', 1) == 8
+    # Formats below the best level change nothing
+    assert tuner.observe('site', 2, 1.0) == 8
@@ -0,0 +1,70 @@
+import pytest
+
+from python.governor import SiteGovernor, TokenBucket, site_of
+
+
+@pytest.mark.parametrize('url, key, site', [
+    ('https://www.youtube.com/watch?v=a', 'Youtube:a', 'youtube'),
+    ('https://m.example.com/video', 'url:https://example.com/video', 'example.com'),
+    ('https://cdn.example.com/video.mp4', '', 'cdn.example.com'),
+])
+def test_site_of(url, key, site):
+    assert site_of(url, key) == site
+
+
+def test_token_bucket_bursts_then_paces_reservations_in_order():
+    bucket = TokenBucket(rate=2.0, burst=3)
+    bucket.updated_at = 0.0
+    
+    assert [bucket.reserve(0.0) for _ in range(5)] == [0.0, 0.0, 0.0, 0.5, 1.0]
+    assert not bucket.available(1.0)
+    assert bucket.ready_in(1.0) == pytest.approx(0.5)
+    assert bucket.available(1.5)
+    # Refills never go past the burst
+    assert bucket.available(100.0) and bucket.tokens == 3
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('python.governor.time.monotonic', lambda: now[0])
+    return now
+
+
+def test_site_cap_holds_starts_until_a_download_finishes(clock):
+    governor = SiteGovernor(max_concurrent=2, overrides={'YouTube': {'max_concurrent': 1}})
+    
+    governor.started('example.com')
+    governor.started('example.com')
+    governor.started('youtube')
+    assert not governor.can_start('example.com')
+    assert not governor.can_start('youtube')
+    assert governor.can_start('vimeo')
+    
+    governor.finished('example.com')
+    governor.finished('youtube')
+    assert governor.can_start('example.com') and governor.can_start('youtube')
+    assert governor.stats()['example.com']['active'] == 1
+    assert 'youtube' not in governor.active
+
+
+def test_rate_limit_shares_tokens_between_starts_and_extractions(clock):
+    governor = SiteGovernor(rate=1.0, burst=2)
+    
+    governor.started('example.com')
+    assert governor.reserve_request('example.com') == 0.0
+    assert not governor.can_start('example.com')
+    assert governor.rate_limited_for('example.com') == pytest.approx(1.0)
+    assert governor.reserve_request('example.com') == pytest.approx(1.0)
+    
+    clock[0] += 2.0
+    assert governor.can_start('example.com')
+
+
+def test_no_limits_by_default(clock):
+    governor = SiteGovernor()
+    for _ in range(100):
+        governor.started('example.com')
+        assert governor.reserve_request('example.com') == 0.0
+    assert governor.can_start('example.com')
+    assert governor.rate_limited_for('example.com') == 0.0
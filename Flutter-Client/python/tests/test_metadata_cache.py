@@ -0,0 +1,45 @@
+import asyncio
+import shelve
+import time
+
+from python.metadata_cache import MetadataCache
+
+
+def video(video_id):
+    return {'id': video_id, 'extractor_key': 'Youtube', 'title': video_id}
+
+
+def test_disk_tier_serves_entries_evicted_from_memory(tmp_path):
+    cache = MetadataCache(str(tmp_path), max_entries=1)
+    cache.put(video('a'), 'url:a')
+    cache.put(video('b'), 'url:b')
+    
+    assert cache.peek('Youtube:a') is None
+    assert asyncio.run(cache.get('url:a'))['id'] == 'a'
+    assert cache.disk_hits == 1
+    cache.close()
+
+
+def test_disk_tier_keeps_most_recently_used_entries(tmp_path):
+    cache = MetadataCache(str(tmp_path), max_entries=1, disk_max_entries=3)
+    for video_id in 'abc':
+        cache.put(video(video_id), f'Youtube:{video_id}')
+    # Reading a makes b the least recently used entry
+    assert asyncio.run(cache.get('Youtube:a'))['id'] == 'a'
+    cache.put(video('d'), 'Youtube:d')
+    cache.close()
+    
+    with shelve.open(str(tmp_path / 'metadata_cache.db')) as db:
+        assert sorted(db.keys()) == ['Youtube:a', 'Youtube:c', 'Youtube:d']
+
+
+def test_expired_entries_are_pruned_on_open(tmp_path):
+    with shelve.open(str(tmp_path / 'metadata_cache.db')) as db:
+        db['Youtube:old'] = {'stored_at': time.time() - 100, 'info': video('old')}
+        db['Youtube:new'] = {'stored_at': time.time(), 'info': video('new')}
+    
+    cache = MetadataCache(str(tmp_path), disk_ttl=50)
+    cache.close()
+    
+    with shelve.open(str(tmp_path / 'metadata_cache.db')) as db:
+        assert list(db.keys()) == ['Youtube:new']
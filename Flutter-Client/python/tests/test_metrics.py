@@ -0,0 +1,37 @@
+from python.metrics import MetricsRegistry
+
+
+def test_render_uses_the_text_exposition_format():
+    registry = MetricsRegistry()
+    added = registry.counter('grabtube_added_total', 'Downloads added', labels=('site',))
+    latency = registry.histogram('grabtube_latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    registry.gauge('grabtube_active', 'Active downloads', lambda: {('video',): 2}, labels=('kind',))
+    added.inc('example.com')
+    added.inc('a"b\\c', amount=2)
+    for value in (0.05, 0.1, 0.5, 5.0):
+        latency.observe(value)
+    
+    assert registry.render().splitlines() == [
+        '# HELP grabtube_added_total Downloads added',
+        '# TYPE grabtube_added_total counter',
+        'grabtube_added_total{site="example.com"} 1',
+        'grabtube_added_total{site="a\\"b\\\\c"} 2',
+        '# HELP grabtube_latency_seconds Latency',
+        '# TYPE grabtube_latency_seconds histogram',
+        'grabtube_latency_seconds_bucket{le="0.1"} 2',
+        'grabtube_latency_seconds_bucket{le="1.0"} 3',
+        'grabtube_latency_seconds_bucket{le="+Inf"} 4',
+        'grabtube_latency_seconds_sum 5.65',
+        'grabtube_latency_seconds_count 4',
+        '# HELP grabtube_active Active downloads',
+        '# TYPE grabtube_active gauge',
+        'grabtube_active{kind="video"} 2',
+    ]
+
+
+def test_registering_again_replaces_the_instrument():
+    registry = MetricsRegistry()
+    registry.counter('grabtube_total', 'Old').inc()
+    registry.gauge('grabtube_total', 'New', lambda: 7, kind='counter')
+    
+    assert registry.render() == '# HELP grabtube_total New\n# TYPE grabtube_total counter\ngrabtube_total 7\n'
@@ -0,0 +1,103 @@
+import os
+import shelve
+import time
+
+import pytest
+
+from python.ytdl import PersistentQueue, WriteBehindPersister
+
+
+@pytest.fixture
+def persister(tmp_path):
+    # Only explicit flushes write
+    persister = WriteBehindPersister(PersistentQueue(str(tmp_path)), flush_interval=3600,
+                                     flush_threshold=10 ** 6)
+    yield persister
+    persister.close()
+
+
+def record(download_id, status):
+    return {'id': download_id, 'status': status, 'created_at': time.time()}
+
+
+def stored(persister):
+    return {bucket: [r['id'] for r in records] for bucket, records in persister.load().items()}
+
+
+def test_delete_after_unflushed_move_removes_stored_row(persister):
+    persister.upsert('queue', [record('a', 'downloading')])
+    persister.flush()
+    
+    persister.upsert('done', [record('a', 'finished')])
+    persister.delete(['a'], 'done')
+    persister.flush()
+    
+    assert stored(persister) == {'queue': [], 'done': [], 'pending': []}
+
+
+def test_clear_after_unflushed_move_removes_stored_row(persister):
+    persister.upsert('queue', [record('a', 'downloading'), record('b', 'downloading')])
+    persister.flush()
+    
+    persister.upsert('done', [record('a', 'finished')])
+    persister.clear('done')
+    persister.flush()
+    
+    assert stored(persister) == {'queue': ['b'], 'done': [], 'pending': []}
+
+
+def test_delete_from_other_bucket_keeps_pending_move(persister):
+    persister.upsert('queue', [record('a', 'downloading')])
+    persister.flush()
+    
+    persister.upsert('done', [record('a', 'finished')])
+    persister.delete(['a'], 'queue')
+    persister.flush()
+    
+    assert stored(persister) == {'queue': [], 'done': ['a'], 'pending': []}
+
+
+def test_upsert_after_delete_is_written(persister):
+    persister.upsert('queue', [record('a', 'pending')])
+    persister.delete(['a'])
+    persister.upsert('queue', [record('a', 'pending')])
+    persister.flush()
+    
+    assert stored(persister) == {'queue': ['a'], 'done': [], 'pending': []}
+
+
+def test_store_keeps_bucket_order_and_moves_to_the_end(tmp_path):
+    store = PersistentQueue(str(tmp_path))
+    store.upsert('queue', [record('a', 'pending'), record('b', 'pending')])
+    store.upsert('done', [record('c', 'finished')])
+    store.upsert('done', [record('a', 'finished')])
+    store.upsert('queue', [record('b', 'downloading')])
+    store.close()
+    
+    store = PersistentQueue(str(tmp_path))
+    state = store.load()
+    store.close()
+    assert [r['id'] for r in state['queue']] == ['b']
+    assert state['queue'][0]['status'] == 'downloading'
+    assert [r['id'] for r in state['done']] == ['c', 'a']
+
+
+def test_legacy_shelve_state_is_migrated_once(tmp_path):
+    legacy = str(tmp_path / 'queue.db')
+    with shelve.open(legacy) as db:
+        db['queue'] = [record('a', 'pending')]
+        db['done'] = [record('b', 'finished'), record('c', 'error')]
+    
+    store = PersistentQueue(str(tmp_path))
+    state = store.load()
+    store.close()
+    
+    assert [r['id'] for r in state['queue']] == ['a']
+    assert [r['id'] for r in state['done']] == ['b', 'c']
+    assert not any(name.startswith('queue.db') and not name.endswith('.migrated')
+                   for name in os.listdir(tmp_path))
+    
+    # Opening again imports nothing twice
+    store = PersistentQueue(str(tmp_path))
+    assert sum(len(records) for records in store.load().values()) == 3
+    store.close()
@@ -0,0 +1,50 @@
+import asyncio
+import threading
+
+from python.postprocess import PostProcessPool
+
+
+def test_waiting_jobs_start_highest_priority_first():
+    pool = PostProcessPool(workers=1)
+    gate = threading.Event()
+    order = []
+    
+    async def run():
+        first = asyncio.ensure_future(pool.run(0, gate.wait))
+        await asyncio.sleep(0.01)
+        jobs = [asyncio.ensure_future(pool.run(priority, order.append, priority)) for priority in (0, 5, 1)]
+        await asyncio.sleep(0.01)
+        assert pool.waiting == 3
+        gate.set()
+        await asyncio.gather(first, *jobs)
+    
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+    assert order == [5, 1, 0]
+    assert pool.active == 0
+
+
+def test_cancelled_job_keeps_its_worker_until_it_finishes():
+    pool = PostProcessPool(workers=1)
+    gate = threading.Event()
+    
+    async def run():
+        job = asyncio.ensure_future(pool.run(0, gate.wait))
+        await asyncio.sleep(0.01)
+        job.cancel()
+        await asyncio.sleep(0.01)
+        assert pool.active == 1
+        
+        waiter = asyncio.ensure_future(pool.run(0, lambda: 'done'))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        gate.set()
+        assert await waiter == 'done'
+    
+    try:
+        asyncio.run(run())
+    finally:
+        pool.shutdown()
+    assert pool.active == 0
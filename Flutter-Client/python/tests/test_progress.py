@@ -0,0 +1,81 @@
+import asyncio
+
+from python.dl_formats import get_format_string
+from python.progress import ProgressTable, ProgressWriter, DOWNLOADING, FINISHED
+from python.ytdl import Download, DownloadInfo, _selected_bytes
+
+
+def test_finish_keeps_byte_counts():
+    table = ProgressTable(1)
+    slot = table.acquire()
+    writer = ProgressWriter(table.records, slot)
+    writer.update(500, 1000, 100, 5, '/tmp/video.mp4')
+    writer.update(1000, 1000, 100, 0, '/tmp/video.mp4')
+    writer.finish()
+    
+    record = table.read(slot)
+    assert record['state'] == FINISHED
+    assert record['downloaded_bytes'] == record['total_bytes'] == 1000
+
+
+def test_terminal_record_sets_bytes_when_polls_missed_them(queue):
+    download_info = DownloadInfo(url='https://example.com/video.mp4', title='video')
+    queue.downloads.add(download_info, 'queue')
+    download = Download(download_info, queue.download_dir, {})
+    download.slot = queue.progress_table.acquire()
+    queue.active_downloads[download_info.id] = download
+    
+    # The job ran between two polls, only the terminal record is ever seen
+    writer = ProgressWriter(queue.progress_table.records, download.slot)
+    writer.update(4096, 4096, 0, 0, f'{queue.download_dir}/video.mp4')
+    writer.finish()
+    asyncio.run(queue._finish_download(download))
+    
+    assert download_info.status == 'finished'
+    assert download_info.downloaded_bytes == download_info.filesize == 4096
+    assert download_info.filename == 'video.mp4'
+
+
+def test_progress_record_updates_download(queue):
+    download_info = DownloadInfo(url='https://example.com/video.mp4', title='video')
+    queue._apply_progress(download_info, {
+        'state': DOWNLOADING, 'downloaded_bytes': 256.0, 'total_bytes': 1024.0, 'speed': 128.0,
+        'eta': 6.0, 'filename': f'{queue.download_dir}/video.mp4'
+    })
+    
+    assert download_info.status == 'downloading'
+    assert download_info.progress == 0.25
+    assert download_info.speed == '128.00B/s'
+
+
+def finish_audio_download(queue, downloaded_bytes):
+    formats = [
+        {'format_id': 'video', 'ext': 'mp4', 'vcodec': 'avc1.640028', 'acodec': 'none', 'height': 1080,
+         'filesize': 12000, 'url': 'https://example.com/video', 'protocol': 'https'},
+        {'format_id': 'audio', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a.40.2',
+         'filesize': 700, 'url': 'https://example.com/audio', 'protocol': 'https'}
+    ]
+    info_dict = {'id': 'video', 'title': 'video', 'formats': formats}
+    download_info = DownloadInfo(url='https://example.com/video', title='video', format='m4a')
+    queue.downloads.add(download_info, 'queue')
+    download = Download(download_info, queue.download_dir, {}, info_dict)
+    download.slot = queue.progress_table.acquire()
+    queue.active_downloads[download_info.id] = download
+    
+    writer = ProgressWriter(queue.progress_table.records, download.slot)
+    writer.update(downloaded_bytes, downloaded_bytes, 0, 0, f'{queue.download_dir}/video.m4a')
+    writer.finish()
+    asyncio.run(queue._finish_download(download))
+    return download_info, _selected_bytes(queue._selector(), info_dict, get_format_string())
+
+
+def test_audio_savings_use_fetched_bytes(queue):
+    download_info, video_bytes = finish_audio_download(queue, 700)
+    
+    assert download_info.bytes_saved == queue.audio_bytes_saved == video_bytes - 700
+
+
+def test_audio_savings_skipped_when_size_unknown(queue):
+    download_info, _ = finish_audio_download(queue, 0)
+    
+    assert download_info.bytes_saved == queue.audio_bytes_saved == 0
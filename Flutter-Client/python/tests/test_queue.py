@@ -0,0 +1,216 @@
+import asyncio
+
+import pytest
+
+from python.ytdl import Download, DownloadInfo, DuplicateDownloadError
+
+
+def test_state_version_moves_with_waiting_downloads(queue, monkeypatch):
+    download_info = DownloadInfo(url='https://example.com/video.mp4', title='video')
+    queue.downloads.add(download_info, 'queue')
+    now = 1000.0
+    monkeypatch.setattr('python.ytdl.time.time', lambda: now)
+    
+    queue._enqueue(download_info)
+    version = queue.state_version('queue')
+    assert queue.state_version('queue') == version
+    assert download_info.to_dict()['wait_time'] == 0
+    
+    now += 5
+    assert queue.state_version('queue') != version
+    assert download_info.to_dict()['wait_time'] == 5
+
+
+def test_state_version_stable_without_waiting_downloads(queue, monkeypatch):
+    download_info = DownloadInfo(url='https://example.com/video.mp4', title='video')
+    queue.downloads.add(download_info, 'pending')
+    now = 1000.0
+    monkeypatch.setattr('python.ytdl.time.time', lambda: now)
+    
+    version = queue.state_version()
+    now += 5
+    assert queue.state_version() == version
+
+
+class Notifier:
+    def __init__(self):
+        self.batches = []
+    
+    async def notify_added_batch(self, download_infos):
+        self.batches.append([d.url for d in download_infos])
+    
+    async def notify_updated(self, download_info):
+        pass
+
+
+def fake_playlists(queue, monkeypatch):
+    """Probe 'list' URLs as playlists and anything else as a video, counting the probes"""
+    probes = []
+    monkeypatch.setattr('python.ytdl.is_single_video', lambda url: False)
+    
+    async def probe(url, strict_mode, item_limit):
+        probes.append(url)
+        await asyncio.sleep(0.01)
+        if 'list' in url:
+            return {'_type': 'playlist', 'id': 'list', 'title': 'list'}, object()
+        return {'id': url[-1], 'title': url, 'webpage_url': url, 'extractor': 'generic'}, None
+    
+    async def add_playlist(url, playlist_info, expansion, *args):
+        playlist = DownloadInfo(url=url, title=playlist_info['title'])
+        playlist.group_id = playlist.id
+        queue.downloads.add(playlist, 'pending', queue._index_keys(playlist))
+        return playlist
+    
+    monkeypatch.setattr(queue, '_probe', probe)
+    monkeypatch.setattr(queue, '_add_playlist', add_playlist)
+    return probes
+
+
+def test_add_many_inserts_probed_videos_as_one_batch(queue, monkeypatch):
+    fake_playlists(queue, monkeypatch)
+    
+    async def add(*args, **kwargs):
+        raise AssertionError('add_many must not add URLs one by one')
+    
+    monkeypatch.setattr(queue, 'add', add)
+    queue.notifier = Notifier()
+    urls = ['https://example.com/a', 'https://example.com/list', 'https://example.com/b']
+    
+    results = asyncio.run(queue.add_many(urls, auto_start=False))
+    
+    assert [url for url, _ in results] == urls
+    assert all(isinstance(d, DownloadInfo) for _, d in results)
+    assert [d.url for d in queue.pending] == urls[1:2] + urls[0:1] + urls[2:]
+    assert queue.notifier.batches == [urls]
+
+
+def test_concurrent_adds_share_one_playlist(queue, monkeypatch):
+    probes = fake_playlists(queue, monkeypatch)
+    url = 'https://example.com/list'
+    
+    async def add_twice():
+        return await asyncio.gather(queue.add(url, auto_start=False, duplicate_policy='link'),
+                                    queue.add(url, auto_start=False, duplicate_policy='link'))
+    
+    first, second = asyncio.run(add_twice())
+    assert first is second
+    assert probes == [url]
+
+
+def test_playlist_added_again_follows_the_duplicate_policy(queue, monkeypatch):
+    probes = fake_playlists(queue, monkeypatch)
+    url = 'https://example.com/list'
+    playlist = asyncio.run(queue.add(url, auto_start=False))
+    
+    assert asyncio.run(queue.add(url, auto_start=False, duplicate_policy='link')) is playlist
+    with pytest.raises(DuplicateDownloadError):
+        asyncio.run(queue.add(url, auto_start=False, duplicate_policy='reject'))
+    assert probes == [url]
+    
+    forced = asyncio.run(queue.add(url, auto_start=False, duplicate_policy='force'))
+    assert forced is not playlist
+    assert len(probes) == 2
+
+
+def test_job_downloads_a_single_video(tmp_path, monkeypatch):
+    options = {}
+    
+    def get_ydl(ydl_cache, ydl_options, writer):
+        options.update(ydl_options)
+        raise RuntimeError('stop')
+    
+    class Writer:
+        def fail(self, error):
+            pass
+    
+    monkeypatch.setattr(Download, '_get_ydl', staticmethod(get_ydl))
+    download_info = DownloadInfo(url='https://example.com/watch?v=a&list=b', title='video')
+    download = Download(download_info, str(tmp_path), {'noplaylist': False}, playlist_item_limit=5)
+    Download.run_job(download.job(), Writer(), {})
+    
+    assert options['noplaylist'] is True
+    assert options['playlistend'] == 5
+
+
+def test_admission_follows_priority_then_arrival(queue, monkeypatch):
+    launched = []
+    monkeypatch.setattr(queue, '_has_capacity', lambda: len(launched) < 3)
+    monkeypatch.setattr(queue, '_launch',
+                        lambda download_info, info_dict, site: launched.append(download_info.title))
+    
+    for title, priority in (('a', 0), ('b', 5), ('c', 0), ('d', 0)):
+        download_info = DownloadInfo(url=f'https://example.com/{title}', title=title, priority=priority)
+        queue.downloads.add(download_info, 'queue')
+        queue._enqueue(download_info)
+    queue._schedule()
+    
+    assert launched == ['b', 'a', 'c']
+    assert [d.title for d in queue._waiting.values()] == ['d']
+
+
+def test_failed_launch_moves_to_done(queue, monkeypatch):
+    monkeypatch.setattr(queue.pool, 'submit', lambda job: None)
+    download_info = DownloadInfo(url='https://example.com/video.mp4', title='video')
+    queue.downloads.add(download_info, 'queue')
+    
+    async def start():
+        await queue._start_download(download_info)
+        await asyncio.sleep(0)
+    
+    asyncio.run(start())
+    
+    assert queue.downloads.bucket_of(download_info.id) == 'done'
+    assert download_info.status == 'error'
+    assert download_info.error == 'No idle download worker'
+    assert not queue._waiting
+
+
+def test_start_keeps_the_given_order(queue, monkeypatch):
+    monkeypatch.setattr(queue, '_schedule', lambda info_dicts=None: None)
+    titles = [str(i) for i in range(20)]
+    for title in titles:
+        queue.downloads.add(DownloadInfo(id=title, url=f'https://example.com/{title}', title=title,
+                                         auto_start=False), 'pending')
+    
+    order = titles[::-1]
+    asyncio.run(queue.start(order + order[:3]))
+    
+    assert [d.id for d in queue.queue] == order
+    assert list(queue._waiting) == order
+
+
+def fake_videos(queue, monkeypatch):
+    """Resolve any URL to the same YouTube video, without extracting"""
+    monkeypatch.setattr('python.ytdl.is_single_video', lambda url: True)
+    
+    async def resolve_info(url, timeout=None):
+        return {'id': 'abc', 'title': 'Clip', 'webpage_url': url, 'extractor_key': 'Youtube'}
+    
+    monkeypatch.setattr(queue, '_resolve_info', resolve_info)
+
+
+def test_same_video_under_another_url_follows_the_duplicate_policy(queue, monkeypatch):
+    fake_videos(queue, monkeypatch)
+    first = asyncio.run(queue.add('https://www.youtube.com/watch?v=abc', auto_start=False))
+    
+    other = 'https://youtu.be/abc'
+    assert queue.find_duplicate(DownloadInfo(url=other, video_key='Youtube:abc')) is first
+    assert asyncio.run(queue.add(other, auto_start=False, duplicate_policy='link')) is first
+    with pytest.raises(DuplicateDownloadError):
+        asyncio.run(queue.add(other, auto_start=False, duplicate_policy='reject'))
+    forced = asyncio.run(queue.add(other, auto_start=False, duplicate_policy='force'))
+    assert forced is not first
+    assert len(queue.pending) == 2
+
+
+def test_other_quality_or_missing_file_is_not_a_duplicate(queue, monkeypatch):
+    fake_videos(queue, monkeypatch)
+    url = 'https://www.youtube.com/watch?v=abc'
+    best = asyncio.run(queue.add(url, quality='best', auto_start=False))
+    audio = asyncio.run(queue.add(url, quality='audio', auto_start=False, duplicate_policy='reject'))
+    assert audio is not best
+    
+    queue.downloads.move(best.id, 'done')
+    best.status, best.filename = 'finished', 'Clip.mp4'
+    again = asyncio.run(queue.add(url, quality='best', auto_start=False, duplicate_policy='reject'))
+    assert again is not best
@@ -0,0 +1,59 @@
+from python.queue_index import DownloadIndex
+from python.ytdl import DownloadInfo
+
+
+def download(name):
+    return DownloadInfo(id=name, url=f'https://example.com/{name}', title=name)
+
+
+def ids(index, bucket):
+    return [d.id for d in index.view(bucket)]
+
+
+def test_moves_append_to_the_target_bucket():
+    index = DownloadIndex()
+    for name in 'abc':
+        index.add(download(name), 'pending')
+    
+    index.move('b', 'queue')
+    index.move('a', 'queue')
+    
+    assert ids(index, 'pending') == ['c']
+    assert ids(index, 'queue') == ['b', 'a']
+    assert index.bucket_of('a') == 'queue'
+    assert index.position('queue', 'a') == 1
+    assert index.move('missing', 'queue') is None
+
+
+def test_views_are_cached_until_their_bucket_changes():
+    index = DownloadIndex()
+    index.add(download('a'), 'queue')
+    index.add(download('b'), 'done')
+    queue_view, done_view = index.view('queue'), index.view('done')
+    queue_version = index.bucket_version('queue')
+    
+    index.move('a', 'pending')
+    
+    assert index.view('done') is done_view
+    assert index.view('queue') is not queue_view and not index.view('queue')
+    assert index.bucket_version('queue') > queue_version
+    
+    done_version = index.bucket_version('done')
+    index.touch('b')
+    assert index.view('done') is done_view
+    assert index.bucket_version('done') == done_version + 1
+
+
+def test_keys_follow_adds_and_removes():
+    index = DownloadIndex()
+    index.add(download('a'), 'queue', ['url:x', 'generic:x', ''])
+    index.add(download('b'), 'done', ['url:x'])
+    
+    assert sorted(d.id for d in index.find('url:x')) == ['a', 'b']
+    assert index.remove('a').id == 'a'
+    assert [d.id for d in index.find('url:x')] == ['b']
+    assert index.find('generic:x') == []
+    assert 'a' not in index and len(index) == 1
+    
+    assert [d.id for d in index.clear('done')] == ['b']
+    assert index.find('url:x') == [] and len(index) == 0
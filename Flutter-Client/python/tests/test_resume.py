@@ -0,0 +1,92 @@
+import asyncio
+import os
+import time
+
+from python.ytdl import DownloadInfo, _reconcile_partials
+
+
+def touch(path, age=0.0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * 16)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+
+
+def test_partials_of_dotted_titles_are_kept(tmp_path):
+    kept = [tmp_path / 'Talk v1.2 (Dr. Smith).f137.mp4.part',
+            tmp_path / 'Talk v1.2 (Dr. Smith).f251.webm.part-Frag3',
+            tmp_path / 'list' / 'Clip.f1.mp4.part']
+    orphan = tmp_path / 'Other.mp4.part'
+    for path in kept:
+        touch(str(path), age=3600)
+    touch(str(orphan), age=3600)
+    
+    report = _reconcile_partials([str(tmp_path)], ['Talk v1.2 (Dr. Smith)', 'Clip.f1'], [], 60)
+    
+    assert all(path.exists() for path in kept)
+    assert not orphan.exists()
+    assert (report['kept'], report['removed']) == (3, 1)
+
+
+class Expansion:
+    """Playlist of three entries, extracted instantly"""
+    
+    options = None
+    
+    def __init__(self, url, options):
+        self.url = url
+        Expansion.options = options
+    
+    def start(self, executor):
+        pass
+    
+    def cancel(self):
+        pass
+    
+    async def head(self):
+        return 'playlist', {'id': 'list', 'title': 'list'}
+    
+    async def batches(self):
+        yield [(index, {'_type': 'url', 'url': f'https://example.com/{index}', 'title': str(index)})
+               for index in (1, 2, 3)]
+
+
+def test_resume_continues_unfinished_expansion(queue, monkeypatch):
+    monkeypatch.setattr('python.ytdl.PlaylistExpansion', Expansion)
+    playlist = DownloadInfo(url='https://example.com/list', title='list', auto_start=False,
+                            expanding=True, entries_total=1)
+    playlist.group_id = playlist.id
+    queue.downloads.add(playlist, 'pending')
+    entry = DownloadInfo(url='https://example.com/1', title='1', auto_start=False,
+                         group_id=playlist.id, playlist_index=1)
+    queue.downloads.add(entry, 'pending', [f'group:{playlist.id}'])
+    
+    async def resume():
+        await queue.resume()
+        await queue._expansions[playlist.id][1]
+    
+    asyncio.run(resume())
+    
+    children = queue.downloads.find(f'group:{playlist.id}')
+    assert sorted(c.playlist_index for c in children) == [1, 2, 3]
+    assert playlist.expanding is False
+    assert playlist.entries_total == 3
+
+def test_resume_uses_the_options_the_playlist_was_added_with(queue, monkeypatch):
+    monkeypatch.setattr('python.ytdl.PlaylistExpansion', Expansion)
+    queue.playlist_item_limit = 0
+    saved = DownloadInfo(url='https://example.com/list', title='list', auto_start=False, expanding=True,
+                         playlist_strict_mode=True, playlist_item_limit=3)
+    playlist = DownloadInfo(**saved.to_dict())
+    playlist.group_id = playlist.id
+    queue.downloads.add(playlist, 'pending')
+    
+    async def resume():
+        await queue.resume()
+        await queue._expansions[playlist.id][1]
+    
+    asyncio.run(resume())
+    
+    assert Expansion.options['noplaylist'] is True
+    assert Expansion.options['playlistend'] == 3
@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+import pytest
+
+from python import serialization
+from python.serialization import RawJSON, dumps, dumps_bytes, loads
+from python.ytdl import DownloadInfo, DownloadQueueNotifier
+
+
+@pytest.fixture(params=['orjson', 'placeholder', 'json'])
+def backend(request, monkeypatch):
+    if request.param == 'placeholder':
+        monkeypatch.setattr(serialization, '_Fragment', None)
+    elif request.param == 'json':
+        monkeypatch.setattr(serialization, 'orjson', None)
+    return request.param
+
+
+def test_values_round_trip(backend):
+    value = {'title': 'Café ☕', 'size': 2 ** 70, 'ratio': 0.5, 'tags': [None, True], 1: 'one'}
+    
+    data = dumps_bytes(value)
+    
+    assert b', ' not in data and b': ' not in data
+    assert loads(data) == {'title': 'Café ☕', 'size': 2 ** 70, 'ratio': 0.5, 'tags': [None, True],
+                           '1': 'one'}
+    assert loads(data.decode()) == loads(data)
+    assert dumps(value) == data.decode()
+
+
+def test_raw_json_is_embedded_as_is(backend):
+    payload = ['updated', {'items': [RawJSON(b'{"id":"a"}'), RawJSON(b'[1,2]')], 'count': 2}]
+    assert json.loads(dumps(payload, separators=(',', ':'))) == [
+        'updated', {'items': [{'id': 'a'}, [1, 2]], 'count': 2}
+    ]
+    assert dumps_bytes(RawJSON(b'{"id":"a"}')) == b'{"id":"a"}'
+
+
+def test_unknown_values_are_rejected(backend):
+    with pytest.raises(TypeError):
+        dumps_bytes({'value': object()})
+
+
+def test_download_json_is_cached_until_a_field_changes():
+    download_info = DownloadInfo(url='https://example.com/video.mp4', title='video')
+    data = download_info.to_json()
+    assert download_info.to_json() is data
+    assert loads(data) == download_info.to_dict()
+    
+    download_info.progress = 0.5
+    assert download_info.to_json() is not data
+    assert loads(download_info.to_json())['progress'] == 0.5
+
+
+def test_notifier_emits_cached_json(queue):
+    emitted = []
+    
+    class Server:
+        async def emit(self, event, data, **kwargs):
+            emitted.append((event, dumps_bytes(data)))
+    
+    download_info = DownloadInfo(url='https://example.com/video.mp4', title='video')
+    notifier = DownloadQueueNotifier(queue, Server())
+    asyncio.run(notifier.notify_updated(download_info))
+    asyncio.run(notifier.notify_added_batch([download_info]))
+    
+    assert emitted == [('updated', download_info.to_json()),
+                       ('added_batch', b'[' + download_info.to_json() + b']')]
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from python.main import EmbeddedConfig, EmbeddedServer
+from python.ytdl import DownloadInfo
+
+
+class Queue:
+    """Records the arguments downloads are added with"""
+    
+    def __init__(self):
+        self.calls = []
+    
+    async def add(self, url, **kwargs):
+        self.calls.append(kwargs)
+        return DownloadInfo(url=url, title=url)
+    
+    async def add_many(self, urls, **kwargs):
+        self.calls.append(kwargs)
+        return [(url, DownloadInfo(url=url, title=url)) for url in urls]
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = EmbeddedServer(EmbeddedConfig(str(tmp_path)))
+    server.queue = Queue()
+    return server
+
+
+def request(server, method, path, **kwargs):
+    async def run():
+        async with TestClient(TestServer(server.app)) as client:
+            response = await client.request(method, path, **kwargs)
+            return response.status, await response.read()
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize('value, auto_start', [
+    (None, True), ('true', True), ('1', True), ('false', False), ('0', False), ('False', False)
+])
+def test_add_parses_auto_start(server, value, auto_start):
+    data = {'url': 'https://example.com/video'}
+    if value is not None:
+        data['auto_start'] = value
+    
+    status, _ = request(server, 'POST', '/add', data=data)
+    
+    assert status == 200
+    assert server.queue.calls[0]['auto_start'] is auto_start
+
+
+@pytest.mark.parametrize('body, auto_start', [
+    ({'urls': ['https://example.com/a']}, True),
+    ({'urls': ['https://example.com/a'], 'auto_start': False}, False),
+    ({'urls': ['https://example.com/a'], 'auto_start': 'false'}, False),
+])
+def test_batch_add_parses_auto_start(server, body, auto_start):
+    status, _ = request(server, 'POST', '/add/batch', json=body)
+    
+    assert status == 200
+    assert server.queue.calls[0]['auto_start'] is auto_start
+
+
+def test_batch_add_form_parses_auto_start(server):
+    status, _ = request(server, 'POST', '/add/batch',
+                        data={'urls': 'https://example.com/a\nhttps://example.com/b', 'auto_start': '0'})
+    
+    assert status == 200
+    assert server.queue.calls[0]['auto_start'] is False
+
+
+def test_requests_are_timed_by_route(server):
+    async def run():
+        async with TestClient(TestServer(server.app)) as client:
+            assert (await client.get('/health?probe=1')).status == 200
+            assert (await client.get('/missing')).status == 404
+            response = await client.get('/metrics')
+            return response.status, await response.read()
+    
+    status, body = asyncio.run(run())
+    
+    assert status == 200
+    assert set(server._request_seconds.series) == {('GET', '/health'), ('GET', 'unmatched'), ('GET', '/metrics')}
+    assert 'grabtube_http_request_seconds_count{method="GET",route="/health"} 1' in body.decode()
\ No newline at end of file
@@ -0,0 +1,27 @@
+from python.progress import ProgressTable, FINISHED
+from python.worker_pool import DownloadWorkerPool
+
+
+def run_job(job, writer, ydl_cache):
+    writer.finish()
+
+
+def test_dead_idle_worker_is_reaped_when_its_slot_gets_a_job():
+    table = ProgressTable(1)
+    pool = DownloadWorkerPool(table, run_job)
+    try:
+        pool.prewarm(1)
+        dead = pool._workers[0]
+        dead.process.kill()
+        dead.process.join()
+        
+        slot = pool.submit({'id': 'job'})
+        assert dead.conn.closed
+        assert pool._workers[slot] is not dead
+        
+        worker = pool._workers[slot]
+        assert worker.conn.poll(30)
+        assert pool.reap('result', slot, worker) == slot
+        assert table.read(slot)['state'] == FINISHED
+    finally:
+        pool.close()
@@ -0,0 +1,211 @@
+# Persistent download worker pool for the embedded GrabTube server
+# Workers import yt-dlp once, then run download jobs sent over a pipe until they are recycled
+
+import os
+import sys
+import logging
+import multiprocessing
+import multiprocessing.connection
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Callable, Tuple
+
+from .progress import ProgressTable, ProgressWriter
+
+log = logging.getLogger('worker_pool')
+
+def _rss_mb() -> float:
+    """Resident set size of the current process in MiB, 0 if unknown"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Peak RSS is reported in bytes on macOS and in KiB elsewhere
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+    except (ImportError, OSError):
+        return 0.0
+
+def _worker_main(conn, progress_records, slot: int, runner: Callable, max_jobs: int, max_rss_mb: float):
+    """Worker process loop: run jobs until told to stop or due for recycling"""
+    writer = ProgressWriter(progress_records, slot)
+    # YoutubeDL instances (and their open connections) reused across jobs with the same options
+    ydl_cache: 'OrderedDict[str, Any]' = OrderedDict()
+    jobs = 0
+    try:
+        while True:
+            try:
+                job = conn.recv()
+            except EOFError:
+                break
+            if job is None:
+                break
+            
+            runner(job, writer, ydl_cache)
+            jobs += 1
+            # Tell the parent along with the result whether this worker is about to retire
+            retiring = jobs >= max_jobs or bool(max_rss_mb and _rss_mb() > max_rss_mb)
+            conn.send((job['id'], retiring))
+            if retiring:
+                break
+    finally:
+        for ydl in ydl_cache.values():
+            ydl.close()
+
+def _pool_context(preload: List[str]):
+    """Prefer a forkserver with yt-dlp preloaded so new workers start already warm"""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context('forkserver')
+        ctx.set_forkserver_preload(['yt_dlp', __name__, *preload])
+        return ctx
+    return multiprocessing.get_context('spawn')
+
+class _Worker:
+    """Parent-side handle of one worker process"""
+    
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.busy = False
+
+class DownloadWorkerPool:
+    """Pool of long-lived download worker processes, one per progress table slot"""
+    
+    def __init__(self, progress_table: ProgressTable, runner: Callable, max_jobs: int = 50,
+                 max_rss_mb: float = 512.0):
+        self.progress_table = progress_table
+        self.runner = runner
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self._ctx = _pool_context([runner.__module__])
+        self._workers: Dict[int, _Worker] = {}
+        self._closed = False
+    
+    @property
+    def size(self) -> int:
+        return len(self.progress_table.records)
+    
+    @property
+    def workers(self) -> int:
+        """Number of worker processes started and not yet reaped"""
+        return len(self._workers)
+    
+    @property
+    def idle(self) -> int:
+        """Number of jobs that can be submitted right now"""
+        return self.progress_table.free_slots
+    
+    def prewarm(self, count: int):
+        """Start up to count workers ahead of the first job"""
+        for slot in range(min(count, self.size)):
+            if slot not in self._workers:
+                self._spawn(slot)
+    
+    def submit(self, job: Dict[str, Any]) -> Optional[int]:
+        """Send a job to an idle worker and return its slot, or None if all are busy"""
+        slot = self.progress_table.acquire()
+        if slot is None:
+            return None
+        worker = self._workers.get(slot)
+        if worker is not None and not worker.process.is_alive():
+            # Died while idle: reap it and close its pipe before starting the replacement
+            worker.process.join()
+            worker.conn.close()
+            worker = None
+        if worker is None:
+            worker = self._spawn(slot)
+        worker.busy = True
+        worker.conn.send(job)
+        return slot
+    
+    def cancel(self, slot: int):
+        """Abort the job running in a slot by replacing its worker"""
+        worker = self._workers.pop(slot, None)
+        if worker is not None:
+            worker.process.terminate()
+            worker.process.join()
+            worker.conn.close()
+        self.release(slot)
+        if not self._closed:
+            self._spawn(slot)
+    
+    def release(self, slot: int):
+        """Give a slot back once its final progress record has been read"""
+        self.progress_table.release(slot)
+    
+    def handles(self) -> Dict[Any, Tuple[str, int, _Worker]]:
+        """Waitable handles: result pipes of busy workers and every worker's sentinel"""
+        handles = {}
+        for slot, worker in self._workers.items():
+            if worker.busy:
+                handles[worker.conn] = ('result', slot, worker)
+            handles[worker.process.sentinel] = ('exit', slot, worker)
+        return handles
+    
+    def reap(self, kind: str, slot: int, worker: _Worker) -> Optional[int]:
+        """Handle a ready handle from handles(); returns the slot whose job has ended"""
+        if self._workers.get(slot) is not worker:
+            # Stale handle of a worker that was cancelled or replaced meanwhile
+            return None
+        
+        if kind == 'result':
+            try:
+                _, retiring = worker.conn.recv()
+            except (EOFError, OSError):
+                # Died mid-job, wait for it so it is reaped below
+                worker.process.join(timeout=5)
+            else:
+                worker.busy = False
+                if retiring:
+                    # Replace it now so the slot never gets a job the old worker would drop
+                    self._replace(slot, worker)
+                return slot
+        
+        if worker.process.is_alive():
+            return None
+        
+        self._replace(slot, worker)
+        if worker.process.exitcode:
+            log.warning(f'Download worker {slot} exited with code {worker.process.exitcode}')
+        return slot if worker.busy else None
+    
+    def close(self):
+        """Stop all workers"""
+        self._closed = True
+        for worker in self._workers.values():
+            if worker.busy:
+                worker.process.terminate()
+            else:
+                try:
+                    worker.conn.send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+        for worker in self._workers.values():
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.kill()
+            worker.conn.close()
+        self._workers.clear()
+    
+    def _replace(self, slot: int, worker: _Worker):
+        worker.process.join()
+        worker.conn.close()
+        del self._workers[slot]
+        if not self._closed:
+            self._spawn(slot)
+    
+    def _spawn(self, slot: int) -> _Worker:
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.progress_table.records, slot, self.runner,
+                  self.max_jobs, self.max_rss_mb),
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(process, parent_conn)
+        self._workers[slot] = worker
+        return worker
\ No newline at end of file
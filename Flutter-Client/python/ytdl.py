@@ -3,22 +3,194 @@
 
 import asyncio
 import os
+import re
 import sys
 import time
 import uuid
 import json
+import base64
+import heapq
+import itertools
+import glob
 import shelve
+import sqlite3
+import threading
 import multiprocessing
+import multiprocessing.connection
+import concurrent.futures
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Sequence, Tuple, Callable, Awaitable
 import logging
 
 from yt_dlp import YoutubeDL
+from yt_dlp.utils import DownloadError, format_bytes, formatSeconds, sanitize_filename
+
+from . import serialization
+from .serialization import dumps_bytes, RawJSON
+from .metadata_cache import MetadataCache, cache_key, canonicalize_url, info_key, is_single_video
+from .queue_index import DownloadIndex
+from .progress import ProgressTable, ProgressWriter, IDLE, DOWNLOADING, FINISHED
+from .worker_pool import DownloadWorkerPool
+from .playlist import PlaylistExpansion, entry_url
+from .governor import SiteGovernor, site_of
+from .bandwidth import BandwidthLimiter
+from .fragments import FragmentTuner
+from .concurrency import ConcurrencyController
+from .postprocess import PostProcessPool, run_postprocessors
+from .metrics import MetricsRegistry, Histogram, DURATION_BUCKETS, RATE_BUCKETS
+from .dl_formats import (FORMATS, get_postprocessors, get_format_string, get_merge_output_format,
+                         codec_compatible, is_audio_format, is_video_format)
 
 log = logging.getLogger('ytdl')
 
+def _extract_info(url: str, options: Dict) -> Dict[str, Any]:
+    """Extract video info with yt-dlp (runs inside the extraction executor)"""
+    with YoutubeDL(options) as ydl:
+        info = ydl.extract_info(url, download=False)
+        # Sanitized info is plain JSON data, so it can cross process boundaries
+        return ydl.sanitize_info(info)
+
+def _select_format(ydl: YoutubeDL, info: Dict[str, Any], format_spec: str,
+                   merge_output_format: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    What a format selector picks from extracted info, without downloading: a format, or a
+    merge of requested_formats whose ext is the container yt-dlp would merge into
+    """
+    formats = info.get('formats') or []
+    if not formats:
+        return None
+    # The same context YoutubeDL.process_video_result gives its selector
+    ctx = {
+        'formats': formats,
+        'has_merged_format': any('none' not in (f.get('acodec'), f.get('vcodec')) for f in formats),
+        'incomplete_formats': (all(f.get('vcodec') == 'none' for f in formats) or
+                               all(f.get('acodec') == 'none' for f in formats)),
+    }
+    # Merges read the container preference from the params while selecting
+    previous = ydl.params.get('merge_output_format')
+    ydl.params['merge_output_format'] = merge_output_format
+    try:
+        return next(ydl.build_format_selector(format_spec)(ctx), None)
+    except Exception:
+        return None
+    finally:
+        ydl.params['merge_output_format'] = previous
+
+def _streams(selected: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if selected is None:
+        return []
+    return selected.get('requested_formats') or [selected]
+
+def _merge_output_format(ydl: YoutubeDL, info: Dict[str, Any], format_spec: str,
+                         format_type: Optional[str]) -> Optional[str]:
+    """
+    Container to merge a video format's streams into: the selected one when the codec table
+    says the streams picked from info fit it (yt-dlp only knows this for mp4 and webm), the
+    fallback list of get_merge_output_format otherwise
+    """
+    merge_output_format = get_merge_output_format(format_type)
+    if not merge_output_format:
+        return None
+    streams = _streams(_select_format(ydl, info, format_spec, merge_output_format))
+    if streams and all(codec_compatible(format_type, f.get('vcodec'), f.get('acodec')) for f in streams):
+        return FORMATS['video'][format_type]['ext']
+    return merge_output_format
+
+def _selected_bytes(ydl: YoutubeDL, info: Dict[str, Any], format_spec: str) -> int:
+    """Approximate size of the streams a format selector picks from extracted info, 0 if unknown"""
+    return sum(int(f.get('filesize') or f.get('filesize_approx') or 0)
+               for f in _streams(_select_format(ydl, info, format_spec)))
+
+def _conversion(format_type: str, ext: str, streams: List[Dict[str, Any]]) -> str:
+    """
+    How a video file with the given extension gets into the selected format's container:
+    '' when it already is, 'remux' when its streams fit, 'reencode' otherwise or if unknown
+    """
+    if not is_video_format(format_type) or not ext or ext == FORMATS['video'][format_type]['ext']:
+        return ''
+    if streams and all(codec_compatible(format_type, f.get('vcodec'), f.get('acodec')) for f in streams):
+        return 'remux'
+    return 'reencode'
+
+DUPLICATE_POLICIES = ('reject', 'link', 'force')
+
+class DuplicateDownloadError(Exception):
+    """Raised when adding media that is already queued or downloaded under the reject policy"""
+    
+    def __init__(self, download: 'DownloadInfo'):
+        super().__init__(f'Already added as download {download.id} ({download.status})')
+        self.download = download
+
+def _create_extract_executor(kind: str, workers: int) -> concurrent.futures.Executor:
+    """Create the bounded executor used for metadata extraction"""
+    if kind == 'process':
+        return concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    return concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ytdl-extract')
+
+# yt-dlp's leftovers of an interrupted download: .part files, fragment parts and .ytdl state
+_PARTIAL_SUFFIX = re.compile(r'(\.part(-Frag\d+(\.part)?)?|\.ytdl)$')
+# Format selection suffix of a single-format file (title.f137.mp4)
+_FORMAT_SUFFIX = re.compile(r'\.f[\w-]+$')
+
+def _partial_stem(name: str) -> str:
+    """Title part of a download or partial file name ('a.f137.mp4.part' -> 'a')"""
+    name = _PARTIAL_SUFFIX.sub('', os.path.basename(name))
+    return _FORMAT_SUFFIX.sub('', os.path.splitext(name)[0])
+
+def _partial_matches(name: str, stems: set) -> bool:
+    """Whether a partial file belongs to a stem, also for titles ending like a format suffix"""
+    name = os.path.splitext(_PARTIAL_SUFFIX.sub('', name))[0]
+    return name in stems or _FORMAT_SUFFIX.sub('', name) in stems
+
+def _reconcile_partials(dirs: Sequence[str], stems: Sequence[str], skip: Sequence[str],
+                        max_age: float) -> Dict[str, int]:
+    """
+    Find the partial files under dirs, keeping those that belong to one of the given
+    download stems and deleting the others once they are older than max_age (0 keeps all)
+    """
+    stems = {stem for stem in stems if stem}
+    skip = {os.path.abspath(path) for path in skip}
+    now = time.time()
+    report = {'kept': 0, 'kept_bytes': 0, 'removed': 0, 'removed_bytes': 0}
+    seen = set()
+    for top in dirs:
+        for root, subdirs, files in os.walk(top):
+            # State and hidden directories never hold downloads
+            subdirs[:] = [d for d in subdirs
+                          if not d.startswith('.') and os.path.abspath(os.path.join(root, d)) not in skip]
+            for name in files:
+                path = os.path.abspath(os.path.join(root, name))
+                if path in seen or not _PARTIAL_SUFFIX.search(name):
+                    continue
+                seen.add(path)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if _partial_matches(name, stems):
+                    report['kept'] += 1
+                    report['kept_bytes'] += stat.st_size
+                elif max_age and now - stat.st_mtime > max_age:
+                    try:
+                        os.remove(path)
+                    except OSError as e:
+                        log.error(f'Failed to remove partial file {path}: {e}')
+                        continue
+                    report['removed'] += 1
+                    report['removed_bytes'] += stat.st_size
+    return report
+
 class DownloadInfo:
-    """Download information container"""
+    """Download information container, caches its serialized form until a field changes"""
+    
+    FIELDS = ('id', 'url', 'title', 'status', 'progress', 'speed', 'eta', 'filename', 'filesize',
+              'downloaded_bytes', 'quality', 'format', 'folder', 'auto_start', 'created_at',
+              'completed_at', 'error', 'priority', 'queued_at', 'started_at', 'video_key',
+              'group_id', 'playlist_title', 'playlist_index', 'entries_total', 'entries_done',
+              'entries_failed', 'postprocess_progress', 'bytes_saved', 'conversion', 'expanding',
+              'playlist_strict_mode', 'playlist_item_limit')
+    __slots__ = FIELDS + ('_dirty', '_json')
     
     def __init__(self, **kwargs):
         self.id = kwargs.get('id', str(uuid.uuid4()))
@@ -38,8 +210,48 @@ class DownloadInfo:
         self.created_at = kwargs.get('created_at', time.time())
         self.completed_at = kwargs.get('completed_at', 0)
         self.error = kwargs.get('error', '')
+        self.priority = kwargs.get('priority', 0)
+        self.queued_at = kwargs.get('queued_at', 0)
+        self.started_at = kwargs.get('started_at', 0)
+        self.video_key = kwargs.get('video_key', '')
+        # Playlist entries point at their playlist download through group_id
+        self.group_id = kwargs.get('group_id', '')
+        self.playlist_title = kwargs.get('playlist_title', '')
+        self.playlist_index = kwargs.get('playlist_index', 0)
+        # Set on playlist downloads, which aggregate their entries
+        self.entries_total = kwargs.get('entries_total', 0)
+        self.entries_done = kwargs.get('entries_done', 0)
+        self.entries_failed = kwargs.get('entries_failed', 0)
+        # Entries are still being added; saved so a restart continues the expansion, with the
+        # options the playlist was added with
+        self.expanding = kwargs.get('expanding', False)
+        self.playlist_strict_mode = kwargs.get('playlist_strict_mode', False)
+        self.playlist_item_limit = kwargs.get('playlist_item_limit', 0)
+        # Share of the post-processing steps done, once the download itself has finished
+        self.postprocess_progress = kwargs.get('postprocess_progress', 0.0)
+        # Audio-only downloads: bytes not fetched compared to the default video selection
+        self.bytes_saved = kwargs.get('bytes_saved', 0)
+        # Video merged into another container: 'remux' or 'reencode' into the selected one
+        self.conversion = kwargs.get('conversion', '')
     
-    def to_dict(self):
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name[0] != '_':
+            object.__setattr__(self, '_dirty', True)
+    
+    @property
+    def wait_time(self) -> float:
+        """Seconds spent waiting for a download slot"""
+        if not self.queued_at:
+            return 0.0
+        return max((self.started_at or time.time()) - self.queued_at, 0.0)
+    
+    @property
+    def _waiting(self) -> bool:
+        # wait_time keeps growing while waiting, so nothing can be cached
+        return bool(self.queued_at and not self.started_at)
+    
+    def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary for JSON serialization"""
         return {
             'id': self.id,
@@ -58,48 +270,112 @@ class DownloadInfo:
             'auto_start': self.auto_start,
             'created_at': self.created_at,
             'completed_at': self.completed_at,
-            'error': self.error
+            'error': self.error,
+            'priority': self.priority,
+            'queued_at': self.queued_at,
+            'started_at': self.started_at,
+            'wait_time': self.wait_time,
+            'video_key': self.video_key,
+            'group_id': self.group_id,
+            'playlist_title': self.playlist_title,
+            'playlist_index': self.playlist_index,
+            'entries_total': self.entries_total,
+            'entries_done': self.entries_done,
+            'postprocess_progress': self.postprocess_progress,
+            'bytes_saved': self.bytes_saved,
+            'conversion': self.conversion,
+            'entries_failed': self.entries_failed,
+            'expanding': self.expanding,
+            'playlist_strict_mode': self.playlist_strict_mode,
+            'playlist_item_limit': self.playlist_item_limit
         }
+    
+    def to_json(self) -> bytes:
+        """Serialized to_dict(), reused until a field changes"""
+        if self._waiting:
+            return dumps_bytes(self.to_dict())
+        if self._dirty:
+            self._json = dumps_bytes(self.to_dict())
+            self._dirty = False
+        return self._json
 
 class Download:
-    """Individual download handler"""
+    """Individual download handler, runs as a job on the worker pool"""
     
-    def __init__(self, download_info: DownloadInfo, download_dir: str, ytdl_options: Dict):
+    def __init__(self, download_info: DownloadInfo, download_dir: str, ytdl_options: Dict,
+                 info_dict: Optional[Dict[str, Any]] = None, info_max_age: float = 1800.0,
+                 output_template: str = '%(title)s.%(ext)s',
+                 output_template_playlist: str = '%(playlist_title)s/%(title)s.%(ext)s',
+                 temp_dir: Optional[str] = None, playlist_item_limit: int = 0):
         self.info = download_info
         self.download_dir = download_dir
+        self.temp_dir = temp_dir
         self.ytdl_options = ytdl_options
-        self.process: Optional[multiprocessing.Process] = None
-        self._stop_event = multiprocessing.Event()
-    
-    def start(self):
-        """Start download in separate process"""
-        if self.process and self.process.is_alive():
-            return
-        
-        self._stop_event.clear()
-        self.process = multiprocessing.Process(
-            target=self._download_worker,
-            args=(self.info.to_dict(), self.download_dir, self.ytdl_options)
-        )
-        self.process.start()
+        self.info_dict = info_dict
+        self.info_max_age = info_max_age
+        self.output_template = output_template
+        self.output_template_playlist = output_template_playlist
+        self.playlist_item_limit = playlist_item_limit
+        self.slot: Optional[int] = None
+        self.site = ''
+        self.speed = 0.0
+        self.rate_limit = 0.0
+        self.last_update = 0.0
+        # Fragment concurrency set for the slot, and the fragmented format being measured
+        self.fragmented = False
+        self.fragment_concurrency = 0
+        self.fragment_file = ''
+        self.fragment_used = 0
+        # First and latest (time, bytes) seen of that format
+        self.fragment_first = (0.0, 0.0)
+        self.fragment_last = (0.0, 0.0)
     
-    def stop(self):
-        """Stop download"""
-        if self.process and self.process.is_alive():
-            self.process.terminate()
-            self.process.join()
+    def job(self) -> Dict[str, Any]:
+        """Job payload sent to the worker process"""
+        return {
+            'id': self.info.id,
+            'download_info': self.info.to_dict(),
+            'download_dir': self.download_dir,
+            'temp_dir': self.temp_dir,
+            'ytdl_options': self.ytdl_options,
+            'info_dict': self.info_dict,
+            'info_max_age': self.info_max_age,
+            'output_template': self.output_template,
+            'output_template_playlist': self.output_template_playlist,
+            'playlist_item_limit': self.playlist_item_limit
+        }
     
     @staticmethod
-    def _download_worker(download_info: Dict, download_dir: str, ytdl_options: Dict):
-        """Worker function for download process"""
+    def run_job(job: Dict[str, Any], writer: ProgressWriter, ydl_cache: Dict[str, YoutubeDL]):
+        """Run a download job inside a pool worker"""
+        download_info = job['download_info']
+        download_dir = job['download_dir']
+        info_dict = job['info_dict']
         try:
-            # Setup yt-dlp options
+            # Playlist entries get their playlist's fields for the playlist output template
+            extra_info = {}
+            template = job['output_template']
+            if download_info.get('group_id'):
+                extra_info = {
+                    'playlist': download_info['playlist_title'],
+                    'playlist_title': download_info['playlist_title'],
+                    'playlist_index': download_info['playlist_index']
+                }
+                template = job['output_template_playlist']
+            
+            # Setup yt-dlp options; interrupted downloads continue from their .part files
             options = {
-                'outtmpl': os.path.join(download_dir, '%(title)s.%(ext)s'),
-                'progress_hooks': [lambda d: Download._progress_hook(d, download_info['id'])],
+                'outtmpl': template,
+                'paths': {'home': download_dir},
+                'continuedl': True,
                 'logger': logging.getLogger('yt-dlp'),
-                **ytdl_options
+                **job['ytdl_options'],
+                # Every download is a single video: a playlist attached to its URL is not expanded,
+                # and a URL that turns out to be a playlist anyway stays within the item limit
+                'noplaylist': True
             }
+            if job.get('playlist_item_limit', 0) > 0:
+                options['playlistend'] = job['playlist_item_limit']
             
             # Add format/quality options if specified
             if download_info.get('quality') or download_info.get('format'):
@@ -108,219 +384,1745 @@ class Download:
                     download_info.get('quality'),
                     download_info.get('format')
                 )
+            merge_output_format = get_merge_output_format(download_info.get('format'))
+            if merge_output_format:
+                options['merge_output_format'] = merge_output_format
             
             # Custom folder
             if download_info.get('folder'):
                 folder_path = os.path.join(download_dir, download_info['folder'])
                 os.makedirs(folder_path, exist_ok=True)
-                options['outtmpl'] = os.path.join(folder_path, '%(title)s.%(ext)s')
+                options['paths']['home'] = folder_path
             
-            with YoutubeDL(options) as ydl:
+            # Partial files go to the temp directory, under the same folder as the download
+            temp_dir = job.get('temp_dir')
+            if temp_dir and os.path.abspath(temp_dir) != os.path.abspath(download_dir):
+                options['paths']['temp'] = os.path.join(temp_dir, download_info.get('folder') or '')
+            
+            ydl = Download._get_ydl(ydl_cache, options, writer)
+            fresh = info_dict and time.time() - info_dict.get('epoch', 0) < job['info_max_age']
+            if fresh and is_video_format(download_info.get('format')):
+                # With the info at hand, merge straight into the selected container when it fits
+                merge_output_format = _merge_output_format(ydl, info_dict, options['format'],
+                                                           download_info.get('format'))
+            # Set on every job, the YoutubeDL is shared by jobs with the same options
+            ydl.params['merge_output_format'] = merge_output_format or options.get('merge_output_format')
+            if fresh:
+                Download._download_from_info(ydl, {**extra_info, **info_dict}, extra_info)
+            elif extra_info:
+                ydl.extract_info(download_info['url'], extra_info=extra_info)
+            else:
                 ydl.download([download_info['url']])
-                
+            
+            writer.finish()
+            
         except Exception as e:
             log.error(f'Download worker error: {e}')
+            writer.fail(str(e))
+    
+    @staticmethod
+    def _get_ydl(ydl_cache: Dict[str, YoutubeDL], options: Dict, writer: ProgressWriter,
+                 max_cached: int = 4) -> YoutubeDL:
+        """Reuse the worker's YoutubeDL for identical options so HTTP connections stay open"""
+        key = json.dumps(options, sort_keys=True, default=str)
+        ydl = ydl_cache.pop(key, None)
+        if ydl is None:
+            ydl = YoutubeDL({
+                **options,
+                'progress_hooks': [lambda d: Download._progress_hook(d, writer, ydl)],
+                'postprocessor_hooks': [lambda d: Download._postprocessor_hook(d, writer)]
+            })
+        Download._apply_limits(ydl, writer)
+        ydl_cache[key] = ydl
+        while len(ydl_cache) > max_cached:
+            ydl_cache.pop(next(iter(ydl_cache))).close()
+        return ydl
+    
+    @staticmethod
+    def _download_from_info(ydl: YoutubeDL, info_dict: Dict[str, Any],
+                            extra_info: Optional[Dict[str, Any]] = None):
+        """Download from already extracted info, re-extracting only if it went stale"""
+        try:
+            # Drop results of the metadata pass (selected formats etc.) like --load-info-json does
+            ydl.process_ie_result(ydl.sanitize_info(info_dict, remove_private_keys=True), download=True)
+        except DownloadError as e:
+            # Signed media URLs expire; the page URL gets fresh ones
+            webpage_url = info_dict.get('webpage_url')
+            if not webpage_url:
+                raise
+            log.warning(f'Extracted info failed to download ({e}), re-extracting {webpage_url}')
+            ydl.extract_info(webpage_url, extra_info=extra_info or {})
+    
+    @staticmethod
+    def _apply_limits(ydl: YoutubeDL, writer: ProgressWriter):
+        """Pick up the bandwidth share and fragment concurrency the queue set for this slot"""
+        rate_limit = writer.record.rate_limit or None
+        # The HTTP downloader reads ratelimit from these same params while it runs
+        if ydl.params.get('ratelimit') != rate_limit:
+            ydl.params['ratelimit'] = rate_limit
+        # Fragment downloaders read it when a format starts
+        concurrency = writer.record.fragment_concurrency
+        if concurrency and ydl.params.get('concurrent_fragment_downloads') != concurrency:
+            ydl.params['concurrent_fragment_downloads'] = concurrency
     
     @staticmethod
-    def _progress_hook(d: Dict, download_id: str):
+    def _progress_hook(d: Dict, writer: ProgressWriter, ydl: Optional[YoutubeDL] = None):
         """Progress hook for yt-dlp"""
         try:
-            # Update download info in shared state
-            # This would need to be implemented with proper IPC
-            pass
+            if ydl is not None:
+                Download._apply_limits(ydl, writer)
+            # Update download info in the shared progress table
+            if d['status'] == 'downloading':
+                writer.update(
+                    d.get('downloaded_bytes'),
+                    d.get('total_bytes') or d.get('total_bytes_estimate'),
+                    d.get('speed'),
+                    d.get('eta'),
+                    d.get('filename', ''),
+                    d.get('fragment_count') or 0
+                )
+            elif d['status'] == 'finished':
+                # Also reached without any downloading call, e.g. for a file already on disk
+                total_bytes = d.get('total_bytes') or d.get('downloaded_bytes')
+                writer.update(d.get('downloaded_bytes') or total_bytes, total_bytes, 0, 0,
+                              d.get('filename', ''), d.get('fragment_count') or 0)
         except Exception as e:
             log.error(f'Progress hook error: {e}')
+    
+    @staticmethod
+    def _postprocessor_hook(d: Dict, writer: ProgressWriter):
+        """Postprocessor hook for yt-dlp, tracks the final file after merging/moving"""
+        try:
+            filepath = d.get('info_dict', {}).get('filepath')
+            if d['status'] == 'finished' and filepath:
+                writer.set_filename(filepath)
+        except Exception as e:
+            log.error(f'Postprocessor hook error: {e}')
 
 class PersistentQueue:
-    """Persistent queue using shelve"""
+    """Persistent queue using SQLite in WAL mode, one row per download"""
+    
+    BUCKETS = ('queue', 'done', 'pending')
     
     def __init__(self, state_dir: str):
         self.state_dir = state_dir
         os.makedirs(state_dir, exist_ok=True)
-        self.db_path = os.path.join(state_dir, 'queue.db')
+        self.db_path = os.path.join(state_dir, 'queue.sqlite3')
+        # Whole-state shelve file written by earlier versions
+        self.legacy_db_path = os.path.join(state_dir, 'queue.db')
+        
+        self._conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS downloads (
+                id TEXT PRIMARY KEY,
+                bucket TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                position INTEGER NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS downloads_bucket ON downloads (bucket, position);
+            CREATE INDEX IF NOT EXISTS downloads_status ON downloads (status);
+            CREATE INDEX IF NOT EXISTS downloads_created_at ON downloads (created_at);
+        """)
+        self._position = self._conn.execute('SELECT COALESCE(MAX(position), 0) FROM downloads').fetchone()[0]
+        self._migrate_shelve()
     
     def load(self) -> Dict[str, List[Dict]]:
         """Load queue state"""
+        state = {bucket: [] for bucket in self.BUCKETS}
         try:
-            with shelve.open(self.db_path) as db:
-                return {
-                    'queue': db.get('queue', []),
-                    'done': db.get('done', []),
-                    'pending': db.get('pending', [])
-                }
+            for bucket, data in self._conn.execute('SELECT bucket, data FROM downloads ORDER BY position'):
+                state.setdefault(bucket, []).append(serialization.loads(data))
         except Exception as e:
             log.error(f'Failed to load queue state: {e}')
-            return {'queue': [], 'done': [], 'pending': []}
+        return state
     
-    def save(self, state: Dict[str, List[Dict]]):
-        """Save queue state"""
+    def upsert(self, bucket: str, records: List[Dict]):
+        """Insert or update downloads; a download moved to another bucket goes to its end"""
+        rows = []
+        for record in records:
+            self._position += 1
+            rows.append((record['id'], bucket, record.get('status', ''), record.get('created_at', 0),
+                         self._position, serialization.dumps(record)))
         try:
-            with shelve.open(self.db_path) as db:
-                db['queue'] = state.get('queue', [])
-                db['done'] = state.get('done', [])
-                db['pending'] = state.get('pending', [])
+            with self._conn:
+                self._conn.executemany("""
+                    INSERT INTO downloads (id, bucket, status, created_at, position, data)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (id) DO UPDATE SET
+                        position = CASE WHEN bucket = excluded.bucket THEN position ELSE excluded.position END,
+                        bucket = excluded.bucket,
+                        status = excluded.status,
+                        data = excluded.data
+                """, rows)
         except Exception as e:
             log.error(f'Failed to save queue state: {e}')
+    
+    def delete(self, ids: List[str], bucket: Optional[str] = None):
+        """Delete downloads, optionally only from one bucket"""
+        try:
+            with self._conn:
+                if bucket:
+                    self._conn.executemany('DELETE FROM downloads WHERE id = ? AND bucket = ?',
+                                           [(i, bucket) for i in ids])
+                else:
+                    self._conn.executemany('DELETE FROM downloads WHERE id = ?', [(i,) for i in ids])
+        except Exception as e:
+            log.error(f'Failed to save queue state: {e}')
+    
+    def clear(self, bucket: str):
+        """Delete every download in a bucket"""
+        try:
+            with self._conn:
+                self._conn.execute('DELETE FROM downloads WHERE bucket = ?', (bucket,))
+        except Exception as e:
+            log.error(f'Failed to save queue state: {e}')
+    
+    def sync(self):
+        """Checkpoint the WAL so every committed change is fsynced into the database file"""
+        try:
+            self._conn.execute('PRAGMA wal_checkpoint(FULL)')
+        except Exception as e:
+            log.error(f'Failed to sync queue state: {e}')
+    
+    def close(self):
+        """Close the database"""
+        self._conn.close()
+    
+    def _migrate_shelve(self):
+        """Import the legacy shelve state once, then set the old files aside"""
+        legacy_files = glob.glob(glob.escape(self.legacy_db_path) + '*')
+        if not legacy_files or self._position:
+            return
+        try:
+            with shelve.open(self.legacy_db_path, flag='r') as db:
+                state = {bucket: db.get(bucket, []) for bucket in self.BUCKETS}
+        except Exception as e:
+            log.error(f'Failed to read legacy queue state: {e}')
+            return
+        
+        for bucket in self.BUCKETS:
+            self.upsert(bucket, state[bucket])
+        for path in legacy_files:
+            os.replace(path, path + '.migrated')
+        log.info(f'Migrated {sum(len(v) for v in state.values())} downloads from {self.legacy_db_path}')
+
+class WriteBehindPersister:
+    """Coalesces queue state changes and writes them to a PersistentQueue from a background thread"""
+    
+    def __init__(self, store: PersistentQueue, flush_interval: float = 1.0, flush_threshold: int = 500,
+                 flush_seconds: Optional[Histogram] = None):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        # Observed under the flush lock, flushes that found nothing to write are not timed
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Latest change per download id, in the order they should be written
+        self._upserts: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._deletes: 'OrderedDict[str, Optional[str]]' = OrderedDict()
+        self._clears: List[str] = []
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='queue-persister', daemon=True)
+        self._thread.start()
+    
+    def load(self) -> Dict[str, List[Dict]]:
+        """Load queue state"""
+        return self.store.load()
+    
+    def upsert(self, bucket: str, records: List[Dict]):
+        """Mark downloads dirty; repeated changes to one download are written once"""
+        with self._lock:
+            for record in records:
+                self._deletes.pop(record['id'], None)
+                self._upserts[record['id']] = (bucket, record)
+                self._upserts.move_to_end(record['id'])
+            pending = len(self._upserts)
+        if pending >= self.flush_threshold:
+            self._wakeup.set()
+    
+    def delete(self, ids: List[str], bucket: Optional[str] = None):
+        """Mark downloads deleted"""
+        with self._lock:
+            for download_id in ids:
+                change = self._upserts.get(download_id)
+                if change is not None and bucket in (None, change[0]):
+                    # The dropped upsert may have been a move, its row can still be in another bucket
+                    del self._upserts[download_id]
+                    self._deletes[download_id] = None
+                else:
+                    self._deletes[download_id] = bucket
+    
+    def clear(self, bucket: str):
+        """Mark a whole bucket cleared"""
+        with self._lock:
+            for download_id in [i for i, (b, _) in self._upserts.items() if b == bucket]:
+                del self._upserts[download_id]
+                # Downloads moved into the bucket since the last flush are still stored elsewhere
+                self._deletes[download_id] = None
+            self._clears.append(bucket)
+    
+    def flush(self):
+        """Write all pending changes now"""
+        with self._flush_lock:
+            started = time.perf_counter()
+            with self._lock:
+                upserts, self._upserts = self._upserts, OrderedDict()
+                deletes, self._deletes = self._deletes, OrderedDict()
+                clears, self._clears = self._clears, []
+            
+            # Pending upserts were issued after any clear/delete they survived, so they go last
+            for bucket in clears:
+                self.store.clear(bucket)
+            for bucket in set(deletes.values()):
+                self.store.delete([i for i, b in deletes.items() if b == bucket], bucket)
+            # Keep one write per run of changes to the same bucket so move order is preserved
+            batch: List[Dict] = []
+            batch_bucket = None
+            for bucket, record in upserts.values():
+                if bucket != batch_bucket and batch:
+                    self.store.upsert(batch_bucket, batch)
+                    batch = []
+                batch_bucket = bucket
+                batch.append(record)
+            if batch:
+                self.store.upsert(batch_bucket, batch)
+            if self.flush_seconds is not None and (upserts or deletes or clears):
+                self.flush_seconds.observe(time.perf_counter() - started)
+    
+    def sync(self):
+        """Durability barrier: flush pending changes and fsync them"""
+        self.flush()
+        with self._flush_lock:
+            self.store.sync()
+    
+    def close(self):
+        """Flush pending changes and close the store"""
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+        self.store.close()
+    
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                log.error(f'Failed to flush queue state: {e}')
 
 class DownloadQueue:
     """Download queue manager"""
     
     def __init__(self, download_dir: str, state_dir: str, download_mode: str = 'limited', 
-                 max_concurrent_downloads: int = 3):
+                 max_concurrent_downloads: int = 3, extract_executor: str = 'thread',
+                 extract_workers: int = 4, extract_timeout: float = 60.0,
+                 metadata_cache_size: int = 256, metadata_cache_ttl: float = 1800.0,
+                 metadata_cache_disk_ttl: float = 21600.0, metadata_cache_disk_entries: int = 4096,
+                 info_max_age: float = 1800.0,
+                 progress_interval: float = 0.5, progress_slots: int = 64,
+                 worker_max_jobs: int = 50, worker_max_rss_mb: float = 512.0,
+                 persist_flush_interval: float = 1.0, persist_flush_threshold: int = 500,
+                 batch_add_concurrency: int = 8, output_template: str = '%(title)s.%(ext)s',
+                 output_template_playlist: str = '%(playlist_title)s/%(title)s.%(ext)s',
+                 playlist_strict_mode: bool = False, playlist_item_limit: int = 0,
+                 site_max_concurrent: int = 0, site_request_rate: float = 0.0,
+                 site_request_burst: float = 1.0, site_limits: Optional[Dict[str, Dict]] = None,
+                 bandwidth_limit: float = 0, bandwidth_schedule: Optional[List[Dict]] = None,
+                 bandwidth_rebalance_interval: float = 2.0, temp_dir: Optional[str] = None,
+                 partial_max_age: float = 604800.0, duplicate_policy: str = 'link',
+                 fragment_concurrency_adaptive: bool = True, fragment_concurrency_initial: int = 2,
+                 fragment_concurrency_max: int = 16, fragment_connection_budget: int = 32,
+                 adaptive_concurrency: bool = False, adaptive_concurrency_min: int = 1,
+                 adaptive_concurrency_max: int = 8, adaptive_concurrency_interval: float = 10.0,
+                 postprocess_workers: int = 0, metrics: Optional[MetricsRegistry] = None):
         self.download_dir = download_dir
         self.state_dir = state_dir
+        self.temp_dir = temp_dir or download_dir
+        self.partial_max_age = partial_max_age
         self.download_mode = download_mode
         self.max_concurrent_downloads = max_concurrent_downloads
-        self.persistent_queue = PersistentQueue(state_dir)
+        self.extract_timeout = extract_timeout
+        self._extract_executor = _create_extract_executor(extract_executor, extract_workers)
+        self.metadata_cache = MetadataCache(state_dir, metadata_cache_size, metadata_cache_ttl,
+                                            metadata_cache_disk_ttl, metadata_cache_disk_entries)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.info_max_age = info_max_age
+        self.batch_add_concurrency = batch_add_concurrency
+        self.output_template = output_template
+        self.output_template_playlist = output_template_playlist
+        self.playlist_strict_mode = playlist_strict_mode
+        self.playlist_item_limit = playlist_item_limit
+        self.duplicate_policy = self._duplicate_policy(duplicate_policy)
+        # Expansions hand entries back to the event loop, so they always run on threads
+        self._expand_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=extract_workers, thread_name_prefix='ytdl-playlist'
+        )
+        self._expansions: Dict[str, Tuple[PlaylistExpansion, asyncio.Task]] = {}
+        
+        # Hot paths record into histograms; depths and worker counts are read when scraped
+        self.metrics = metrics or MetricsRegistry()
+        self._register_metrics()
+        self.persistent_queue = WriteBehindPersister(PersistentQueue(state_dir), persist_flush_interval,
+                                                     persist_flush_threshold, self._flush_seconds)
         
         # Load state
         state = self.persistent_queue.load()
-        self.queue: List[DownloadInfo] = [DownloadInfo(**d) for d in state.get('queue', [])]
-        self.done: List[DownloadInfo] = [DownloadInfo(**d) for d in state.get('done', [])]
-        self.pending: List[DownloadInfo] = [DownloadInfo(**d) for d in state.get('pending', [])]
+        self.downloads = DownloadIndex()
+        for bucket in DownloadIndex.BUCKETS:
+            for d in state.get(bucket, []):
+                download_info = DownloadInfo(**d)
+                self.downloads.add(download_info, bucket, self._index_keys(download_info))
         
         self.active_downloads: Dict[str, Download] = {}
         self.ytdl_options = {}
+        self.notifier: Optional['DownloadQueueNotifier'] = None
+        
+        # In limited mode the slot count can follow throughput instead of staying fixed
+        self.concurrency: Optional[ConcurrencyController] = None
+        if adaptive_concurrency and download_mode == 'limited':
+            self.concurrency = ConcurrencyController(adaptive_concurrency_min, adaptive_concurrency_max,
+                                                     max_concurrent_downloads)
+            self.max_concurrent_downloads = self.concurrency.limit
+        self.concurrency_interval = adaptive_concurrency_interval
+        self._concurrency_at = time.monotonic()
+        
+        # Worker progress, one shared-memory record per download slot
+        self.progress_interval = progress_interval
+        if self.concurrency is not None:
+            slots = self.concurrency.maximum
+        else:
+            slots = max_concurrent_downloads if download_mode == 'limited' else progress_slots
+        self.progress_table = ProgressTable(slots)
+        self._progress_task: Optional[asyncio.Task] = None
+        
+        # Total bandwidth, split over active downloads as per-worker rate limits
+        self.bandwidth = BandwidthLimiter(bandwidth_limit, bandwidth_schedule)
+        self.bandwidth_rebalance_interval = bandwidth_rebalance_interval
+        self._rebalanced_at = 0.0
+        
+        # Parallel fragment fetches of HLS/DASH downloads, learned per site
+        self.fragments = FragmentTuner(fragment_concurrency_initial, fragment_concurrency_max,
+                                       fragment_connection_budget) if fragment_concurrency_adaptive else None
+        
+        # Conversions run after the download slot is freed, on a pool sized by CPU cores
+        self.postprocess_pool = PostProcessPool(postprocess_workers)
+        self._postprocessing: Dict[str, asyncio.Task] = {}
+        # Audio-only downloads skip video streams; the bandwidth that saved is tallied here
+        self.audio_bytes_saved = 0
+        self._selector_ydl: Optional[YoutubeDL] = None
+        
+        # Long-lived workers, one per progress slot, started ahead of the first download
+        self.pool = DownloadWorkerPool(self.progress_table, Download.run_job,
+                                       worker_max_jobs, worker_max_rss_mb)
+        self.pool.prewarm(self.max_concurrent_downloads)
+        
+        # Admission: queued downloads wait in a priority/FIFO line per site for a free slot
+        # their site also allows; sites share concurrency and request budgets with extraction
+        self.governor = SiteGovernor(site_max_concurrent, site_request_rate, site_request_burst,
+                                     site_limits)
+        self._waiting: Dict[str, DownloadInfo] = {}
+        self._waiting_lines: Dict[str, List[tuple]] = {}
+        self._waiting_seq = itertools.count()
+        self._schedule_timer: Optional[asyncio.TimerHandle] = None
+        # Job results and worker exits are watched through pipes and sentinels,
+        # the wake pipe interrupts the watcher when new jobs start
+        self._wake_reader, self._wake_writer = multiprocessing.Pipe(duplex=False)
+        self._watch_task: Optional[asyncio.Task] = None
         
         # Ensure download directory exists
         os.makedirs(download_dir, exist_ok=True)
     
     async def add(self, url: str, quality: Optional[str] = None, format: Optional[str] = None,
-                  folder: Optional[str] = None, auto_start: bool = True) -> DownloadInfo:
-        """Add a new download"""
+                  folder: Optional[str] = None, auto_start: bool = True, priority: int = 0,
+                  playlist_strict_mode: Optional[bool] = None,
+                  playlist_item_limit: Optional[int] = None,
+                  duplicate_policy: Optional[str] = None) -> DownloadInfo:
+        """
+        Add a new download; playlists are added as a group that fills in as entries arrive.
+        Media already queued or downloaded in the same quality and format is rejected, linked
+        to (the existing download is returned) or added again, as the duplicate policy says
+        """
         try:
-            # Get video info first
-            video_info = await self.get_video_info(url)
+            policy = self._duplicate_policy(duplicate_policy)
+            # The same URL again is caught before any extraction
+            existing = self._check_duplicate(self._find_same_url(url, quality, format), policy)
+            if existing is not None:
+                return existing
             
-            download_info = DownloadInfo(
-                url=url,
-                title=video_info.get('title', 'Unknown'),
-                quality=quality,
-                format=format,
-                folder=folder,
-                auto_start=auto_start
-            )
-            
-            if auto_start:
-                self.queue.append(download_info)
+            loop = asyncio.get_running_loop()
+            if await loop.run_in_executor(None, is_single_video, url):
+                # Get video info first; the download reuses it instead of extracting again
+                video_info = await self._resolve_info(url)
             else:
-                self.pending.append(download_info)
+                kind, video_info = await self._resolve_url(
+                    url, quality, format, folder, auto_start, priority,
+                    self.playlist_strict_mode if playlist_strict_mode is None else playlist_strict_mode,
+                    self.playlist_item_limit if playlist_item_limit is None else playlist_item_limit,
+                    policy
+                )
+                if kind != 'video':
+                    return video_info
             
-            self._save_state()
+            download_info = self._new_download(url, video_info, quality, format, folder,
+                                               auto_start, priority)
+            existing = self._check_duplicate(self.find_duplicate(download_info), policy)
+            if existing is not None:
+                return existing
+            
+            bucket = 'queue' if auto_start else 'pending'
+            self.downloads.add(download_info, bucket, self._index_keys(download_info))
+            
+            self._save_state(bucket, download_info)
             
             if auto_start:
-                await self._start_download(download_info)
+                await self._start_download(download_info, video_info)
             
             return download_info
             
+        except DuplicateDownloadError:
+            raise
         except Exception as e:
             log.error(f'Failed to add download: {e}')
             raise
     
-    async def get_queue(self) -> List[DownloadInfo]:
+    async def add_many(self, urls: Sequence[str], quality: Optional[str] = None,
+                       format: Optional[str] = None, folder: Optional[str] = None,
+                       auto_start: bool = True, priority: int = 0,
+                       duplicate_policy: Optional[str] = None) -> List[Tuple[str, Any]]:
+        """
+        Add many downloads at once: metadata is resolved concurrently, the new downloads are
+        saved and announced together; playlists are added as groups that fill in on their own.
+        Returns (url, DownloadInfo or exception) per URL, in order
+        """
+        policy = self._duplicate_policy(duplicate_policy)
+        semaphore = asyncio.Semaphore(max(self.batch_add_concurrency, 1))
+        playlists = set()
+        
+        async def resolve(url: str) -> Any:
+            async with semaphore:
+                existing = self._check_duplicate(self._find_same_url(url, quality, format), policy)
+                if existing is not None:
+                    return existing
+                if await asyncio.get_running_loop().run_in_executor(None, is_single_video, url):
+                    return await self._resolve_info(url)
+                kind, video_info = await self._resolve_url(url, quality, format, folder, auto_start,
+                                                           priority, self.playlist_strict_mode,
+                                                           self.playlist_item_limit, policy)
+                if kind == 'playlist':
+                    playlists.add(video_info.id)
+                return video_info
+        
+        resolved = await asyncio.gather(*(resolve(url) for url in urls), return_exceptions=True)
+        
+        bucket = 'queue' if auto_start else 'pending'
+        results: List[Tuple[str, Any]] = []
+        added: List[DownloadInfo] = []
+        announced: List[DownloadInfo] = []
+        info_dicts: Dict[str, Dict[str, Any]] = {}
+        for url, video_info in zip(urls, resolved):
+            if isinstance(video_info, BaseException):
+                log.error(f'Failed to add download {url}: {video_info}')
+                results.append((url, video_info))
+                continue
+            if isinstance(video_info, DownloadInfo):
+                results.append((url, video_info))
+                if video_info.id in playlists:
+                    announced.append(video_info)
+                continue
+            download_info = self._new_download(url, video_info, quality, format, folder,
+                                               auto_start, priority)
+            # Also catches the same media given twice in one batch
+            try:
+                existing = self._check_duplicate(self.find_duplicate(download_info), policy)
+            except DuplicateDownloadError as e:
+                results.append((url, e))
+                continue
+            if existing is not None:
+                results.append((url, existing))
+                continue
+            self.downloads.add(download_info, bucket, self._index_keys(download_info))
+            results.append((url, download_info))
+            added.append(download_info)
+            announced.append(download_info)
+            info_dicts[download_info.id] = video_info
+        
+        if added:
+            self._save_state(bucket, *added)
+            if auto_start:
+                for download_info in added:
+                    self._enqueue(download_info)
+                self._schedule(info_dicts)
+        if announced and self.notifier:
+            await self.notifier.notify_added_batch(announced)
+        
+        log.info(f'Added {len(announced)} of {len(urls)} downloads')
+        return results
+    
+    @property
+    def queue(self) -> Sequence[DownloadInfo]:
+        return self.downloads.view('queue')
+    
+    @property
+    def done(self) -> Sequence[DownloadInfo]:
+        return self.downloads.view('done')
+    
+    @property
+    def pending(self) -> Sequence[DownloadInfo]:
+        return self.downloads.view('pending')
+    
+    async def get_queue(self) -> Sequence[DownloadInfo]:
         """Get download queue"""
-        return self.queue.copy()
+        return self.queue
     
-    async def get_done(self) -> List[DownloadInfo]:
+    async def get_done(self) -> Sequence[DownloadInfo]:
         """Get completed downloads"""
-        return self.done.copy()
+        return self.done
     
-    async def get_pending(self) -> List[DownloadInfo]:
+    async def get_pending(self) -> Sequence[DownloadInfo]:
         """Get pending downloads"""
-        return self.pending.copy()
+        return self.pending
     
-    async def get_history(self) -> List[DownloadInfo]:
+    async def get_history(self) -> Sequence[DownloadInfo]:
         """Get download history"""
-        return self.done.copy()
+        return self.done
+    
+    async def list_downloads(self, bucket: str, status: Optional[Sequence[str]] = None,
+                             folder: Optional[str] = None, since: Optional[float] = None,
+                             until: Optional[float] = None, order: str = 'asc',
+                             cursor: Optional[str] = None, limit: Optional[int] = None):
+        """
+        Get a filtered page of a bucket and the cursor of the next page (None on the last page);
+        since/until filter on created_at
+        """
+        view = self.downloads.view(bucket)
+        step = -1 if order == 'desc' else 1
+        index = 0 if step == 1 else len(view) - 1
+        if cursor:
+            index = self._cursor_start(bucket, cursor, step)
+        
+        page: List[DownloadInfo] = []
+        while 0 <= index < len(view):
+            d = view[index]
+            if ((not status or d.status in status) and
+                    (folder is None or (d.folder or '') == folder) and
+                    (since is None or d.created_at >= since) and
+                    (until is None or d.created_at < until)):
+                if limit is not None and len(page) == limit:
+                    # There is at least one more match, continue after the last returned item
+                    return page, self._make_cursor(bucket, page[-1])
+                page.append(d)
+            index += step
+        return page, None
+    
+    def state_version(self, *buckets: str) -> str:
+        """Opaque version of the given buckets, changes whenever their contents change"""
+        buckets = buckets or DownloadIndex.BUCKETS
+        version = '.'.join(str(self.downloads.bucket_version(b)) for b in buckets)
+        if any(self.downloads.bucket_of(i) in buckets for i in self._waiting):
+            # wait_time of waiting downloads grows without a change being recorded, so the
+            # version also moves with the clock, once a second
+            version += f'.w{int(time.time())}'
+        return version
+    
+    def _make_cursor(self, bucket: str, download_info: DownloadInfo) -> str:
+        position = self.downloads.position(bucket, download_info.id)
+        return base64.urlsafe_b64encode(f'{position}:{download_info.id}'.encode()).decode()
+    
+    def _cursor_start(self, bucket: str, cursor: str, step: int) -> int:
+        """Position the page after a cursor starts at"""
+        try:
+            position, download_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(':', 1)
+            position = int(position)
+        except ValueError:
+            raise ValueError(f'Invalid cursor: {cursor}')
+        current = self.downloads.position(bucket, download_id)
+        if current is not None:
+            return current + step
+        # The item is gone and everything after it moved up one place
+        return position if step == 1 else position - 1
+    
+    def get_download(self, download_id: str) -> Optional[DownloadInfo]:
+        """Get a download by id"""
+        return self.downloads.get(download_id)
+    
+    def find_downloads(self, url: str) -> List[DownloadInfo]:
+        """Get downloads of a URL, matching by video key when the URL has been seen before"""
+        matches = {d.id: d for d in self.downloads.find(canonicalize_url(url))}
+        for download_info in list(matches.values()):
+            if download_info.video_key:
+                matches.update((d.id, d) for d in self.downloads.find(download_info.video_key))
+        return list(matches.values())
+    
+    def find_duplicate(self, download_info: DownloadInfo) -> Optional[DownloadInfo]:
+        """Another download of the same media, quality and format that is queued, pending or downloaded"""
+        key = self._dedup_key(download_info)
+        if not key:
+            return None
+        for existing in self.downloads.find(key):
+            if existing.id != download_info.id and self._is_live(existing):
+                return existing
+        return None
+    
+    def _find_same_url(self, url: str, quality: Optional[str],
+                       format: Optional[str]) -> Optional[DownloadInfo]:
+        """
+        A live download of the same URL, quality and format, found without extracting; for a
+        playlist URL, its playlist download
+        """
+        for existing in self.downloads.find(canonicalize_url(url)):
+            if ((existing.quality or '') == (quality or '') and
+                    (existing.format or '') == (format or '') and self._is_live(existing)):
+                return existing
+        return None
+    
+    def _is_live(self, download_info: DownloadInfo) -> bool:
+        """Whether a download still stands for its media; failed ones and deleted files do not"""
+        if self.downloads.bucket_of(download_info.id) != 'done':
+            return True
+        if download_info.status != 'finished':
+            return False
+        return not download_info.filename or os.path.exists(
+            os.path.join(self.download_dir, download_info.filename)
+        )
+    
+    def _check_duplicate(self, existing: Optional[DownloadInfo], policy: str) -> Optional[DownloadInfo]:
+        """Apply a duplicate policy; returns the download to link to, if any"""
+        if existing is None or policy == 'force':
+            return None
+        if policy == 'reject':
+            raise DuplicateDownloadError(existing)
+        log.info(f'Linking duplicate of {existing.url} to download {existing.id}')
+        return existing
+    
+    def _duplicate_policy(self, policy: Optional[str]) -> str:
+        if policy is None:
+            return self.duplicate_policy
+        if policy not in DUPLICATE_POLICIES:
+            raise ValueError(f'Invalid duplicate policy: {policy}')
+        return policy
     
     async def delete(self, ids: List[str], where: str = 'queue'):
         """Delete downloads"""
-        target_list = getattr(self, where, self.queue)
-        
-        # Remove from target list
-        setattr(self, where, [d for d in target_list if d.id not in ids])
+        if where not in DownloadIndex.BUCKETS:
+            where = 'queue'
+        ids = {i for i in ids if self.downloads.bucket_of(i) == where}
+        # Deleting a playlist stops its expansion and takes its entries in the same list along
+        for download_id in list(ids):
+            expansion = self._expansions.pop(download_id, None)
+            if expansion is not None:
+                expansion[0].cancel()
+                expansion[1].cancel()
+            ids.update(d.id for d in self.downloads.find(f'group:{download_id}')
+                       if self.downloads.bucket_of(d.id) == where)
         
         # Stop active downloads
+        playlists = {}
         for download_id in ids:
+            download_info = self.downloads.remove(download_id)
+            self._waiting.pop(download_id, None)
             if download_id in self.active_downloads:
-                self.active_downloads[download_id].stop()
-                del self.active_downloads[download_id]
+                download = self.active_downloads.pop(download_id)
+                self.pool.cancel(download.slot)
+                self.governor.finished(download.site)
+            task = self._postprocessing.pop(download_id, None)
+            if task is not None:
+                task.cancel()
+            # An entry that will never end no longer counts towards its playlist
+            playlist = self._playlist_of(download_info)
+            if playlist is not None and where != 'done':
+                playlist.entries_total -= 1
+                playlists[playlist.id] = playlist
         
-        self._save_state()
+        self.persistent_queue.delete(list(ids), where)
+        self._rebalance()
+        self._schedule()
+        for playlist in playlists.values():
+            await self._update_group(playlist, save=True)
     
     async def start(self, ids: List[str]):
-        """Start pending downloads"""
-        for download_info in self.pending:
-            if download_info.id in ids:
-                self.pending.remove(download_info)
-                self.queue.append(download_info)
+        """Start pending downloads, in the order given"""
+        # An ordered set: downloads enter the queue in the caller's order
+        ids = dict.fromkeys(ids)
+        for download_id in list(ids):
+            download_info = self.downloads.get(download_id)
+            if download_info is not None and download_info.group_id == download_id:
+                # Starting a playlist starts its entries, including those still to come
+                download_info.auto_start = True
+                download_info.status = 'preparing'
+                entries = sorted(self.downloads.find(f'group:{download_id}'), key=lambda d: d.playlist_index)
+                ids.update(dict.fromkeys(d.id for d in entries))
+        
+        started = [self.downloads.move(i, 'queue') for i in ids
+                   if self.downloads.bucket_of(i) == 'pending']
+        for download_info in started:
+            if download_info.group_id != download_info.id:
                 await self._start_download(download_info)
         
-        self._save_state()
+        self._save_state('queue', *started)
     
     async def clear_completed(self):
         """Clear completed downloads"""
-        self.done.clear()
-        self._save_state()
+        self.downloads.clear('done')
+        self.persistent_queue.clear('done')
     
-    async def get_video_info(self, url: str) -> Dict[str, Any]:
+    async def sync(self):
+        """Wait until every queue change so far is on disk"""
+        await asyncio.get_running_loop().run_in_executor(None, self.persistent_queue.sync)
+    
+    async def resume(self) -> Dict[str, int]:
+        """
+        Restart the downloads a previous run left in the queue. Their partial files are kept
+        so yt-dlp continues them; partial files no queued download owns are removed once
+        they are older than partial_max_age
+        """
+        entries = [d for d in self.queue if d.group_id != d.id]
+        playlists = [d for d in self.queue if d.group_id and d.group_id == d.id]
+        # Downloads that never reported a file name fall back to their default file name, the
+        # whole title: dots in it are not an extension
+        stems = [_partial_stem(d.filename) if d.filename else sanitize_filename(d.title) for d in self.queue]
+        stems += [_partial_stem(d.filename) for d in self.pending if d.filename]
+        dirs = [self.download_dir] if self.temp_dir == self.download_dir else [self.download_dir, self.temp_dir]
+        report = await asyncio.get_running_loop().run_in_executor(
+            None, _reconcile_partials, dirs, stems, [self.state_dir], self.partial_max_age
+        )
+        
+        for download_info in entries:
+            postprocessors = get_postprocessors(download_info.format, download_info.conversion)
+            if (download_info.status in ('downloaded', 'processing') and postprocessors and
+                    download_info.filename and os.path.exists(os.path.join(self.download_dir, download_info.filename))):
+                # Only the conversion was interrupted
+                download_info.status = 'downloaded'
+                self._postprocessing[download_info.id] = asyncio.ensure_future(
+                    self._postprocess(download_info, postprocessors)
+                )
+                continue
+            download_info.status = 'pending'
+            download_info.speed = ''
+            download_info.eta = ''
+            self._enqueue(download_info)
+        self._save_state('queue', *entries)
+        
+        # Playlists whose expansion was cut short continue it, the others complete with the
+        # entries they already have
+        for playlist in self.queue + self.pending:
+            if playlist.expanding and playlist.group_id == playlist.id:
+                self._resume_expansion(playlist)
+        for playlist in playlists:
+            children = self.downloads.find(f'group:{playlist.id}')
+            ended = [c for c in children if self.downloads.bucket_of(c.id) == 'done']
+            playlist.entries_total = len(children)
+            playlist.entries_done = sum(1 for c in ended if c.status == 'finished')
+            playlist.entries_failed = len(ended) - playlist.entries_done
+            await self._update_group(playlist, save=True)
+        
+        self._schedule()
+        if entries or report['removed']:
+            log.info(f"Resuming {len(entries)} downloads with {report['kept']} partial files "
+                     f"({format_bytes(report['kept_bytes'])}), removed {report['removed']} "
+                     f"orphaned partial files ({format_bytes(report['removed_bytes'])})")
+        return {'resumed': len(entries), **report}
+    
+    async def get_video_info(self, url: str, timeout: Optional[float] = None) -> Dict[str, Any]:
         """Get video info without downloading"""
         try:
-            options = {
-                'quiet': True,
-                'no_warnings': True,
-                'skip_download': True,
-                **self.ytdl_options
+            info = await self._resolve_info(url, timeout)
+            
+            return {
+                'id': info.get('id', ''),
+                'title': info.get('title', 'Unknown'),
+                'thumbnail': info.get('thumbnail', ''),
+                'duration': info.get('duration', 0),
+                'uploader': info.get('uploader', ''),
+                'description': info.get('description', ''),
+                'view_count': info.get('view_count', 0)
             }
             
-            with YoutubeDL(options) as ydl:
-                info = ydl.extract_info(url, download=False)
-                
-                return {
-                    'id': info.get('id', ''),
-                    'title': info.get('title', 'Unknown'),
-                    'thumbnail': info.get('thumbnail', ''),
-                    'duration': info.get('duration', 0),
-                    'uploader': info.get('uploader', ''),
-                    'description': info.get('description', ''),
-                    'view_count': info.get('view_count', 0)
-                }
-                
         except Exception as e:
             log.error(f'Failed to get video info: {e}')
             raise
     
-    async def _start_download(self, download_info: DownloadInfo):
-        """Start a download"""
+    async def plan(self, url: str, quality: str = '', format: str = '',
+                   timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Dry run of the format selection for a URL: the streams a download would fetch, the
+        container they end up in and whether getting them into the selected format re-encodes
+        """
+        info = await self._resolve_info(url, timeout)
+        format_spec = get_format_string(quality, format)
+        merge_output_format = _merge_output_format(self._selector(), info, format_spec, format)
+        selected = _select_format(self._selector(), info, format_spec, merge_output_format)
+        if selected is None:
+            raise ValueError(f'No formats match {format_spec}')
+        streams = _streams(selected)
+        
+        conversion = _conversion(format, selected.get('ext', ''), streams)
+        if is_audio_format(format):
+            # The extraction copies the stream when its codec fits, re-encodes otherwise
+            reencode = not all(codec_compatible(format, None, f.get('acodec')) for f in streams)
+            output_ext = FORMATS['audio'][format]['ext']
+        else:
+            reencode = conversion == 'reencode'
+            output_ext = FORMATS['video'][format]['ext'] if conversion else selected.get('ext', '')
+        
+        return {
+            'id': info.get('id', ''),
+            'title': info.get('title', 'Unknown'),
+            'format_spec': format_spec,
+            'streams': [{
+                'format_id': f.get('format_id', ''),
+                'ext': f.get('ext', ''),
+                'vcodec': f.get('vcodec') or '',
+                'acodec': f.get('acodec') or '',
+                'height': f.get('height') or 0,
+                'tbr': f.get('tbr') or 0,
+                'filesize': int(f.get('filesize') or f.get('filesize_approx') or 0)
+            } for f in streams],
+            'container': selected.get('ext', ''),
+            'output_ext': output_ext,
+            'conversion': conversion,
+            'reencode': reencode,
+            'postprocessors': [pp['key'] for pp in get_postprocessors(format, conversion)],
+            'estimated_bytes': sum(int(f.get('filesize') or f.get('filesize_approx') or 0) for f in streams)
+        }
+    
+    async def _resolve_info(self, url: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Get full video info, from the metadata cache when possible"""
+        # Matching the URL against every extractor is slow the first time, keep it off the loop
+        key = await asyncio.get_running_loop().run_in_executor(None, cache_key, url)
+        info = await self.metadata_cache.get(key)
+        if info is not None:
+            return info
+        
+        info, _ = await self._single_flight(key, lambda: self._extract_and_cache(url, key, timeout))
+        return info
+    
+    async def _single_flight(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Concurrent callers for the same key share one run of factory; returns its result and
+        whether this caller joined a run another one started
+        """
+        future = self._inflight.get(key)
+        joined = future is not None
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._finish_inflight(key, f))
+        # Shield so one caller giving up does not cancel the run others wait on
+        return await asyncio.shield(future), joined
+    
+    async def _extract_and_cache(self, url: str, key: str, timeout: Optional[float]) -> Dict[str, Any]:
+        await self._pace(url, key)
+        info = await self._extract(url, timeout)
+        self.metadata_cache.put(info, key)
+        return info
+    
+    def _finish_inflight(self, key: str, future: asyncio.Future):
+        self._inflight.pop(key, None)
+        # Mark the error retrieved even if every waiter has gone away
+        if not future.cancelled():
+            future.exception()
+    
+    async def _extract(self, url: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Run metadata extraction in the executor so the event loop keeps serving"""
+        timeout = timeout or self.extract_timeout
+        options = {
+            'quiet': True,
+            'no_warnings': True,
+            'skip_download': True,
+            # Bound network stalls so a timed-out extraction frees its worker too
+            'socket_timeout': timeout,
+            # Playlists only need their entry list here, not every entry extracted
+            'extract_flat': 'in_playlist',
+            **self.ytdl_options
+        }
+        
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._extract_executor, _extract_info, url, options)
+        started = time.perf_counter()
+        outcome = 'error'
         try:
-            # Check concurrent download limit
-            if (self.download_mode == 'limited' and 
-                len(self.active_downloads) >= self.max_concurrent_downloads):
-                return
+            # Cancelling the wrapper also cancels the job if it has not started yet
+            info = await asyncio.wait_for(future, timeout)
+            outcome = 'ok'
+            return info
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            raise TimeoutError(f'Metadata extraction timed out after {timeout}s: {url}')
+        finally:
+            self._extract_seconds.observe(time.perf_counter() - started, outcome)
+    
+    async def _resolve_url(self, url: str, quality: Optional[str], format: Optional[str],
+                           folder: Optional[str], auto_start: bool, priority: int, strict_mode: bool,
+                           item_limit: int, policy: str) -> Tuple[str, Any]:
+        """
+        Resolve a URL that may be a playlist, adding playlists as groups: returns ('video', info),
+        ('playlist', the new playlist download) or ('duplicate', the playlist download another
+        caller added meanwhile, as the duplicate policy links to it)
+        """
+        async def probe() -> Tuple[str, Any]:
+            info, expansion = await self._probe(url, strict_mode, item_limit)
+            if expansion is None:
+                return 'video', info
+            return 'playlist', await self._add_playlist(url, info, expansion, quality, format,
+                                                        folder, auto_start, priority, policy,
+                                                        strict_mode, item_limit)
+        
+        if policy == 'force':
+            return await probe()
+        # Concurrent adds of the same URL share one extraction, and one expansion for playlists
+        key = await asyncio.get_running_loop().run_in_executor(None, cache_key, url)
+        (kind, result), joined = await self._single_flight(
+            f'probe:{key}|{quality or ""}|{format or ""}|{strict_mode}|{item_limit}', probe
+        )
+        if joined and kind == 'playlist':
+            return 'duplicate', self._check_duplicate(result, policy)
+        return kind, result
+    
+    async def _probe(self, url: str, strict_mode: bool,
+                     item_limit: int) -> Tuple[Dict[str, Any], Optional[PlaylistExpansion]]:
+        """
+        Extract a URL that may be a playlist: returns the playlist info and its running
+        expansion for playlists, the full info (cached like _resolve_info) for single videos
+        """
+        key = await asyncio.get_running_loop().run_in_executor(None, cache_key, url)
+        info = await self.metadata_cache.get(key)
+        if info is not None and info.get('_type') not in ('playlist', 'multi_video'):
+            return info, None
+        
+        await self._pace(url, key)
+        expansion = PlaylistExpansion(url, self._expansion_options(strict_mode, item_limit))
+        expansion.start(self._expand_executor)
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            kind, info = await asyncio.wait_for(expansion.head(), self.extract_timeout)
+            outcome = 'ok'
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+            expansion.cancel()
+            raise TimeoutError(f'Metadata extraction timed out after {self.extract_timeout}s: {url}')
+        except BaseException:
+            expansion.cancel()
+            raise
+        finally:
+            self._extract_seconds.observe(time.perf_counter() - started, outcome)
+        
+        if kind == 'playlist':
+            return info, expansion
+        self.metadata_cache.put(info, key)
+        return info, None
+    
+    def _expansion_options(self, strict_mode: bool, item_limit: int) -> Dict[str, Any]:
+        options = {
+            'quiet': True,
+            'no_warnings': True,
+            'skip_download': True,
+            'socket_timeout': self.extract_timeout,
+            **self.ytdl_options,
+            # Strict mode takes a video URL with a playlist attached as just the video
+            'noplaylist': strict_mode
+        }
+        if item_limit > 0:
+            options['playlistend'] = item_limit
+        return options
+    
+    async def _add_playlist(self, url: str, playlist_info: Dict[str, Any], expansion: PlaylistExpansion,
+                            quality: Optional[str], format: Optional[str], folder: Optional[str],
+                            auto_start: bool, priority: int, policy: str = 'force',
+                            strict_mode: bool = False, item_limit: int = 0) -> DownloadInfo:
+        """Add a playlist download; its entries are added as they arrive from the expansion"""
+        download_info = self._new_download(url, playlist_info, quality, format, folder,
+                                           auto_start, priority)
+        # A playlist download is its own group
+        download_info.group_id = download_info.id
+        download_info.title = playlist_info.get('title') or playlist_info.get('id') or url
+        download_info.expanding = True
+        download_info.playlist_strict_mode = strict_mode
+        download_info.playlist_item_limit = item_limit
+        if auto_start:
+            download_info.status = 'preparing'
+        
+        bucket = 'queue' if auto_start else 'pending'
+        self.downloads.add(download_info, bucket, self._index_keys(download_info))
+        self._save_state(bucket, download_info)
+        
+        task = asyncio.ensure_future(self._expand_playlist(download_info, expansion, policy))
+        self._expansions[download_info.id] = (expansion, task)
+        return download_info
+    
+    def _resume_expansion(self, playlist: DownloadInfo):
+        """Expand a playlist again after a restart, adding only the entries it does not have yet"""
+        known = frozenset(d.playlist_index for d in self.downloads.find(f'group:{playlist.id}'))
+        expansion = PlaylistExpansion(playlist.url, self._expansion_options(playlist.playlist_strict_mode,
+                                                                            playlist.playlist_item_limit))
+        
+        async def expand():
+            try:
+                await self._pace(playlist.url, playlist.video_key)
+                expansion.start(self._expand_executor)
+                kind, _ = await asyncio.wait_for(expansion.head(), self.extract_timeout)
+            except Exception as e:
+                expansion.cancel()
+                log.error(f'Failed to expand playlist {playlist.url}: {e}')
+                playlist.error = str(e)
+                kind = 'error'
+            if kind == 'playlist':
+                await self._expand_playlist(playlist, expansion, self.duplicate_policy, known)
+            else:
+                self._expansions.pop(playlist.id, None)
+                playlist.expanding = False
+                await self._update_group(playlist, save=True)
+        
+        self._expansions[playlist.id] = (expansion, asyncio.ensure_future(expand()))
+    
+    async def _expand_playlist(self, playlist: DownloadInfo, expansion: PlaylistExpansion,
+                               policy: str = 'force', known: frozenset = frozenset()):
+        """
+        Add playlist entries batch by batch while the expansion loads later pages; entries
+        already queued or downloaded elsewhere are skipped unless the policy is force, entries
+        at known playlist indexes always
+        """
+        try:
+            async for entries in expansion.batches():
+                if playlist.id not in self.downloads:
+                    break
+                # Starting a pending playlist sends the rest of its entries to the queue too
+                bucket = 'queue' if playlist.auto_start else 'pending'
+                children = []
+                for index, entry in entries:
+                    url = entry_url(entry)
+                    if not url or index in known:
+                        continue
+                    child = DownloadInfo(
+                        url=url,
+                        title=entry.get('title') or url,
+                        quality=playlist.quality,
+                        format=playlist.format,
+                        folder=playlist.folder,
+                        auto_start=playlist.auto_start,
+                        priority=playlist.priority,
+                        video_key=info_key(entry) or '',
+                        group_id=playlist.id,
+                        playlist_title=playlist.title,
+                        playlist_index=index
+                    )
+                    if policy != 'force' and self.find_duplicate(child) is not None:
+                        continue
+                    self.downloads.add(child, bucket, self._index_keys(child))
+                    children.append(child)
+                if not children:
+                    continue
+                
+                playlist.entries_total += len(children)
+                self._save_state(bucket, *children)
+                if playlist.auto_start:
+                    for child in children:
+                        self._enqueue(child)
+                    self._schedule()
+                if self.notifier:
+                    await self.notifier.notify_added_batch(children)
+                await self._update_group(playlist, save=True)
+        except Exception as e:
+            log.error(f'Failed to expand playlist {playlist.url}: {e}')
+            playlist.error = str(e)
+        finally:
+            self._expansions.pop(playlist.id, None)
+        playlist.expanding = False
+        await self._update_group(playlist, save=True)
+    
+    async def _update_group(self, playlist: DownloadInfo, save: bool = False):
+        """Aggregate a playlist download from its entries, completing it once all have ended"""
+        bucket = self.downloads.bucket_of(playlist.id)
+        if bucket is None or bucket == 'done':
+            return
+        
+        ended = playlist.entries_done + playlist.entries_failed
+        if playlist.id not in self._expansions and ended >= playlist.entries_total:
+            if not playlist.entries_total:
+                playlist.error = playlist.error or 'Playlist has no entries'
+            elif playlist.entries_failed:
+                playlist.error = f'{playlist.entries_failed} of {playlist.entries_total} entries failed'
+            playlist.status = 'finished' if playlist.entries_done else 'error'
+            playlist.progress = 1.0 if playlist.entries_done else 0.0
+            playlist.completed_at = time.time()
+            self.downloads.move(playlist.id, 'done')
+            self._save_state('done', playlist)
+            if self.notifier:
+                await self.notifier.notify_completed(playlist)
+            return
+        
+        active = [d.info for d in self.active_downloads.values() if d.info.group_id == playlist.id]
+        if playlist.entries_total:
+            playlist.progress = min((ended + sum(d.progress for d in active)) / playlist.entries_total, 1.0)
+        if active:
+            playlist.status = 'downloading'
+        self.downloads.touch(playlist.id)
+        if save:
+            self._save_state(bucket, playlist)
+        if self.notifier:
+            await self.notifier.notify_updated(playlist)
+    
+    async def _start_download(self, download_info: DownloadInfo, info_dict: Optional[Dict[str, Any]] = None):
+        """Put a download in the waiting line and start it as soon as a slot is free"""
+        self._enqueue(download_info)
+        self._schedule({download_info.id: info_dict} if info_dict else None)
+    
+    def _enqueue(self, download_info: DownloadInfo):
+        """Put a download in the waiting line without admitting anything yet"""
+        download_info.queued_at = time.time()
+        download_info.started_at = 0
+        self._waiting[download_info.id] = download_info
+        line = self._waiting_lines.setdefault(site_of(download_info.url, download_info.video_key), [])
+        heapq.heappush(line, (-download_info.priority, next(self._waiting_seq), download_info.id))
+    
+    def _has_capacity(self) -> bool:
+        if self.pool.idle == 0:
+            return False
+        return (self.download_mode != 'limited' or
+                len(self.active_downloads) < self.max_concurrent_downloads)
+    
+    def _schedule(self, info_dicts: Optional[Dict[str, Dict[str, Any]]] = None):
+        """Start waiting downloads, highest priority first, while slots are free and their sites allow"""
+        while self._has_capacity():
+            best = None
+            retry_in = 0.0
+            for site, line in list(self._waiting_lines.items()):
+                # Entries of deleted or already started downloads are skipped lazily
+                while line and line[0][2] not in self._waiting:
+                    heapq.heappop(line)
+                if not line:
+                    del self._waiting_lines[site]
+                    continue
+                if not self.governor.can_start(site):
+                    # Sites at their concurrency cap are retried when a download ends,
+                    # sites out of request tokens once they have one again
+                    wait = self.governor.rate_limited_for(site)
+                    if wait and (not retry_in or wait < retry_in):
+                        retry_in = wait
+                    continue
+                if best is None or line[0] < best[1][0]:
+                    best = (site, line)
             
-            download = Download(download_info, self.download_dir, self.ytdl_options)
+            if best is None:
+                if retry_in:
+                    self._schedule_later(retry_in)
+                return
+            _, _, download_id = heapq.heappop(best[1])
+            download_info = self._waiting.pop(download_id)
+            self._launch(download_info, (info_dicts or {}).get(download_id), best[0])
+    
+    def _schedule_later(self, delay: float):
+        """Run the scheduler again once a rate-limited site has a token"""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        when = now + delay
+        timer = self._schedule_timer
+        if timer is not None and not timer.cancelled() and timer.when() > now:
+            # Already due to run, keep whichever run comes first
+            if timer.when() <= when:
+                return
+            timer.cancel()
+        self._schedule_timer = loop.call_at(when, self._schedule)
+    
+    def _rebalance(self, reset: bool = True):
+        """
+        Split the bandwidth budget over active downloads and hand each worker its share;
+        reset splits equally, otherwise shares follow the speeds seen under the last split
+        """
+        self._rebalanced_at = time.monotonic()
+        # The connection budget is shared too, by capping fragment concurrency
+        if self.fragments is not None:
+            for download in self.active_downloads.values():
+                self._set_fragment_concurrency(download)
+        
+        shares = self.bandwidth.shares({
+            download_id: (download.speed, 0.0 if reset else download.rate_limit)
+            for download_id, download in self.active_downloads.items()
+        })
+        for download_id, share in shares.items():
+            download = self.active_downloads[download_id]
+            download.rate_limit = share
+            # yt-dlp applies the limit to each parallel fragment fetch on its own
+            if download.fragmented and download.fragment_concurrency > 1:
+                share /= download.fragment_concurrency
+            self.progress_table.set_rate_limit(download.slot, share)
+    
+    def _set_fragment_concurrency(self, download: Download):
+        """Hand a worker the fragment concurrency for its next format"""
+        concurrency = self.fragments.current(download.site, len(self.active_downloads))
+        if concurrency != download.fragment_concurrency:
+            download.fragment_concurrency = concurrency
+            self.progress_table.set_fragment_concurrency(download.slot, concurrency)
+    
+    def _track_fragments(self, download: Download, record: Dict[str, Any]):
+        """Measure each fragmented format a download fetches at the concurrency it started with"""
+        if record['filename'] != download.fragment_file:
+            self._observe_fragments(download)
+            download.fragment_file = record['filename']
+            download.fragment_used = download.fragment_concurrency
+            download.fragment_first = (record['updated_at'], record['downloaded_bytes'])
+        download.fragment_last = (record['updated_at'], record['downloaded_bytes'])
+    
+    def _observe_fragments(self, download: Download):
+        """Feed the throughput of the format that just ended to the tuner"""
+        (first_at, first_bytes), (last_at, last_bytes) = download.fragment_first, download.fragment_last
+        if not download.fragment_file or not download.fragment_used or last_at - first_at < 1.0:
+            return
+        throughput = (last_bytes - first_bytes) / (last_at - first_at)
+        before = self.fragments.current(download.site, len(self.active_downloads))
+        self.fragments.observe(download.site, download.fragment_used, throughput)
+        after = self.fragments.current(download.site, len(self.active_downloads))
+        if after != before:
+            log.info(f'Fragment concurrency for {download.site or "unknown site"}: {before} -> {after} '
+                     f'({download.fragment_used} fetched {format_bytes(throughput)}/s)')
+        download.fragment_file = ''
+    
+    def _adjust_concurrency(self):
+        """Let the controller pick the slot count from the throughput since its last decision"""
+        self._concurrency_at = time.monotonic()
+        decision = self.concurrency.decide(len(self.active_downloads), len(self._waiting))
+        if decision['slots'] != decision['slots_before']:
+            log.info(f"Download slots {decision['slots_before']} -> {decision['slots']}: {decision['reason']}")
+        else:
+            log.debug(f"Download slots stay at {decision['slots']}: {decision['reason']}")
+        self.max_concurrent_downloads = decision['slots']
+        # Fewer slots only stop new starts, running downloads finish
+        self._schedule()
+    
+    def get_concurrency(self) -> Dict[str, Any]:
+        """Slot limit and, in adaptive mode, the controller's recent decisions with their reasons"""
+        if self.concurrency is None:
+            return {
+                'mode': 'fixed' if self.download_mode == 'limited' else 'unlimited',
+                'limit': self.max_concurrent_downloads,
+                'active': len(self.active_downloads),
+                'waiting': len(self._waiting)
+            }
+        return {
+            'mode': 'adaptive',
+            'active': len(self.active_downloads),
+            'waiting': len(self._waiting),
+            **self.concurrency.stats()
+        }
+    
+    def _register_metrics(self):
+        metrics = self.metrics
+        self._extract_seconds = metrics.histogram(
+            'grabtube_extraction_seconds', 'Metadata extraction latency by outcome', labels=('outcome',))
+        self._wait_seconds = metrics.histogram(
+            'grabtube_queue_wait_seconds', 'Time downloads waited for a slot', DURATION_BUCKETS)
+        self._duration_seconds = metrics.histogram(
+            'grabtube_download_duration_seconds', 'Duration of finished downloads', DURATION_BUCKETS)
+        self._download_rate = metrics.histogram(
+            'grabtube_download_bytes_per_second', 'Average rate of finished downloads', RATE_BUCKETS)
+        self._flush_seconds = metrics.histogram(
+            'grabtube_persist_flush_seconds', 'Time to write pending queue state changes')
+        
+        metrics.gauge('grabtube_downloads', 'Downloads by list and status', self._status_counts,
+                      labels=('bucket', 'status'))
+        metrics.gauge('grabtube_active_downloads', 'Downloads holding a worker slot',
+                      lambda: len(self.active_downloads))
+        metrics.gauge('grabtube_waiting_downloads', 'Queued downloads waiting for a slot',
+                      lambda: len(self._waiting))
+        metrics.gauge('grabtube_download_slots', 'Concurrent download limit',
+                      lambda: self.max_concurrent_downloads)
+        metrics.gauge('grabtube_download_workers', 'Running download worker processes',
+                      lambda: self.pool.workers)
+        metrics.gauge('grabtube_postprocess_jobs', 'Post-processing jobs by state',
+                      lambda: {('running',): self.postprocess_pool.active,
+                               ('waiting',): self.postprocess_pool.waiting}, labels=('state',))
+        metrics.gauge('grabtube_metadata_cache_lookups_total', 'Metadata cache lookups by result',
+                      lambda: {('hit',): self.metadata_cache.hits, ('disk_hit',): self.metadata_cache.disk_hits,
+                               ('miss',): self.metadata_cache.misses},
+                      labels=('result',), kind='counter')
+        metrics.gauge('grabtube_audio_bytes_saved_total', 'Bytes audio-only downloads did not fetch',
+                      lambda: self.audio_bytes_saved, kind='counter')
+    
+    def _status_counts(self) -> Dict[Tuple[str, str], int]:
+        counts: Dict[Tuple[str, str], int] = {}
+        for bucket in DownloadIndex.BUCKETS:
+            for download_info in self.downloads.view(bucket):
+                key = (bucket, download_info.status)
+                counts[key] = counts.get(key, 0) + 1
+        return counts
+    
+    def get_bandwidth(self) -> Dict[str, Any]:
+        """Bandwidth budget and the current share of each active download"""
+        return {
+            'limit': self.bandwidth.limit,
+            'schedule': self.bandwidth.schedule,
+            'current_limit': self.bandwidth.current_limit(),
+            'shares': {download_id: download.rate_limit
+                       for download_id, download in self.active_downloads.items()}
+        }
+    
+    def set_bandwidth(self, limit: Optional[float] = None,
+                      schedule: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Change the bandwidth budget at runtime; active downloads are rebalanced right away"""
+        self.bandwidth.configure(limit, schedule)
+        self._rebalance()
+        return self.get_bandwidth()
+    
+    async def _pace(self, url: str, key: str):
+        """Wait for the site's request budget before a metadata call"""
+        delay = self.governor.reserve_request(site_of(url, key))
+        if delay:
+            await asyncio.sleep(delay)
+    
+    def _launch(self, download_info: DownloadInfo, info_dict: Optional[Dict[str, Any]] = None,
+                site: str = ''):
+        """Hand an admitted download to a pool worker"""
+        try:
+            if info_dict is None:
+                # Memory tier only; without it the worker extracts again
+                info_dict = self.metadata_cache.peek(cache_key(download_info.url))
+            download = Download(download_info, self.download_dir, self.ytdl_options,
+                                info_dict, self.info_max_age, self.output_template,
+                                self.output_template_playlist, self.temp_dir,
+                                self.playlist_item_limit)
+            download.slot = self.pool.submit(download.job())
+            if download.slot is None:
+                raise RuntimeError('No idle download worker')
+            download.site = site
+            self.governor.started(site)
             self.active_downloads[download_info.id] = download
-            download.start()
+            self._rebalance()
+            download_info.status = 'preparing'
+            download_info.started_at = time.time()
+            self.downloads.touch(download_info.id)
+            if download_info.queued_at:
+                self._wait_seconds.observe(download_info.wait_time)
             
+            if self._progress_task is None or self._progress_task.done():
+                self._progress_task = asyncio.ensure_future(self._poll_progress())
+            if self._watch_task is None or self._watch_task.done():
+                self._watch_task = asyncio.ensure_future(self._watch_workers())
+            else:
+                self._wake_writer.send(None)
+                
         except Exception as e:
             log.error(f'Failed to start download: {e}')
             download_info.status = 'error'
             download_info.error = str(e)
+            self.downloads.touch(download_info.id)
+            if download_info.id not in self.active_downloads:
+                # Never handed to a worker, so it ends here like any failed download
+                asyncio.ensure_future(self._complete(download_info))
     
-    def _save_state(self):
-        """Save queue state"""
-        state = {
-            'queue': [d.to_dict() for d in self.queue],
-            'done': [d.to_dict() for d in self.done],
-            'pending': [d.to_dict() for d in self.pending]
-        }
-        self.persistent_queue.save(state)
+    async def _watch_workers(self):
+        """Reap finished jobs and dead workers, then admit the next waiting downloads"""
+        loop = asyncio.get_running_loop()
+        while self.active_downloads:
+            handles = self.pool.handles()
+            ready = await loop.run_in_executor(
+                None, multiprocessing.connection.wait, [*handles, self._wake_reader]
+            )
+            for handle in ready:
+                if handle is self._wake_reader:
+                    # New jobs were submitted, collect their handles
+                    while self._wake_reader.poll():
+                        self._wake_reader.recv()
+                    continue
+                slot = self.pool.reap(*handles[handle])
+                download = next((d for d in self.active_downloads.values() if d.slot == slot), None)
+                # Cancelled downloads are already gone from active_downloads
+                if slot is not None and download is not None:
+                    await self._finish_download(download)
+            self._schedule()
+    
+    async def _poll_progress(self):
+        """Copy worker progress into the live DownloadInfo objects until no download is active"""
+        while self.active_downloads:
+            playlists = {}
+            for download in list(self.active_downloads.values()):
+                record = self.progress_table.read(download.slot)
+                if record is None or record['state'] != DOWNLOADING:
+                    continue
+                
+                if record['updated_at'] > download.last_update:
+                    download.last_update = record['updated_at']
+                    download.speed = record['speed']
+                    if record['fragment_count']:
+                        download.fragmented = True
+                        if self.fragments is not None:
+                            self._track_fragments(download, record)
+                    named = bool(download.info.filename)
+                    self._apply_progress(download.info, record)
+                    self.downloads.touch(download.info.id)
+                    if not named and download.info.filename:
+                        # Saved right away so the partial file can be matched after a crash
+                        self._save_state('queue', download.info)
+                    if self.notifier:
+                        await self.notifier.notify_updated(download.info)
+                    playlist = self._playlist_of(download.info)
+                    if playlist is not None:
+                        playlists[playlist.id] = playlist
+            
+            # One aggregate update per playlist and tick, however many entries moved
+            for playlist in playlists.values():
+                await self._update_group(playlist)
+            
+            # Follow changing speeds and time-of-day budgets
+            if time.monotonic() - self._rebalanced_at >= self.bandwidth_rebalance_interval:
+                self._rebalance(reset=False)
+            
+            if self.concurrency is not None:
+                self.concurrency.sample(sum(d.speed for d in self.active_downloads.values()))
+                if time.monotonic() - self._concurrency_at >= self.concurrency_interval:
+                    self._adjust_concurrency()
+            
+            await asyncio.sleep(self.progress_interval)
+    
+    def _apply_progress(self, download_info: DownloadInfo, record: Dict[str, Any]):
+        """Update a download from a progress table record"""
+        if record['filename']:
+            # Files still in the temp directory have the same relative name they will get
+            base = self.download_dir
+            if (self.temp_dir != self.download_dir and
+                    os.path.abspath(record['filename']).startswith(os.path.join(os.path.abspath(self.temp_dir), ''))):
+                base = self.temp_dir
+            download_info.filename = os.path.relpath(record['filename'], base)
+        if record['state'] == IDLE:
+            return
+        
+        # Terminal records carry the final byte counts, which the last poll may have missed
+        if record['state'] == DOWNLOADING or record['downloaded_bytes']:
+            download_info.downloaded_bytes = int(record['downloaded_bytes'])
+        if record['total_bytes']:
+            download_info.filesize = int(record['total_bytes'])
+            download_info.progress = min(record['downloaded_bytes'] / record['total_bytes'], 1.0)
+        if record['state'] != DOWNLOADING:
+            return
+        
+        download_info.status = 'downloading'
+        download_info.speed = f"{format_bytes(record['speed'])}/s" if record['speed'] else ''
+        download_info.eta = formatSeconds(int(record['eta'])) if record['eta'] else ''
+    
+    async def _finish_download(self, download: Download):
+        """
+        Release the slot of a download whose job has ended; it moves to done, or waits in the
+        queue as downloaded when its format still needs post-processing
+        """
+        download_info = download.info
+        self.active_downloads.pop(download_info.id, None)
+        self.governor.finished(download.site)
+        self._rebalance()
+        # The job is over; a torn record means its worker was killed mid-update
+        record = self.progress_table.read(download.slot) or {'state': IDLE, 'filename': '', 'error': ''}
+        self.pool.release(download.slot)
+        if self.fragments is not None and record['state'] == FINISHED:
+            self._observe_fragments(download)
+        
+        self._apply_progress(download_info, record)
+        if record['state'] == FINISHED:
+            download_info.status = 'finished'
+            download_info.progress = 1.0
+            duration = time.time() - download_info.started_at if download_info.started_at else 0.0
+            if duration > 0:
+                self._duration_seconds.observe(duration)
+                # Downloads faster than the poll interval only report bytes in the final record
+                fetched = record.get('downloaded_bytes') or download_info.downloaded_bytes or download_info.filesize
+                if fetched:
+                    self._download_rate.observe(fetched / duration)
+            if is_audio_format(download_info.format):
+                self._count_audio_savings(download)
+            elif is_video_format(download_info.format):
+                download_info.conversion = self._finished_conversion(download)
+        else:
+            download_info.status = 'error'
+            download_info.error = record['error'] or 'Download process exited unexpectedly'
+            if self.concurrency is not None:
+                self.concurrency.failed()
+        download_info.speed = ''
+        download_info.eta = ''
+        
+        if download_info.id not in self.downloads:
+            return
+        postprocessors = get_postprocessors(download_info.format, download_info.conversion)
+        if download_info.status == 'finished' and postprocessors and download_info.filename:
+            download_info.status = 'downloaded'
+            download_info.postprocess_progress = 0.0
+            self.downloads.touch(download_info.id)
+            self._save_state('queue', download_info)
+            self._postprocessing[download_info.id] = asyncio.ensure_future(
+                self._postprocess(download_info, postprocessors)
+            )
+            if self.notifier:
+                await self.notifier.notify_updated(download_info)
+            return
+        await self._complete(download_info)
+    
+    def _count_audio_savings(self, download: Download):
+        """Compare an audio-only download with what the default video selection would have fetched"""
+        download_info = download.info
+        # Bytes of the final progress record; without them there is nothing to compare
+        fetched = download_info.downloaded_bytes
+        if not download.info_dict or not fetched:
+            return
+        video_bytes = _selected_bytes(self._selector(), download.info_dict, get_format_string())
+        if video_bytes > fetched:
+            download_info.bytes_saved = video_bytes - fetched
+            self.audio_bytes_saved += download_info.bytes_saved
+            log.info(f'Audio-only download of {download_info.title} fetched {format_bytes(fetched)}, '
+                     f'saving {format_bytes(download_info.bytes_saved)}')
+    
+    def _finished_conversion(self, download: Download) -> str:
+        """Conversion a finished video download needs, judged by the streams it was selected from"""
+        download_info = download.info
+        ext = os.path.splitext(download_info.filename)[1].lstrip('.')
+        streams = []
+        if download.info_dict:
+            streams = _streams(_select_format(
+                self._selector(), download.info_dict,
+                get_format_string(download_info.quality, download_info.format),
+                get_merge_output_format(download_info.format)
+            ))
+        conversion = _conversion(download_info.format, ext, streams)
+        if conversion:
+            log.info(f'{download_info.title} was merged into {ext}, {conversion} to {download_info.format}')
+        return conversion
+    
+    def _selector(self) -> YoutubeDL:
+        """YoutubeDL used only to run format selectors on extracted info"""
+        if self._selector_ydl is None:
+            self._selector_ydl = YoutubeDL({'quiet': True, 'logger': logging.getLogger('yt-dlp')})
+        return self._selector_ydl
+    
+    async def _postprocess(self, download_info: DownloadInfo, postprocessors: List[Dict[str, Any]]):
+        """Convert a downloaded file on the post-processing pool, then complete the download"""
+        loop = asyncio.get_running_loop()
+        steps = {'done': 0}
+        
+        def hook(d: Dict[str, Any]):
+            # Called on the pool thread
+            if d['status'] == 'finished':
+                steps['done'] += 1
+            loop.call_soon_threadsafe(self._postprocess_step, download_info,
+                                      steps['done'] / len(postprocessors))
+        
+        try:
+            filepath = await self.postprocess_pool.run(
+                download_info.priority, run_postprocessors,
+                os.path.join(self.download_dir, download_info.filename), postprocessors, hook
+            )
+            download_info.filename = os.path.relpath(filepath, self.download_dir)
+            download_info.postprocess_progress = 1.0
+            download_info.status = 'finished'
+        except asyncio.CancelledError:
+            # Deleted while waiting or converting
+            return
+        except Exception as e:
+            log.error(f'Post-processing failed for {download_info.title}: {e}')
+            download_info.status = 'error'
+            download_info.error = f'Post-processing failed: {e}'
+        finally:
+            self._postprocessing.pop(download_info.id, None)
+        await self._complete(download_info)
+    
+    def _postprocess_step(self, download_info: DownloadInfo, progress: float):
+        if download_info.id not in self._postprocessing:
+            return
+        download_info.status = 'processing'
+        download_info.postprocess_progress = progress
+        self.downloads.touch(download_info.id)
+        if self.notifier:
+            asyncio.ensure_future(self.notifier.notify_updated(download_info))
+    
+    async def _complete(self, download_info: DownloadInfo):
+        """Move a download that has ended from the queue to done"""
+        download_info.completed_at = time.time()
+        if download_info.id not in self.downloads:
+            return
+        self.downloads.move(download_info.id, 'done')
+        self._save_state('done', download_info)
+        
+        if self.notifier:
+            await self.notifier.notify_completed(download_info)
+        
+        playlist = self._playlist_of(download_info)
+        if playlist is not None:
+            if download_info.status == 'finished':
+                playlist.entries_done += 1
+            else:
+                playlist.entries_failed += 1
+            await self._update_group(playlist, save=True)
+    
+    def _playlist_of(self, download_info: DownloadInfo) -> Optional[DownloadInfo]:
+        """The playlist download an entry belongs to, if it is still there"""
+        if not download_info.group_id or download_info.group_id == download_info.id:
+            return None
+        return self.downloads.get(download_info.group_id)
+    
+    @staticmethod
+    def _new_download(url: str, video_info: Dict[str, Any], quality: Optional[str],
+                      format: Optional[str], folder: Optional[str], auto_start: bool,
+                      priority: int) -> DownloadInfo:
+        return DownloadInfo(
+            url=url,
+            title=video_info.get('title', 'Unknown'),
+            quality=quality,
+            format=format,
+            folder=folder,
+            auto_start=auto_start,
+            priority=priority,
+            video_key=info_key(video_info) or ''
+        )
+    
+    @staticmethod
+    def _dedup_key(download_info: DownloadInfo) -> str:
+        """Duplicate index key: extractor and video id (the URL if unknown), quality and format"""
+        if download_info.group_id and download_info.group_id == download_info.id:
+            # Playlists themselves are never duplicates, their entries can be
+            return ''
+        media = download_info.video_key or canonicalize_url(download_info.url)
+        return f'dup:{media}|{download_info.quality or ""}|{download_info.format or ""}'
+    
+    @staticmethod
+    def _index_keys(download_info: DownloadInfo) -> List[str]:
+        # Rebuilt from the saved fields on load, so the duplicate index persists with the queue
+        keys = [canonicalize_url(download_info.url), download_info.video_key,
+                DownloadQueue._dedup_key(download_info)]
+        if download_info.group_id and download_info.group_id != download_info.id:
+            keys.append(f'group:{download_info.group_id}')
+        return keys
+    
+    def _save_state(self, bucket: str, *downloads: DownloadInfo):
+        """Save the given downloads, now in bucket, to the queue state"""
+        if downloads:
+            self.persistent_queue.upsert(bucket, [d.to_dict() for d in downloads])
     
     async def close(self):
         """Close the queue and stop all downloads"""
-        for download in self.active_downloads.values():
-            download.stop()
+        for task in (self._progress_task, self._watch_task):
+            if task:
+                task.cancel()
+        if self._schedule_timer is not None:
+            self._schedule_timer.cancel()
+        self.pool.close()
         self.active_downloads.clear()
+        self._waiting.clear()
+        # Release the executor thread blocked on worker sentinels
+        self._wake_writer.send(None)
+        for future in list(self._inflight.values()):
+            future.cancel()
+        for expansion, task in list(self._expansions.values()):
+            expansion.cancel()
+            task.cancel()
+        for task in list(self._postprocessing.values()):
+            task.cancel()
+        self.postprocess_pool.shutdown()
+        self._extract_executor.shutdown(wait=False)
+        self._expand_executor.shutdown(wait=False)
+        self.metadata_cache.close()
+        self.persistent_queue.close()
 
 class DownloadQueueNotifier:
     """Notifier for download queue events"""
@@ -328,23 +2130,34 @@ class DownloadQueueNotifier:
     def __init__(self, queue: DownloadQueue, sio):
         self.queue = queue
         self.sio = sio
+        self.emits = queue.metrics.counter('grabtube_socketio_emits_total',
+                                           'Socket.IO events emitted', labels=('event',))
+    
+    async def emit(self, event: str, data: Any, **kwargs):
+        """Emit a Socket.IO event, counting it per event name"""
+        self.emits.inc(event)
+        await self.sio.emit(event, data, **kwargs)
     
     async def notify_added(self, download_info: DownloadInfo):
         """Notify when download is added"""
-        await self.sio.emit('added', download_info.to_dict())
+        await self.emit('added', RawJSON(download_info.to_json()))
+    
+    async def notify_added_batch(self, download_infos: Sequence[DownloadInfo]):
+        """Notify once for downloads added together"""
+        await self.emit('added_batch', [RawJSON(d.to_json()) for d in download_infos])
     
     async def notify_updated(self, download_info: DownloadInfo):
         """Notify when download is updated"""
-        await self.sio.emit('updated', download_info.to_dict())
+        await self.emit('updated', RawJSON(download_info.to_json()))
     
     async def notify_completed(self, download_info: DownloadInfo):
         """Notify when download is completed"""
-        await self.sio.emit('completed', download_info.to_dict())
+        await self.emit('completed', RawJSON(download_info.to_json()))
     
     async def notify_canceled(self, download_id: str):
         """Notify when download is canceled"""
-        await self.sio.emit('canceled', download_id)
+        await self.emit('canceled', download_id)
     
     async def notify_cleared(self):
         """Notify when queue is cleared"""
-        await self.sio.emit('cleared', {})
\ No newline at end of file
+        await self.emit('cleared', {})
\ No newline at end of file
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the embedded server's JSON encoding
+
+Encodes a /downloads payload with the standard library and with the server's
+serialization layer (orjson when installed), both as fresh dicts and from the
+cached per-item bytes the list endpoints use.
+
+Usage (from Flutter-Client/):
+    python tools/bench_json_encoding.py [--items 10000] [--rounds 20]
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from python import serialization
+from python.ytdl import DownloadInfo
+
+
+def build_downloads(count: int):
+    """Downloads spread over the three buckets like a long-running instance"""
+    buckets = {'queue': [], 'done': [], 'pending': []}
+    for i in range(count):
+        bucket = 'done' if i % 10 < 8 else ('queue' if i % 10 == 8 else 'pending')
+        buckets[bucket].append(DownloadInfo(
+            url=f'https://www.youtube.com/watch?v=video{i:07d}',
+            title=f'Video number {i} – with some unicode ✓',
+            status='finished' if bucket == 'done' else 'pending',
+            progress=1.0 if bucket == 'done' else 0.0,
+            filename=f'Video number {i}.mp4',
+            filesize=123456789 + i,
+            downloaded_bytes=123456789 + i if bucket == 'done' else 0,
+            quality='best',
+            format='any',
+            created_at=1700000000.0 + i,
+            completed_at=1700000100.0 + i if bucket == 'done' else 0
+        ))
+    return buckets
+
+
+def bench(name: str, fn, rounds: int):
+    fn()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        size = len(fn())
+    elapsed = (time.perf_counter() - start) / rounds
+    print(f'  {name:<34} {elapsed * 1000:8.2f} ms   {size / 2 ** 20:6.2f} MiB')
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    buckets = build_downloads(args.items)
+
+    def payload():
+        return {bucket: [d.to_dict() for d in items] for bucket, items in buckets.items()}
+
+    def cached():
+        return b'{' + b','.join(
+            b'"%s":[%s]' % (bucket.encode(), b','.join(d.to_json() for d in items))
+            for bucket, items in buckets.items()
+        ) + b'}'
+
+    print(f'/downloads payload with {args.items} items, {args.rounds} rounds '
+          f'(serialization backend: {serialization.BACKEND})')
+    baseline = bench('stdlib json.dumps', lambda: json.dumps(payload()).encode(), args.rounds)
+    fast = bench('serialization.dumps_bytes', lambda: serialization.dumps_bytes(payload()), args.rounds)
+    joined = bench('cached item bytes', cached, args.rounds)
+    print(f'  speedup: {baseline / fast:.1f}x encoder, {baseline / joined:.1f}x with cached items')
+
+
+if __name__ == '__main__':
+    main()